@@ -2,14 +2,31 @@ import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import filedialog, messagebox
 
+import argparse
+import logging
+import os
 import webbrowser
 
-import cv2
-import numpy as np
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from mpl_toolkits import mplot3d
-from matplotlib import cm
+import ICCTStartup
+import ICCTTasks
+import ICCTTrace
+
+# Imported on first use, or by the startup task once the window is up (see ICCTStartup). The visualizer is only
+# imported when Visualize is clicked
+np = ICCTStartup.lazyImport('numpy')
+mplFigure = ICCTStartup.lazyImport('matplotlib.figure')
+mplBackend = ICCTStartup.lazyImport('matplotlib.backends.backend_tkagg')
+ICCTColour = ICCTStartup.lazyImport('ICCTColour')
+ICCTEngine = ICCTStartup.lazyImport('ICCTEngine')
+ICCTHistory = ICCTStartup.lazyImport('ICCTHistory')
+ICCTPalette = ICCTStartup.lazyImport('ICCTPalette')
+ICCTRender = ICCTStartup.lazyImport('ICCTRender')
+ICCTSession = ICCTStartup.lazyImport('ICCTSession')
+ICCTStats = ICCTStartup.lazyImport('ICCTStats')
+ICCTVisualizer = ICCTStartup.lazyImport('ICCTVisualizer')
+
+# Errors are reported in message boxes, their tracebacks only go to the log (silent unless logging is configured)
+log = logging.getLogger('ICCT')
 
 appLinkURL = 'https://www.github.com/SagarDevAchar/'
 applicationOperations = {' Adjust': [(-100, 100, "Brightness"), (-100, 100, "Contrast"), None],
@@ -18,51 +35,52 @@ applicationOperations = {' Adjust': [(-100, 100, "Brightness"), (-100, 100, "Con
                          ' Greyscale': [None, None, None],
                          ' Inverse': [(0, 255, "Amount"), None, None],
                          ' Ceiling': [(0, 255, "Red"), (0, 255, "Green"), (0, 255, "Blue")],
-                         ' Floor': [(0, 255, "Red"), (0, 255, "Green"), (0, 255, "Blue")]}
+                         ' Floor': [(0, 255, "Red"), (0, 255, "Green"), (0, 255, "Blue")],
+                         ' Hue': [(-180, 180, "Rotation"), None, None],
+                         ' Saturation': [(-100, 100, "Amount"), None, None],
+                         ' Lightness': [(0, 100, "Floor"), (0, 100, "Headroom"), None]}
 
+previewProxySize = (800, 650)
+inlineStatisticsPixels = previewProxySize[0] * previewProxySize[1]
+liveDebounceMS = 150
+maxColourTolerance = 442
+timingsRefreshMS = 500
 
-def colourFmtConv(BGRA, toFmt):
-    convFmt = np.array([None])
+statisticsColumns = (('Min', 110), ('Max', 165), ('Mean', 230), ('Clipped Low', 390), ('Clipped High', 550))
+saveFormats = {'PNG': '.png', 'JPG': '.jpg'}
+saveScales = (1, 0.5, 0.25)
 
-    if toFmt.upper() == 'HEX':
-        convFmt[0] = "#%02x%02x%02x%02x" % (BGRA[2], BGRA[1], BGRA[0], BGRA[3])
-    elif toFmt.upper() == 'HSL':
-        RGB_norm = BGRA[:3][::-1] / 255
-        C_max = np.max(RGB_norm)
-        C_min = np.min(RGB_norm)
-        D = C_max - C_min
+# Dragging over the preview with a region tool limits the filter steps to the region. Lasso points closer than
+# lassoPointSpacing (a fraction of the larger side of the image) to the previous one are skipped
+regionTools = ('Whole Image', 'Rectangle', 'Lasso')
+lassoPointSpacing = 1 / 400
+regionOutlineColour = '#ffff00'
 
-        L = (C_max + C_min) / 2
-        if D == 0:
-            S = 0
-            H = 0
-        else:
-            S = D / (1 - abs(2 * L - 1))
-            H = 60
-            if C_max == RGB_norm[0]:
-                H *= ((RGB_norm[1] - RGB_norm[2]) / D % 6)
-            elif C_max == RGB_norm[1]:
-                H *= ((RGB_norm[2] - RGB_norm[0]) / D + 2)
-            else:
-                H *= ((RGB_norm[0] - RGB_norm[1]) / D + 4)
+# Imported by the startup task, in this order. The visualizer is left to the first Visualize
+startupModules = ('numpy', 'cv2', 'ICCTEngine', 'ICCTColour', 'ICCTPalette', 'ICCTHistory', 'ICCTSession', 'ICCTStats',
+                  'matplotlib.figure', 'matplotlib.backends.backend_tkagg', 'ICCTRender')
 
-        convFmt = np.array([H, S * 100, L * 100])
-    elif toFmt.upper() == 'CMYK':
-        RGB_norm = BGRA[:3][::-1] / 255
+# Tasks on the image being viewed, dropped when another image of the folder is opened (saves run to completion)
+imageTaskKinds = ('decode', 'realise', 'visualize', 'statistics', 'pyramid', 'matches')
 
-        K = 1 - np.max(RGB_norm)
-        C = (1 - RGB_norm[0] - K) / (1 - K)
-        M = (1 - RGB_norm[1] - K) / (1 - K)
-        Y = (1 - RGB_norm[2] - K) / (1 - K)
 
-        convFmt = np.array([C * 100, M * 100, Y * 100, K * 100])
-        convFmt[np.isnan(convFmt)] = 0
+def openUrl(*kwargs):
+    webbrowser.open(appLinkURL)
 
-    return convFmt
 
+def saveTargetsFor(savePath, extensions, scales):
+    # One (path, scale) target per format & size, reduced sizes are suffixed with their percentage (photo_50.jpg)
+    basePath, savedExtension = os.path.splitext(savePath)
+    saveTargets = []
 
-def openUrl(*kwargs):
-    webbrowser.open(appLinkURL)
+    for extension in extensions:
+        if extension == '.jpg' and savedExtension.lower() == '.jpeg':
+            extension = savedExtension
+
+        for scale in scales:
+            saveTargets.append((basePath + ('' if scale == 1 else '_%d' % round(scale * 100)) + extension, scale))
+
+    return saveTargets
 
 
 class ApplicationVisualizer:
@@ -71,82 +89,296 @@ class ApplicationVisualizer:
 
         self.VisualFrame = tk.Frame(self.MainApplication)
 
-        imageRes = np.shape(imgData)
-
-        X = np.arange(imageRes[1])
-        Y = np.arange(imageRes[0])[::-1]
+        # <| VIEW CONTROLS |>
+        self.ControlFrame = ttk.Frame(self.VisualFrame)
 
-        X, Y = np.meshgrid(X, Y)
+        self.ViewLabel = ttk.Label(self.ControlFrame, text='View')
+        self.ViewLabel.pack(side='left', padx=5)
 
-        imgFig = Figure(figsize=(13.5, 8), dpi=80)
+        self.VAR_view = tk.StringVar('')
+        self.VAR_view.set(list(ICCTVisualizer.visualizerViews)[0])
+        self.ViewOptionMenu = ttk.Combobox(self.ControlFrame, state='readonly', width='15')
+        self.ViewOptionMenu.config(values=list(ICCTVisualizer.visualizerViews), textvariable=self.VAR_view)
+        self.ViewOptionMenu.pack(side='left', padx=5)
 
-        R_data = np.array(imgData[:, :, 0], dtype=np.float)
-        G_data = np.array(imgData[:, :, 1], dtype=np.float)
-        B_data = np.array(imgData[:, :, 2], dtype=np.float)
+        self.DetailLabel = ttk.Label(self.ControlFrame, text='Level of Detail')
+        self.DetailLabel.pack(side='left', padx=5)
 
-        R_plot = imgFig.add_subplot(2, 3, 1, projection='3d')
-        G_plot = imgFig.add_subplot(2, 3, 2, projection='3d')
-        B_plot = imgFig.add_subplot(2, 3, 3, projection='3d')
+        self.VAR_detail = tk.StringVar('')
+        self.VAR_detail.set('Medium')
+        self.DetailOptionMenu = ttk.Combobox(self.ControlFrame, state='readonly', width='10')
+        self.DetailOptionMenu.config(values=list(ICCTVisualizer.visualizerDetailLevels), textvariable=self.VAR_detail)
+        self.DetailOptionMenu.pack(side='left', padx=5)
 
-        R_map = imgFig.add_subplot(2, 3, 4)
-        G_map = imgFig.add_subplot(2, 3, 5)
-        B_map = imgFig.add_subplot(2, 3, 6)
+        self.ControlFrame.pack(side='top', fill='x', pady=5)
 
-        R_plot.plot_surface(X, Y, R_data, cmap=cm.coolwarm)
-        R_plot.set_zlim(0, 256)
-        R_plot.set_zlabel("R")
-        G_plot.plot_surface(X, Y, G_data, cmap=cm.coolwarm)
-        G_plot.set_zlim(0, 256)
-        G_plot.set_zlabel("G")
-        B_plot.plot_surface(X, Y, G_data, cmap=cm.coolwarm)
-        B_plot.set_zlim(0, 256)
-        B_plot.set_zlabel("B")
+        self.imgFig = mplFigure.Figure(figsize=(13.5, 8), dpi=80)
+        self.VisualizerFigure = ICCTVisualizer.VisualizerFigure(self.imgFig, imgData)
 
-        R_map.imshow(R_data, cmap='Reds', interpolation=None)
-        G_map.imshow(G_data, cmap='Greens', interpolation=None)
-        B_map.imshow(B_data, cmap='Blues', interpolation=None)
-
-        self.ImageCanvas = FigureCanvasTkAgg(imgFig, self.VisualFrame)
+        self.ImageCanvas = mplBackend.FigureCanvasTkAgg(self.imgFig, self.VisualFrame)
         self.ImageCanvas.get_tk_widget().pack()
 
-        self.ImageToolbar = NavigationToolbar2Tk(self.ImageCanvas, self.VisualFrame)
+        self.ImageToolbar = mplBackend.NavigationToolbar2Tk(self.ImageCanvas, self.VisualFrame)
         self.ImageToolbar.config(padx=5)
         self.ImageToolbar.update()
         self.ImageCanvas.get_tk_widget().pack()
 
         self.VisualFrame.pack(padx=5, pady=5)
 
+        self.VAR_view.trace('w', self.plotView)
+        self.VAR_detail.trace('w', self.plotView)
+
+        self.plotView()
+
         self.MainApplication.title('ICCT Visualizer')
 
+    def plotView(self, *kwargs):
+        self.VisualizerFigure.plotView(self.VAR_view.get(), self.VAR_detail.get())
+        self.ImageCanvas.draw()
+
+
+class ApplicationStatistics:
+    # Histograms & per-channel statistics of the image in the preview, kept up to date while the window is open
+    def __init__(self, parent, onClose):
+        self.MainApplication = tk.Toplevel(parent)
+        self.MainApplication.protocol('WM_DELETE_WINDOW', onClose)
+
+        self.StatisticsFrame = ttk.Frame(self.MainApplication)
+
+        self.imgFig = mplFigure.Figure(figsize=(7, 3), dpi=80)
+        self.HistogramPlot = self.imgFig.add_subplot()
+        self.HistogramLines = [self.HistogramPlot.plot(np.arange(256), np.zeros(256), color=colour, linewidth=1)[0]
+                               for colour in ('#ff0000', '#00a000', '#0000ff')]
+        self.HistogramPlot.set_xlim(0, 255)
+        self.imgFig.tight_layout()
+
+        self.ImageCanvas = mplBackend.FigureCanvasTkAgg(self.imgFig, self.StatisticsFrame)
+        self.ImageCanvas.get_tk_widget().pack(padx=5, pady=5)
+
+        # <| TABLE OF THE PER-CHANNEL STATISTICS |>
+        self.TableFrame = ttk.Frame(self.StatisticsFrame)
+
+        for heading, x in statisticsColumns:
+            headingLabel = ttk.Label(self.TableFrame, text=heading, font='{Arial} 9 {bold}')
+            headingLabel.place(anchor='e', x=str(x), y='12')
+
+        self.VAR_statistics = []
+        for row, channel in enumerate(ICCTStats.statsChannels):
+            channelLabel = ttk.Label(self.TableFrame, text=channel)
+            channelLabel.place(anchor='w', x='5', y=str(37 + 25 * row))
+
+            rowVariables = []
+            for heading, x in statisticsColumns:
+                VAR_statistic = tk.StringVar(value='---')
+                statisticLabel = ttk.Label(self.TableFrame, textvariable=VAR_statistic)
+                statisticLabel.place(anchor='e', x=str(x), y=str(37 + 25 * row))
+                rowVariables.append(VAR_statistic)
+            self.VAR_statistics.append(rowVariables)
+
+        self.VAR_caption = tk.StringVar(value='')
+        self.CaptionLabel = ttk.Label(self.TableFrame, textvariable=self.VAR_caption, font=('TkDefaultFont', 8))
+        self.CaptionLabel.place(anchor='w', x='5', y='115')
+
+        self.TableFrame.config(height='130', width='560')
+        self.TableFrame.pack(padx=5, pady=5)
+
+        self.StatisticsFrame.pack()
+
+        self.MainApplication.title('ICCT Statistics')
+        self.MainApplication.resizable(False, False)
+
+    def showStatistics(self, imageStats, caption):
+        minimum, maximum, mean = imageStats.minimum(), imageStats.maximum(), imageStats.mean()
+        clippedLow, clippedHigh = imageStats.clippedLow(), imageStats.clippedHigh()
+
+        for channel, rowVariables in enumerate(self.VAR_statistics):
+            rowVariables[0].set("%d" % minimum[channel])
+            rowVariables[1].set("%d" % maximum[channel])
+            rowVariables[2].set("%.1f" % mean[channel])
+            rowVariables[3].set("%s (%.2f%%)" % (format(clippedLow[channel], ','),
+                                                 100 * clippedLow[channel] / max(1, imageStats.pixelCount)))
+            rowVariables[4].set("%s (%.2f%%)" % (format(clippedHigh[channel], ','),
+                                                 100 * clippedHigh[channel] / max(1, imageStats.pixelCount)))
+
+        for histogramLine, histogram in zip(self.HistogramLines, imageStats.histograms):
+            histogramLine.set_ydata(histogram)
+        self.HistogramPlot.set_ylim(0, max(1, imageStats.histograms.max()) * 1.05)
+
+        self.VAR_caption.set(caption)
+        self.ImageCanvas.draw_idle()
+
+    def clearStatistics(self):
+        for rowVariables in self.VAR_statistics:
+            for VAR_statistic in rowVariables:
+                VAR_statistic.set('---')
+
+        for histogramLine in self.HistogramLines:
+            histogramLine.set_ydata(np.zeros(256))
+
+        self.VAR_caption.set('')
+        self.ImageCanvas.draw_idle()
+
+    def close(self):
+        self.MainApplication.destroy()
+
+
+class ApplicationSaveDialog:
+    # Encoder settings & export targets of Save Current Preview. saveSettings (kept by the main window across saves) is
+    # updated and onSave(saveTargets, saveOptions) is called once the file name has been chosen
+    def __init__(self, parent, saveSettings, onSave):
+        self.saveSettings = saveSettings
+        self.onSave = onSave
+
+        self.MainApplication = tk.Toplevel(parent)
+        self.MainApplication.transient(parent)
+
+        self.SaveFrame = ttk.Frame(self.MainApplication)
+
+        self.PresetLabel = ttk.Label(self.SaveFrame, text='Preset')
+        self.PresetLabel.place(anchor='w', x='20', y='25')
+
+        self.VAR_preset = tk.StringVar('')
+        self.PresetOptionMenu = ttk.Combobox(self.SaveFrame, state='readonly', width='12')
+        self.PresetOptionMenu.config(values=list(ICCTEngine.savePresets), textvariable=self.VAR_preset)
+        self.PresetOptionMenu.place(anchor='w', x='150', y='25')
+
+        self.VAR_pngCompression = tk.IntVar()
+        self.PNGCompressionLabel = ttk.Label(self.SaveFrame, text='PNG Compression')
+        self.PNGCompressionLabel.place(anchor='w', x='20', y='60')
+        self.PNGCompressionSpinbox = ttk.Spinbox(self.SaveFrame, from_=0, to=9, width='5')
+        self.PNGCompressionSpinbox.config(textvariable=self.VAR_pngCompression)
+        self.PNGCompressionSpinbox.place(anchor='w', x='150', y='60')
+
+        self.VAR_jpegQuality = tk.IntVar()
+        self.JPEGQualityLabel = ttk.Label(self.SaveFrame, text='JPEG Quality')
+        self.JPEGQualityLabel.place(anchor='w', x='20', y='95')
+        self.JPEGQualitySpinbox = ttk.Spinbox(self.SaveFrame, from_=0, to=100, width='5')
+        self.JPEGQualitySpinbox.config(textvariable=self.VAR_jpegQuality)
+        self.JPEGQualitySpinbox.place(anchor='w', x='150', y='95')
+
+        self.VAR_jpegProgressive = tk.IntVar()
+        self.ProgressiveCheckBox = ttk.Checkbutton(self.SaveFrame, text='Progressive JPEG')
+        self.ProgressiveCheckBox.config(variable=self.VAR_jpegProgressive)
+        self.ProgressiveCheckBox.place(anchor='w', x='20', y='130')
+
+        self.VAR_jpegOptimize = tk.IntVar()
+        self.OptimizeCheckBox = ttk.Checkbutton(self.SaveFrame, text='Optimise JPEG')
+        self.OptimizeCheckBox.config(variable=self.VAR_jpegOptimize)
+        self.OptimizeCheckBox.place(anchor='w', x='170', y='130')
+
+        # <| EXPORT TARGETS: EVERY CHECKED FORMAT AT EVERY CHECKED SIZE |>
+        self.FormatsLabel = ttk.Label(self.SaveFrame, text='Formats')
+        self.FormatsLabel.place(anchor='w', x='20', y='170')
+
+        self.VAR_formats = {}
+        for index, (formatName, extension) in enumerate(saveFormats.items()):
+            self.VAR_formats[extension] = tk.IntVar(value=int(extension in saveSettings['extensions']))
+            formatCheckBox = ttk.Checkbutton(self.SaveFrame, text=formatName, variable=self.VAR_formats[extension])
+            formatCheckBox.place(anchor='w', x=str(90 + 70 * index), y='170')
+
+        self.SizesLabel = ttk.Label(self.SaveFrame, text='Sizes')
+        self.SizesLabel.place(anchor='w', x='20', y='205')
+
+        self.VAR_scales = {}
+        for index, scale in enumerate(saveScales):
+            self.VAR_scales[scale] = tk.IntVar(value=int(scale in saveSettings['scales']))
+            scaleCheckBox = ttk.Checkbutton(self.SaveFrame, text='%d%%' % (scale * 100))
+            scaleCheckBox.config(variable=self.VAR_scales[scale])
+            scaleCheckBox.place(anchor='w', x=str(90 + 70 * index), y='205')
+
+        self.SaveButton = ttk.Button(self.SaveFrame, text='Save...', command=self.save)
+        self.SaveButton.place(anchor='e', width='100', x='155', y='255')
+
+        self.CancelButton = ttk.Button(self.SaveFrame, text='Cancel', command=self.MainApplication.destroy)
+        self.CancelButton.place(anchor='w', width='100', x='175', y='255')
+
+        self.SaveFrame.config(height='285', width='330')
+        self.SaveFrame.pack()
+
+        # The options as last saved, which may differ from their preset if they were changed by hand
+        self.setOptions(saveSettings['options'])
+        self.VAR_preset.set(saveSettings['preset'])
+        self.VAR_preset.trace('w', self.presetChangeEvent)
+
+        self.MainApplication.title('Save Current Preview')
+        self.MainApplication.resizable(False, False)
+        self.MainApplication.grab_set()
+
+    def setOptions(self, saveOptions):
+        self.VAR_pngCompression.set(saveOptions['pngCompression'])
+        self.VAR_jpegQuality.set(saveOptions['jpegQuality'])
+        self.VAR_jpegProgressive.set(int(saveOptions['jpegProgressive']))
+        self.VAR_jpegOptimize.set(int(saveOptions['jpegOptimize']))
+
+    def presetChangeEvent(self, *kwargs):
+        self.setOptions(ICCTEngine.savePresets[self.VAR_preset.get()])
+
+    def save(self):
+        try:
+            saveOptions = {'pngCompression': min(9, max(0, self.VAR_pngCompression.get())),
+                           'jpegQuality': min(100, max(0, self.VAR_jpegQuality.get())),
+                           'jpegProgressive': self.VAR_jpegProgressive.get() == 1,
+                           'jpegOptimize': self.VAR_jpegOptimize.get() == 1}
+        except tk.TclError:
+            messagebox.showerror("Error", "Invalid Save Options", parent=self.MainApplication)
+            return
+
+        extensions = [extension for extension, VAR_format in self.VAR_formats.items() if VAR_format.get() == 1]
+        scales = [scale for scale, VAR_scale in self.VAR_scales.items() if VAR_scale.get() == 1]
+
+        if not extensions or not scales:
+            messagebox.showerror("Error", "Select at least one format and size", parent=self.MainApplication)
+            return
+
+        fileTypes = [(formatName + " File", '*' + extension) for formatName, extension in saveFormats.items()
+                     if extension in extensions]
+        saveFilename = filedialog.asksaveasfilename(parent=self.MainApplication, defaultextension=extensions[0],
+                                                    filetypes=fileTypes)
+        if saveFilename == '':
+            return
+
+        self.saveSettings.update(preset=self.VAR_preset.get(), options=saveOptions, extensions=extensions,
+                                 scales=scales)
+        self.MainApplication.destroy()
+
+        # A single format saves under the extension as typed, several formats replace it
+        if len(extensions) == 1 and os.path.splitext(saveFilename)[1].lower() in ICCTEngine.imageExtensions:
+            extensions = [os.path.splitext(saveFilename)[1]]
+
+        self.onSave(saveTargetsFor(saveFilename, extensions, scales), saveOptions)
 
-class ApplicationICCT:
-    def setDefaults(self):
-        self.VAR_fileName.set("No file selected")
 
+class ApplicationICCT:
+    def clearImage(self):
+        # Image state only, the controls are kept so that stepping through a folder keeps the mode & parameters
         self.ImageBGRA = None
         self.ImageOriginal = None
+        self.FilterChain = []
+        self.fullShape = None
 
-        self.VAR_filterR.set(0)
-        self.VAR_filterG.set(0)
-        self.VAR_filterB.set(0)
+        self.ProxyOriginal = None
+        self.ProxyBGRA = None
+        self.PreviewBGRA = None
+        self.PreviewChain = ()
+        self.fullResStale = False
+        self.realisedChain = ()
 
-        self.VAR_operationMode.set('')
+        self.History = None
+        self.SessionImage = None
 
-        self.RedChannelEntry.config(state='disabled')
-        self.RedChannelScale.config(state='disabled')
-        self.RedChannelLabel.config(state='disabled')
-        self.GreenChannelEntry.config(state='disabled')
-        self.GreenChannelScale.config(state='disabled')
-        self.GreenChannelLabel.config(state='disabled')
-        self.BlueChannelEntry.config(state='disabled')
-        self.BlueChannelScale.config(state='disabled')
-        self.BlueChannelLabel.config(state='disabled')
+        self.Region = None
+        self.lassoPoints = []
 
-        self.ProcessButton.config(state='disabled')
-        self.ResetButton.config(state='disabled')
-        self.SaveButton.config(state='disabled')
+        for kind in imageTaskKinds:
+            self.Tasks.cancel(kind)
+
+        if self.liveUpdateID is not None:
+            self.MainApplication.after_cancel(self.liveUpdateID)
+            self.liveUpdateID = None
 
-        self.VisualizerButton.config(state='disabled')
+        if self.matchCountID is not None:
+            self.MainApplication.after_cancel(self.matchCountID)
+            self.matchCountID = None
 
         self.VAR_pickerR.set("---")
         self.VAR_pickerG.set("---")
@@ -166,11 +398,62 @@ class ApplicationICCT:
         self.PickerSampleCanvas.config(background="#f0f0f0")
         self.PickerSampleCanvas.itemconfig(self.PickerAlphaText, text="Alpha : ---", fill="#000000")
 
-        self.ImageFigure.clear()
+        # The caches & the preview are only created by the startup task
+        if self.ImageRenderer is None:
+            return
+
+        self.ChainStats.clear()
+        if self.StatisticsWindow is not None:
+            self.StatisticsWindow.clearStatistics()
+
+        self.ColourIndexes.clear()
+
+        self.ImageRenderer.clear()
+        self.ImagePlot = None
         self.ImageCanvas.draw()
         self.ImageCanvas.mpl_disconnect(self.pickerClickPID)
+        self.ImageCanvas.mpl_disconnect(self.pickerReleasePID)
+        self.ImageCanvas.mpl_disconnect(self.regionDragPID)
+        self.pickerPressXY = None
 
-        self.BrowseFileButton.config(state='enabled')
+    def setDefaults(self):
+        self.VAR_fileName.set("No file selected")
+
+        self.Tasks.cancel()
+        self.clearImage()
+        if self.Session is not None:
+            self.Session.clear()
+
+        self.VAR_filterR.set(0)
+        self.VAR_filterG.set(0)
+        self.VAR_filterB.set(0)
+
+        self.VAR_operationMode.set('')
+        self.VAR_regionTool.set(regionTools[0])
+
+        self.RedChannelEntry.config(state='disabled')
+        self.RedChannelScale.config(state='disabled')
+        self.RedChannelLabel.config(state='disabled')
+        self.GreenChannelEntry.config(state='disabled')
+        self.GreenChannelScale.config(state='disabled')
+        self.GreenChannelLabel.config(state='disabled')
+        self.BlueChannelEntry.config(state='disabled')
+        self.BlueChannelScale.config(state='disabled')
+        self.BlueChannelLabel.config(state='disabled')
+
+        self.setSpecificControls(False)
+
+        self.ProcessButton.config(state='disabled')
+        self.ResetButton.config(state='disabled')
+        self.SaveButton.config(state='disabled')
+
+        self.updateHistoryButtons()
+        self.updateSessionButtons()
+
+        if self.VisualizerButton is not None:
+            self.VisualizerButton.config(state='disabled')
+
+        self.BrowseFileButton.config(state='enabled' if self.Session is not None else 'disabled')
         self.ClearFileButton.config(state='disabled')
 
     def modeChangeEvent(self, *kwargs):
@@ -211,127 +494,599 @@ class ApplicationICCT:
                 self.BlueChannelEntry.config(state='disabled')
                 self.BlueChannelScale.config(state='disabled', from_=0, to=1)
 
+        self.setSpecificControls(operationMode == ' Specific')
+
+    def setSpecificControls(self, enabled):
+        self.SpecificColours = []
+        self.VAR_tolerance.set(0)
+        self.VAR_matchCount.set("")
+        self.AddColourButton.config(text='Add Colour')
+
+        for widget in (self.ToleranceLabel, self.ToleranceSpinbox, self.AddColourButton):
+            widget.config(state='enabled' if enabled else 'disabled')
+
+        if enabled:
+            self.parameterChangeEvent()
+
+    def addSpecificColour(self):
+        try:
+            colour = (self.VAR_filterR.get(), self.VAR_filterG.get(), self.VAR_filterB.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "Invalid Input Parameters")
+            return
+
+        if colour not in self.SpecificColours:
+            self.SpecificColours.append(colour)
+
+        self.AddColourButton.config(text='Add Colour (%d)' % len(self.SpecificColours))
+        self.parameterChangeEvent()
+
+    def specificColours(self):
+        colour = (self.VAR_filterR.get(), self.VAR_filterG.get(), self.VAR_filterB.get())
+        return [colour] + [extraColour for extraColour in self.SpecificColours if extraColour != colour]
+
+    def scheduleMatchCount(self):
+        if self.matchCountID is not None:
+            self.MainApplication.after_cancel(self.matchCountID)
+        self.matchCountID = self.MainApplication.after(liveDebounceMS, self.updateMatchCount)
+
+    def updateMatchCount(self):
+        # Counted on the image the Specific step would be applied to, from its colour index (built once per image)
+        self.matchCountID = None
+
+        try:
+            coloursRGB, tolerance = self.specificColours(), self.VAR_tolerance.get()
+        except tk.TclError:
+            return
+
+        cumulative = self.VAR_cumulative.get() == 1
+
+        ImageBGRA = None
+        if self.VAR_livePreview.get() == 0:
+            ImageBGRA = self.ImageBGRA if cumulative else self.ImageOriginal
+
+        # Counted on the proxy while previewing live or while the full resolution image is still being decoded
+        liveProxy = ImageBGRA is None
+        if liveProxy:
+            ImageBGRA = self.ProxyBGRA if cumulative and self.ProxyBGRA is not None else self.ProxyOriginal
+
+        def countMatches(task=None):
+            colourIndex = self.ColourIndexes.indexFor(ImageBGRA)
+            return colourIndex.countOf(coloursRGB, tolerance) / colourIndex.pixelCount
+
+        def showMatches(matchFraction):
+            matchPixels = matchFraction * self.fullShape[0] * self.fullShape[1]
+            self.VAR_matchCount.set("%s%s px (%.2f%%)" % ('~' if liveProxy else '', format(round(matchPixels), ','),
+                                                         matchFraction * 100))
+
+        # The full resolution image is indexed & counted on the worker thread, the proxy at once
+        if liveProxy:
+            showMatches(countMatches())
+        else:
+            self.VAR_matchCount.set("Counting...")
+            self.Tasks.submit('matches', "Counting matches", countMatches, showMatches, self.taskFailed)
+
     def openFile(self):
         ImageFilePath = filedialog.askopenfilename(filetypes=[("Image files", ".jpg .jpeg .png .bmp")])
 
-        try:
-            if ImageFilePath != '':
-                self.ImageBGRA = cv2.imread(ImageFilePath, cv2.IMREAD_UNCHANGED)
+        if ImageFilePath != '':
+            # The other images of the folder can then be stepped through with < / > (or Page Up / Page Down)
+            self.Session.openFolderOf(ImageFilePath)
+            self.Tasks.submit('open', "Opening", lambda task: self.Session.load(ImageFilePath), self.imageOpened,
+                              self.openFailed)
 
-                if self.ImageBGRA.shape[2] == 3:
-                    (W, H, X) = self.ImageBGRA.shape
-                    self.ImageBGRA = np.dstack((self.ImageBGRA, np.ones((W, H), dtype=np.uint8) * 255))
+    def stepImage(self, offset):
+        ImageFilePath = self.Session.adjacentPath(offset) if self.SessionImage is not None else None
 
-                self.ImageOriginal = np.array(self.ImageBGRA)
+        if ImageFilePath is None:
+            return
 
-                self.showImage()
+        # Work on the image being left would hold the worker up
+        self.Tasks.cancel('realise')
+        self.Tasks.cancel('visualize')
 
-                self.VAR_fileName.set(ImageFilePath.split('/')[-1])
+        self.Tasks.submit('open', "Opening", lambda task: self.Session.load(ImageFilePath), self.imageOpened,
+                          lambda error: self.stepFailed(ImageFilePath, error))
 
-                self.BrowseFileButton.config(state='disabled')
-                self.ClearFileButton.config(state='enabled')
+    def previousImage(self, *kwargs):
+        self.stepImage(-1)
 
-                self.ProcessButton.config(state='enabled')
-                self.ResetButton.config(state='enabled')
-                self.SaveButton.config(state='enabled')
+    def nextImage(self, *kwargs):
+        self.stepImage(1)
 
-                self.VisualizerButton.config(state='enabled')
+    def stepFailed(self, ImageFilePath, error):
+        log.debug("Opening %s failed", ImageFilePath, exc_info=error)
+        messagebox.showerror("Error", "Invalid Image: %s\n%s" % (ImageFilePath.split('/')[-1], error))
 
-                self.pickerClickPID = self.ImageCanvas.mpl_connect('button_press_event', self.colourPickerClick)
-        except:
-            messagebox.showerror("Error", "Invalid Image")
-            self.setDefaults()
+        self.Session.discard(ImageFilePath)
+        if self.SessionImage is not None:
+            self.VAR_fileName.set(self.Session.describe())
+        self.updateSessionButtons()
 
-    def showImage(self):
-        self.ImageFigure.clear()
-        self.ImagePlot = self.ImageFigure.add_subplot()
-        self.ImagePlot.imshow(cv2.cvtColor(self.ImageBGRA, cv2.COLOR_BGRA2RGBA))
-        self.ImageCanvas.draw()
+    def stashImage(self):
+        # The image being left keeps its filter chain, history & full resolution image in the session cache, only the
+        # intermediate checkpoints of its history are dropped
+        SessionImage = self.SessionImage
+        if SessionImage is None:
+            return
 
-    def applyImageFilter(self):
+        SessionImage.FilterChain = list(self.FilterChain)
+        SessionImage.ImageBGRA, SessionImage.realisedChain = self.ImageBGRA, self.realisedChain
+
+        if self.realisedChain is not None:
+            self.History.setCurrentFrame(self.realisedChain, self.ImageBGRA)
+        self.History.releaseCheckpoints()
+
+        self.Session.store(SessionImage)
+
+    def imageOpened(self, SessionImage):
+        self.Session.view(SessionImage)
+        self.stashImage()
+        self.clearImage()
+
+        self.SessionImage = SessionImage
+        self.fullShape = SessionImage.fullShape
+        self.ProxyOriginal = SessionImage.ProxyOriginal
+
+        if SessionImage.History is None:
+            SessionImage.History = ICCTHistory.FilterHistory(SessionImage.ImageOriginal)
+        self.History = SessionImage.History
+
+        # Decoded in the background after the image was left
+        if SessionImage.ImageOriginal is not None and SessionImage.realisedChain is None:
+            SessionImage.ImageBGRA, SessionImage.realisedChain = SessionImage.ImageOriginal, ()
+
+        self.ImageOriginal = SessionImage.ImageOriginal
+        self.ImageBGRA = SessionImage.ImageBGRA
+        self.realisedChain = SessionImage.realisedChain
+        self.setFilterChain(SessionImage.FilterChain)
+        self.updateHistoryButtons()
+
+        if self.ImageOriginal is None:
+            # Opened from a reduced resolution decode: the proxy is shown at once and the full resolution image is
+            # decoded on the worker, ahead of every later task that needs it
+            self.Tasks.submit('decode', "Decoding", lambda task: self.Session.decodeOriginal(SessionImage),
+                              lambda ImageOriginal: self.fullResDecoded(SessionImage, ImageOriginal), self.openFailed,
+                              cancellable=False)
+            self.showImage(self.ProxyOriginal, ())
+
+        self.refreshPreview()
+
+        self.VAR_fileName.set(self.Session.describe())
+        self.updateSessionButtons()
+
+        self.BrowseFileButton.config(state='disabled')
+        self.ClearFileButton.config(state='enabled')
+
+        self.ProcessButton.config(state='enabled')
+        self.ResetButton.config(state='enabled')
+        self.SaveButton.config(state='enabled')
+
+        self.VisualizerButton.config(state='enabled')
+
+        self.pickerClickPID = self.ImageCanvas.mpl_connect('button_press_event', self.colourPickerClick)
+        self.pickerReleasePID = self.ImageCanvas.mpl_connect('button_release_event', self.colourPickerRelease)
+        self.regionDragPID = self.ImageCanvas.mpl_connect('motion_notify_event', self.regionDragEvent)
+
+    def fullResDecoded(self, SessionImage, ImageOriginal):
+        if SessionImage is not self.SessionImage:
+            return
+
+        self.ImageOriginal = ImageOriginal
+
+        if self.realisedChain is None:
+            self.ImageBGRA, self.realisedChain = ImageOriginal, ()
+            self.setFilterChain(self.FilterChain)
+
+    def openFailed(self, error):
+        log.debug("Opening failed", exc_info=error)
+        messagebox.showerror("Error", "Invalid Image: %s" % error)
+        self.setDefaults()
+
+    def updateSessionButtons(self):
+        for button, offset in ((self.PreviousImageButton, -1), (self.NextImageButton, 1)):
+            available = self.SessionImage is not None and self.Session.adjacentPath(offset) is not None
+            button.config(state='enabled' if available else 'disabled')
+
+    def showImage(self, ImageBGRA=None, filterChain=None):
+        # filterChain is the chain of ImageBGRA (that of the full resolution image at hand by default)
+        if ImageBGRA is None:
+            ImageBGRA, filterChain = self.ImageBGRA, self.realisedChain
+        self.PreviewBGRA, self.PreviewChain = ImageBGRA, tuple(filterChain)
+
+        # Proxies are drawn over the extent of the full resolution image, so the toolbar & picker coordinates are
+        # always those of the full resolution image
+        self.ImageRenderer.setImage(ImageBGRA, self.fullShape)
+        self.ImagePlot = self.ImageRenderer.plot
+
+        self.updateStatistics()
+
+    def updateStatistics(self):
+        # Derived from the statistics of an earlier frame when only point steps were applied since (see ICCTStats),
+        # large frames that have to be counted again are counted on the worker thread
+        if self.StatisticsWindow is None or self.PreviewBGRA is None:
+            return
+
+        ImageBGRA, filterChain = self.PreviewBGRA, self.PreviewChain
+        imageStats = self.ChainStats.cachedStats(filterChain, ImageBGRA.shape)
+
+        if imageStats is None:
+            if ImageBGRA.shape[0] * ImageBGRA.shape[1] > inlineStatisticsPixels:
+                ChainStats = self.ChainStats
+                self.Tasks.submit('statistics', "Counting", lambda task: ChainStats.statsFor(filterChain, ImageBGRA),
+                                  lambda imageStats: self.showStatistics(ImageBGRA, imageStats), self.taskFailed)
+                return
+
+            imageStats = self.ChainStats.statsFor(filterChain, ImageBGRA)
+
+        self.showStatistics(ImageBGRA, imageStats)
+
+    def showStatistics(self, ImageBGRA, imageStats):
+        if self.StatisticsWindow is None or ImageBGRA is not self.PreviewBGRA:
+            return
+
+        H, W = ImageBGRA.shape[:2]
+        self.StatisticsWindow.showStatistics(imageStats, "%d x %d px%s" % (W, H, " (reduced resolution preview)" if
+                                                                           (H, W) != tuple(self.fullShape) else ""))
+
+    def statisticsToggle(self):
+        if self.VAR_showStatistics.get() == 1:
+            if self.StatisticsWindow is None:
+                self.StatisticsWindow = ApplicationStatistics(self.MainApplication, self.closeStatistics)
+            self.updateStatistics()
+        elif self.StatisticsWindow is not None:
+            self.StatisticsWindow.close()
+            self.StatisticsWindow = None
+
+    def closeStatistics(self):
+        self.VAR_showStatistics.set(0)
+        self.statisticsToggle()
+
+    def setFilterChain(self, filterChain):
+        # The filter chain is the state of the image, the full resolution image of a chain is only computed (on the
+        # worker thread) when it is needed. realisedChain is the chain of the full resolution image at hand
+        self.FilterChain = list(filterChain)
+        self.fullResStale = tuple(self.FilterChain) != self.realisedChain
+
+    def realiseFullRes(self, onRealised=None):
+        if not self.fullResStale:
+            if onRealised is not None:
+                onRealised(self.ImageBGRA)
+            return
+
+        History, filterChain = self.History, tuple(self.FilterChain)
+
+        def realised(ImageBGRA):
+            if History is self.History and filterChain == tuple(self.FilterChain):
+                self.ImageBGRA, self.realisedChain, self.fullResStale = ImageBGRA, filterChain, False
+
+                if self.VAR_operationMode.get() == ' Specific':
+                    self.scheduleMatchCount()
+                if onRealised is not None:
+                    onRealised(ImageBGRA)
+
+        def cancelled(result):
+            # An apply / undo / redo cancelled by the user (not superseded by a newer one) is rolled back to the last
+            # state whose full resolution image is at hand, the cancelled states stay available to redo
+            if History is self.History and filterChain == tuple(self.FilterChain) and not self.Tasks.busy('realise'):
+                if not self.History.rewindTo(self.realisedChain):
+                    self.History.push(self.realisedChain)
+
+                self.setFilterChain(self.History.current())
+                self.updateHistoryButtons()
+                self.refreshPreview()
+
+        self.Tasks.submit('realise', "Applying", lambda task: History.frameFor(filterChain, task.progress), realised,
+                          self.taskFailed, cancelled)
+
+    def showRealised(self, ImageBGRA):
+        if self.VAR_livePreview.get() == 0:
+            self.showImage(ImageBGRA, self.realisedChain)
+
+    def refreshPreview(self):
+        if self.VAR_livePreview.get() == 1:
+            self.ProxyBGRA = ICCTEngine.applyFilterChain(self.ProxyOriginal, self.FilterChain)
+            self.showImage(self.ProxyBGRA, self.FilterChain)
+        else:
+            self.realiseFullRes(self.showRealised)
+
+    def readFilterStep(self):
         operationMode = self.ModeOptionMenu.get().upper().strip()
-        if self.VAR_cumulative.get() == 0:
-            self.ImageBGRA = np.array(self.ImageOriginal)
 
+        if operationMode not in ICCTEngine.filterModes:
+            return None
+
+        if operationMode == 'SPECIFIC':
+            filterStep = ICCTEngine.makeSpecificStep(self.specificColours(), self.VAR_tolerance.get())
+        else:
+            filterStep = ICCTEngine.makeFilterStep(operationMode, self.VAR_filterR.get(), self.VAR_filterG.get(),
+                                                   self.VAR_filterB.get())
+
+        return ICCTEngine.limitStepToRegion(filterStep, self.Region)
+
+    def parameterChangeEvent(self, *kwargs):
+        if self.ProxyOriginal is None:
+            return
+
+        if self.VAR_operationMode.get() == ' Specific':
+            self.scheduleMatchCount()
+
+        if self.VAR_livePreview.get() == 0:
+            return
+
+        # Debounce the slider events so that only the latest parameters get previewed
+        if self.liveUpdateID is not None:
+            self.MainApplication.after_cancel(self.liveUpdateID)
+        self.liveUpdateID = self.MainApplication.after(liveDebounceMS, self.updateLivePreview)
+
+    def updateLivePreview(self):
+        self.liveUpdateID = None
+
+        try:
+            filterStep = self.readFilterStep()
+        except tk.TclError:
+            return
+
+        if self.VAR_cumulative.get() == 1:
+            ImageBGRA, filterChain = self.ProxyBGRA, self.FilterChain
+        else:
+            ImageBGRA, filterChain = self.ProxyOriginal, []
+
+        if filterStep is not None:
+            ImageBGRA, filterChain = ICCTEngine.applyFilterChain(ImageBGRA, [filterStep]), filterChain + [filterStep]
+
+        self.showImage(ImageBGRA, filterChain)
+
+    def livePreviewToggle(self):
+        if self.ProxyOriginal is not None:
+            self.refreshPreview()
+
+    def applyImageFilter(self):
         try:
-            R = self.VAR_filterR.get()
-            G = self.VAR_filterG.get()
-            B = self.VAR_filterB.get()
+            filterStep = self.readFilterStep()
         except tk.TclError:
             messagebox.showerror("Error", "Invalid Input Parameters")
             return
 
-        if operationMode == 'ADJUST':
-            B, C = R * 2.55, 1 + G / 100
+        filterChain = self.FilterChain if self.VAR_cumulative.get() == 1 else []
+        if filterStep is not None:
+            filterChain = filterChain + [filterStep]
 
-            ImageBGR = np.array(self.ImageBGRA[:, :, :3], dtype=np.float)
-            self.ImageBGRA = np.dstack((np.array((C * (ImageBGR - 128) + 128 + B).clip(min=0, max=255), dtype=np.uint8),
-                                        self.ImageBGRA[:, :, 3]))
-        if operationMode == 'SPECIFIC':
-            negative = np.where(np.logical_or(self.ImageBGRA[:, :, 0] != B,
-                                              self.ImageBGRA[:, :, 1] != G,
-                                              self.ImageBGRA[:, :, 2] != R))
+        self.setFilterChain(filterChain)
 
-            if colourFmtConv(np.array([B, G, R, 255]), 'hsl')[2] > 17.5:
-                self.ImageBGRA[negative] = [0, 0, 0, 255]
-            else:
-                self.ImageBGRA[negative] = [255, 255, 255, 255]
-        elif operationMode == 'INTENSITY':
-            BGRA = np.array([B, G, R, 0])
-            self.ImageBGRA = np.array((np.array(self.ImageBGRA) + BGRA).clip(min=0, max=255), dtype=np.uint8)
-        elif operationMode == 'GREYSCALE':
-            Gray = np.array(0.299 * self.ImageBGRA[:, :, 2] +
-                            0.587 * self.ImageBGRA[:, :, 1] +
-                            0.114 * self.ImageBGRA[:, :, 0], dtype=np.uint8)
-            Alpha = self.ImageBGRA[:, :, 3]
-
-            self.ImageBGRA = np.dstack((Gray, Gray, Gray, Alpha))
-        elif operationMode == 'INVERSE':
-            self.ImageBGRA = np.array(np.absolute(np.array(self.ImageBGRA, dtype=np.int) - [R, R, R, 0]),
-                                      dtype=np.uint8)
-        elif operationMode == 'CEILING':
-            ImageBGR = self.ImageBGRA[:, :, :3]
-            ImageBGR[ImageBGR[:, :, 0] > B] = 0
-            ImageBGR[ImageBGR[:, :, 1] > G] = 0
-            ImageBGR[ImageBGR[:, :, 2] > R] = 0
-            self.ImageBGRA = np.dstack((ImageBGR, self.ImageBGRA[:, :, 3]))
-        elif operationMode == 'FLOOR':
-            ImageBGR = self.ImageBGRA[:, :, :3]
-            ImageBGR[ImageBGR[:, :, 0] < B] = 0
-            ImageBGR[ImageBGR[:, :, 1] < G] = 0
-            ImageBGR[ImageBGR[:, :, 2] < R] = 0
-            self.ImageBGRA = np.dstack((ImageBGR, self.ImageBGRA[:, :, 3]))
-
-        self.showImage()
+        self.History.push(self.FilterChain)
+        self.updateHistoryButtons()
+
+        self.refreshPreview()
 
     def resetImageFilter(self):
-        self.ImageBGRA = np.array(self.ImageOriginal)
-        self.showImage()
+        self.Tasks.cancel('realise')
+
+        self.ImageBGRA = self.ImageOriginal
+        self.realisedChain = () if self.ImageOriginal is not None else None
+        self.setFilterChain([])
+
+        self.History.push(self.FilterChain, self.ImageBGRA)
+        self.updateHistoryButtons()
+
+        self.refreshPreview()
+
+    def undoImageFilter(self, *kwargs):
+        if self.History is not None and self.History.canUndo():
+            self.restoreHistoryState(self.History.undo())
+
+    def redoImageFilter(self, *kwargs):
+        if self.History is not None and self.History.canRedo():
+            self.restoreHistoryState(self.History.redo())
+
+    def restoreHistoryState(self, filterChain):
+        self.setFilterChain(filterChain)
+
+        self.updateHistoryButtons()
+        self.refreshPreview()
+
+    def updateHistoryButtons(self):
+        self.UndoButton.config(state='enabled' if self.History is not None and self.History.canUndo() else 'disabled')
+        self.RedoButton.config(state='enabled' if self.History is not None and self.History.canRedo() else 'disabled')
+
+    def fullResWork(self, work):
+        # Work on the full resolution image of the current state, computed on the worker thread if need be
+        History, filterChain = self.History, tuple(self.FilterChain)
+        ImageBGRA = None if self.fullResStale else self.ImageBGRA
+
+        def fullResTask(task):
+            return work(task, History.frameFor(filterChain, task.progress) if ImageBGRA is None else ImageBGRA)
+
+        return fullResTask
 
     def saveImagePreview(self):
-        saveFilename = filedialog.asksaveasfilename(defaultextension='.png', filetypes=[("PNG File", '*.png'),
-                                                                                        ("JPG File", '*.jpg'),
-                                                                                        ("JPEG File", '*.jpeg')])
-        try:
-            print(saveFilename)
-            if saveFilename != '':
-                cv2.imwrite(saveFilename, self.ImageBGRA)
+        ApplicationSaveDialog(self.MainApplication, self.SaveSettings, self.exportImage)
 
-                messagebox.showinfo("Info", "Image saved successfully!")
-        except Exception as e:
-            print(e)
-            messagebox.showerror("Error", "Error while writing file")
+    def exportImage(self, saveTargets, saveOptions):
+        # All the targets are written from the one full resolution image of the current state, in parallel
+        def saveFrame(task, ImageBGRA):
+            task.checkCancelled()
+            return ICCTEngine.saveImageTargets(ImageBGRA, saveTargets, saveOptions, progress=task.progress)
+
+        def saved(savedPaths):
+            messagebox.showinfo("Info", "Image saved successfully!" if len(savedPaths) == 1 else
+                                "%d images saved successfully!" % len(savedPaths))
+
+        self.Tasks.submit('save', "Saving", self.fullResWork(saveFrame), saved, self.saveFailed, supersede=False)
+
+    def saveFailed(self, error):
+        log.debug("Saving failed", exc_info=error)
+        messagebox.showerror("Error", "Error while writing file: %s" % error)
 
     def visualizeImage(self):
-        ApplicationVisualizer(self.ImageBGRA)
+        def prepareVisualizer(task, ImageBGRA):
+            VisualizerData = ICCTVisualizer.VisualizerData(ImageBGRA)
+            VisualizerData.prepare(list(ICCTVisualizer.visualizerViews)[0])
+            return VisualizerData
+
+        self.Tasks.submit('visualize', "Visualizing", self.fullResWork(prepareVisualizer), ApplicationVisualizer,
+                          self.taskFailed)
+
+    def renderInBackground(self, work, onDone):
+        # Pyramid levels of large frames (see ICCTRender), the renderer is told when a dropped request is superseded
+        self.Tasks.submit('pyramid', "Rendering", lambda task: work(), lambda result: onDone(), self.taskFailed,
+                          lambda result: onDone(), cancellable=False)
+
+    def taskFailed(self, error):
+        log.debug("Task failed", exc_info=error)
+        messagebox.showerror("Error", "Error while processing the image: %s" % error)
+
+    def cancelImageTask(self, *kwargs):
+        self.Tasks.cancel(userRequest=True)
+
+    def showTaskProgress(self, task):
+        if task is None:
+            self.TaskProgressBar.place_forget()
+            self.CancelTaskButton.place_forget()
+            self.PreviewFrame.config(text='Image Preview')
+            return
+
+        # Tasks that report no progress (decode, encode) show an indeterminate bar
+        if task.fraction is None:
+            self.TaskProgressBar.config(mode='indeterminate')
+            self.TaskProgressBar.step(5)
+            self.PreviewFrame.config(text='Image Preview - %s...' % task.label)
+        else:
+            self.TaskProgressBar.config(mode='determinate', value=task.fraction * 100)
+            self.PreviewFrame.config(text='Image Preview - %s %d%%' % (task.label, task.fraction * 100))
+
+        self.TaskProgressBar.place(anchor='w', width='205', x='128', y='35')
+        self.CancelTaskButton.place(anchor='w', x='30', y='35')
+
+    def closeApplication(self):
+        self.Tasks.shutdown()
+        if self.Session is not None:
+            self.Session.shutdown()
+        self.MainApplication.destroy()
+
+    def timingsToggle(self):
+        if self.VAR_showTimings.get() == 1:
+            self.TimingsLabel.place(anchor='n', relx='0.5', y='548')
+            self.refreshTimings()
+        else:
+            self.TimingsLabel.place_forget()
+
+    def refreshTimings(self):
+        # A single refresh loop, however quickly the readout is toggled
+        if self.timingsRefreshID is not None:
+            self.MainApplication.after_cancel(self.timingsRefreshID)
+            self.timingsRefreshID = None
+
+        if self.VAR_showTimings.get() == 1:
+            self.VAR_timings.set(ICCTTrace.sessionTracer.readout())
+            self.timingsRefreshID = self.MainApplication.after(timingsRefreshMS, self.refreshTimings)
+
+    def exportTimings(self):
+        traceFilename = filedialog.asksaveasfilename(defaultextension='.trace.json',
+                                                     filetypes=[("Chrome Trace", '*.trace.json'),
+                                                                ("JSON Timings", '*.json')])
+        try:
+            if traceFilename != '':
+                ICCTTrace.sessionTracer.exportTrace(traceFilename)
+
+                messagebox.showinfo("Info", "Timings exported successfully!")
+        except Exception as e:
+            log.debug("Exporting the timings failed", exc_info=e)
+            messagebox.showerror("Error", "Error while writing file: %s" % e)
 
     def colourPickerClick(self, clickEvent):
+        if clickEvent.xdata is None or clickEvent.ydata is None:
+            return
+
+        if self.ImageToolbar.mode:
+            return
+
         x, y = int(round(clickEvent.xdata)), int(round(clickEvent.ydata))
-        pickedPixelBGRA = self.ImageBGRA[y, x, :]
+        self.pickerPressXY = (x, y)
+        self.lassoPoints = [(clickEvent.xdata, clickEvent.ydata)]
+
+        self.showPickedColour(self.pickPreviewRegion(x, y, x + 1, y + 1))
+
+    def colourPickerRelease(self, releaseEvent):
+        pressXY, self.pickerPressXY = self.pickerPressXY, None
+
+        if pressXY is None or releaseEvent.xdata is None or releaseEvent.ydata is None:
+            return
+
+        (x0, y0), (x1, y1) = pressXY, (int(round(releaseEvent.xdata)), int(round(releaseEvent.ydata)))
+        (H, W), regionTool = self.fullShape[:2], self.VAR_regionTool.get()
+
+        if (x0, y0) == (x1, y1):
+            return
+
+        # Dragging with a region tool picks the region, otherwise it reports the average colour of the dragged area
+        if regionTool == 'Rectangle':
+            self.setRegion(ICCTEngine.makeRegion('RECT', (min(x0, x1) / W, min(y0, y1) / H,
+                                                          (max(x0, x1) + 1) / W, (max(y0, y1) + 1) / H)))
+        elif regionTool == 'Lasso' and len(self.lassoPoints) >= 3:
+            self.setRegion(ICCTEngine.makeRegion('LASSO', [value for x, y in self.lassoPoints
+                                                           for value in ((x + 0.5) / W, (y + 0.5) / H)]))
+        else:
+            self.showPickedColour(self.pickPreviewRegion(min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1))
+
+    def regionDragEvent(self, motionEvent):
+        # Outlines the region being dragged, in full resolution coordinates like the picker
+        if self.pickerPressXY is None or motionEvent.xdata is None or motionEvent.ydata is None:
+            return
+
+        regionTool = self.VAR_regionTool.get()
+
+        if regionTool == 'Rectangle':
+            (x0, y0), (x1, y1) = self.pickerPressXY, (int(round(motionEvent.xdata)), int(round(motionEvent.ydata)))
+            x0, x1 = min(x0, x1) - 0.5, max(x0, x1) + 0.5
+            y0, y1 = min(y0, y1) - 0.5, max(y0, y1) + 0.5
+            self.ImageRenderer.setOverlay([(x0, y0), (x1, y0), (x1, y1), (x0, y1)], regionOutlineColour)
+        elif regionTool == 'Lasso':
+            (x, y), (lastX, lastY) = (motionEvent.xdata, motionEvent.ydata), self.lassoPoints[-1]
+
+            if max(abs(x - lastX), abs(y - lastY)) >= lassoPointSpacing * max(self.fullShape[:2]):
+                self.lassoPoints.append((x, y))
+                self.ImageRenderer.setOverlay(self.lassoPoints, regionOutlineColour, closed=False)
+
+    def setRegion(self, region):
+        # The steps applied from now on are limited to the region (the whole image when None)
+        self.Region = region
+
+        if region is None:
+            self.ImageRenderer.setOverlay(None)
+        else:
+            (H, W), (shape, coordinates) = self.fullShape[:2], region
+            if shape == 'RECT':
+                x0, y0, x1, y1 = coordinates
+                coordinates = (x0, y0, x1, y0, x1, y1, x0, y1)
+
+            self.ImageRenderer.setOverlay([(x * W - 0.5, y * H - 0.5) for x, y in zip(coordinates[0::2],
+                                                                                   coordinates[1::2])],
+                                          regionOutlineColour)
+
+        self.parameterChangeEvent()
+
+    def regionToolChangeEvent(self, *kwargs):
+        if self.Region is not None:
+            self.setRegion(None)
+
+    def pickPreviewRegion(self, x0, y0, x1, y1):
+        # Region in full resolution coordinates, read from the proxy when a proxy is being previewed
+        if self.PreviewBGRA is self.ImageBGRA:
+            return ICCTColour.averageColour(self.ImageBGRA, x0, y0, x1, y1)
 
-        HSL = colourFmtConv(pickedPixelBGRA, 'hsl')
-        CMYK = colourFmtConv(pickedPixelBGRA, 'cmyk')
-        HEX = colourFmtConv(pickedPixelBGRA, 'hex')
+        (H, W), (h, w) = self.fullShape, self.PreviewBGRA.shape[:2]
+        x0, y0 = min(w - 1, x0 * w // W), min(h - 1, y0 * h // H)
+
+        return ICCTColour.averageColour(self.PreviewBGRA, x0, y0, max(x0 + 1, x1 * w // W), max(y0 + 1, y1 * h // H))
+
+    def showPickedColour(self, pickedPixelBGRA):
+        if len(pickedPixelBGRA) == 3:
+            pickedPixelBGRA = np.append(pickedPixelBGRA, np.uint8(255))
+
+        HSL = ICCTEngine.colourFmtConv(pickedPixelBGRA, 'hsl')
+        CMYK = ICCTEngine.colourFmtConv(pickedPixelBGRA, 'cmyk')
+        HEX = ICCTEngine.colourFmtConv(pickedPixelBGRA, 'hex')
 
         self.VAR_pickerR.set("%03d" % pickedPixelBGRA[2])
         self.VAR_pickerG.set("%03d" % pickedPixelBGRA[1])
@@ -353,13 +1108,101 @@ class ApplicationICCT:
         FG = "#000000" if HSL[2] > 20 else "#ffffff"
         self.PickerSampleCanvas.itemconfig(self.PickerAlphaText, text="Alpha : %d" % pickedPixelBGRA[3], fill=FG)
 
-    def __init__(self):
+    # <| STARTUP |>
+    def windowShown(self):
+        ICCTStartup.milestone('window')
+
+        # The engine & Matplotlib are imported on the worker thread while the window is already up
+        self.Tasks.submit('startup', "Starting", lambda task: ICCTStartup.preloadModules(startupModules, task.progress),
+                          self.startupFinished, self.startupFailed, self.startupFinished, cancellable=False)
+
+    def startupFinished(self, *kwargs):
+        self.ColourIndexes = ICCTPalette.ColourIndexCache()
+        self.ChainStats = ICCTStats.ChainStatsCache()
+        self.Session = ICCTSession.ImageSession(previewProxySize)
+
+        self.SaveSettings = {'preset': ICCTEngine.defaultSavePreset,
+                             'options': dict(ICCTEngine.savePresets[ICCTEngine.defaultSavePreset]),
+                             'extensions': ['.png'], 'scales': [1]}
+
+        self.buildPreview()
+        self.BrowseFileButton.config(state='enabled')
+
+        self.MainApplication.after_idle(self.startupReady)
+
+    def startupReady(self):
+        ICCTStartup.milestone('ready')
+
+        if self.quitAfterStartup:
+            print(ICCTStartup.report())
+            self.closeApplication()
+
+    def startupFailed(self, error):
+        log.debug("Startup failed", exc_info=error)
+        messagebox.showerror("Error", "Error while starting: %s" % error)
+        self.closeApplication()
+
+    def buildPreview(self):
+        self.ImageFigure = mplFigure.Figure(figsize=(10.0625, 8.3125), dpi=80)
+
+        self.ImageCanvas = ICCTRender.TracedFigureCanvasTkAgg(self.ImageFigure, self.PreviewFrame)
+        self.ImageCanvas.get_tk_widget().pack(padx=5)
+        self.ImageRenderer = ICCTRender.PreviewRenderer(self.ImageFigure, self.ImageCanvas, self.renderInBackground)
+        self.ImageToolbar = mplBackend.NavigationToolbar2Tk(self.ImageCanvas, self.PreviewFrame)
+        self.ImageToolbar.config(padx=5)
+        self.ImageToolbar.update()
+        self.ImageCanvas.get_tk_widget().pack()
+
+        self.VisualizerButton = ttk.Button(self.ImageToolbar, command=self.visualizeImage)
+        self.VisualizerButton.config(text='Visualize', width='12', state='disabled')
+        self.VisualizerButton.place(anchor='w', relx='0.5', rely='0.5')
+
+        self.TimingsCheckBox = ttk.Checkbutton(self.ImageToolbar, text='Timings')
+        self.TimingsCheckBox.config(variable=self.VAR_showTimings, command=self.timingsToggle)
+        self.TimingsCheckBox.place(anchor='w', relx='0.5', rely='0.5', x='100')
+
+        self.ExportTimingsButton = ttk.Button(self.ImageToolbar, command=self.exportTimings)
+        self.ExportTimingsButton.config(text='Export Timings', width='14')
+        self.ExportTimingsButton.place(anchor='w', relx='0.5', rely='0.5', x='175')
+
+        self.StatisticsCheckBox = ttk.Checkbutton(self.ImageToolbar, text='Statistics')
+        self.StatisticsCheckBox.config(variable=self.VAR_showStatistics, command=self.statisticsToggle)
+        self.StatisticsCheckBox.place(anchor='w', relx='0.5', rely='0.5', x='285')
+
+    def __init__(self, quitAfterStartup=False):
         self.ImageBGRA = None
         self.ImageOriginal = None
+        self.FilterChain = []
+        self.fullShape = None
+
+        self.ProxyOriginal = None
+        self.ProxyBGRA = None
+        self.PreviewBGRA = None
+        self.PreviewChain = ()
+        self.fullResStale = False
+        self.realisedChain = ()
+        self.liveUpdateID = None
+        self.timingsRefreshID = None
+        self.matchCountID = None
+
+        self.History = None
+        self.SpecificColours = []
+        self.StatisticsWindow = None
+        self.SessionImage = None
+
+        # Created by the startup task, once the engine is imported
+        self.ColourIndexes = None
+        self.ChainStats = None
+        self.Session = None
+        self.SaveSettings = None
+
+        self.quitAfterStartup = quitAfterStartup
 
         self.MainApplication = tk.Tk()
         self.MainApplicationFrame = ttk.Frame(self.MainApplication)
 
+        self.Tasks = ICCTTasks.TaskRunner(self.MainApplication.after, self.showTaskProgress)
+
         # <| METADATA DISPLAY FOR THE APPLICATION |>
         self.AppNameLabel = ttk.Label(self.MainApplicationFrame)
         self.AppNameLabel.config(anchor='w', font='{Arial} 20 {bold}', text='Image Colour Channel Tool')
@@ -377,21 +1220,28 @@ class ApplicationICCT:
         # <| FRAME FOR IMAGE PREVIEW |>
         self.PreviewFrame = ttk.Labelframe(self.MainApplicationFrame)
 
-        self.ImageFigure = Figure(figsize=(10.0625, 8.3125), dpi=80)
+        self.ImageFigure = None
+        self.ImageCanvas = None
+        self.ImageRenderer = None
+        self.ImageToolbar = None
         self.ImagePlot = None
 
         self.pickerClickPID = None
+        self.pickerReleasePID = None
+        self.regionDragPID = None
+        self.pickerPressXY = None
 
-        self.ImageCanvas = FigureCanvasTkAgg(self.ImageFigure, self.PreviewFrame)
-        self.ImageCanvas.get_tk_widget().pack(padx=5)
-        self.ImageToolbar = NavigationToolbar2Tk(self.ImageCanvas, self.PreviewFrame)
-        self.ImageToolbar.config(padx=5)
-        self.ImageToolbar.update()
-        self.ImageCanvas.get_tk_widget().pack()
+        self.Region = None
+        self.lassoPoints = []
 
-        self.VisualizerButton = ttk.Button(self.ImageToolbar, command=self.visualizeImage)
-        self.VisualizerButton.config(text='Visualize', width='12', state='disabled')
-        self.VisualizerButton.place(anchor='w', relx='0.5', rely='0.5')
+        # The figure, its toolbar & the buttons on it are built by buildPreview once Matplotlib is imported
+        self.VisualizerButton = None
+
+        self.VAR_showTimings = tk.IntVar()
+        self.VAR_showTimings.set(0)
+
+        self.VAR_showStatistics = tk.IntVar()
+        self.VAR_showStatistics.set(0)
 
         self.PreviewFrame.config(height='715', text='Image Preview', width='850')
         self.PreviewFrame.pack(padx='5', pady='5', side='right')
@@ -411,32 +1261,67 @@ class ApplicationICCT:
         self.VAR_fileName.set('No file selected')
         self.FilePathEntry = ttk.Entry(self.ControlFrame, textvariable=self.VAR_fileName)
         self.FilePathEntry.config(state='readonly', justify='center')
-        self.FilePathEntry.place(anchor='w', width='255', x='100', y='35')
+        self.FilePathEntry.place(anchor='w', width='205', x='128', y='35')
+
+        self.PreviousImageButton = ttk.Button(self.ControlFrame, command=self.previousImage)
+        self.PreviousImageButton.config(state='disabled', text='<')
+        self.PreviousImageButton.place(anchor='w', width='25', x='100', y='35')
+
+        self.NextImageButton = ttk.Button(self.ControlFrame, command=self.nextImage)
+        self.NextImageButton.config(state='disabled', text='>')
+        self.NextImageButton.place(anchor='w', width='25', x='336', y='35')
 
         self.ClearFileButton = ttk.Button(self.ControlFrame, command=self.setDefaults)
         self.ClearFileButton.config(state='disabled', text='X', width='3')
         self.ClearFileButton.place(anchor='e', x='395', y='35')
 
+        # Shown over the file controls while a task runs on the worker thread
+        self.CancelTaskButton = ttk.Button(self.ControlFrame, command=self.cancelImageTask)
+        self.CancelTaskButton.config(text='Cancel', width='8')
+
+        self.TaskProgressBar = ttk.Progressbar(self.ControlFrame, orient='horizontal', maximum=100)
+
         self.ModeTextLabel = ttk.Label(self.ControlFrame, text='Effect Mode')
-        self.ModeTextLabel.place(anchor='w', x='100', y='95')
+        self.ModeTextLabel.place(anchor='w', x='25', y='95')
 
         self.VAR_operationMode = tk.StringVar('')
         self.VAR_operationMode.trace('w', self.modeChangeEvent)
 
-        self.ModeOptionMenu = ttk.Combobox(self.ControlFrame, state='readonly', width='20')
+        self.ModeOptionMenu = ttk.Combobox(self.ControlFrame, state='readonly', width='13')
         self.ModeOptionMenu.config(values=list(applicationOperations.keys()), textvariable=self.VAR_operationMode)
-        self.ModeOptionMenu.place(anchor='e', x='330', y='95')
+        self.ModeOptionMenu.place(anchor='w', x='100', y='95')
+
+        self.RegionTextLabel = ttk.Label(self.ControlFrame, text='Region')
+        self.RegionTextLabel.place(anchor='w', x='240', y='95')
+
+        self.VAR_regionTool = tk.StringVar('')
+        self.VAR_regionTool.set(regionTools[0])
+        self.VAR_regionTool.trace('w', self.regionToolChangeEvent)
+
+        self.RegionOptionMenu = ttk.Combobox(self.ControlFrame, state='readonly', width='11')
+        self.RegionOptionMenu.config(values=list(regionTools), textvariable=self.VAR_regionTool)
+        self.RegionOptionMenu.place(anchor='e', x='400', y='95')
 
         self.VAR_cumulative = tk.IntVar()
         self.VAR_cumulative.set(0)
 
         self.CumulativeCheckBox = ttk.Checkbutton(self.ControlFrame, text='Cumulative Filters')
-        self.CumulativeCheckBox.config(variable=self.VAR_cumulative)
-        self.CumulativeCheckBox.place(anchor='center', relx='0.5', y='130')
+        self.CumulativeCheckBox.config(variable=self.VAR_cumulative, command=self.parameterChangeEvent)
+        self.CumulativeCheckBox.place(anchor='center', x='135', y='130')
+
+        self.VAR_livePreview = tk.IntVar()
+        self.VAR_livePreview.set(0)
+
+        self.LivePreviewCheckBox = ttk.Checkbutton(self.ControlFrame, text='Live Preview')
+        self.LivePreviewCheckBox.config(variable=self.VAR_livePreview, command=self.livePreviewToggle)
+        self.LivePreviewCheckBox.place(anchor='center', x='295', y='130')
 
         self.VAR_filterR = tk.IntVar()
         self.VAR_filterG = tk.IntVar()
         self.VAR_filterB = tk.IntVar()
+        self.VAR_filterR.trace('w', self.parameterChangeEvent)
+        self.VAR_filterG.trace('w', self.parameterChangeEvent)
+        self.VAR_filterB.trace('w', self.parameterChangeEvent)
 
         self.RedChannelScale = ttk.Scale(self.ControlFrame)
         self.RedChannelScale.config(length=256, orient='horizontal', variable=self.VAR_filterR)
@@ -462,6 +1347,24 @@ class ApplicationICCT:
         self.BlueChannelEntry = ttk.Entry(self.ControlFrame, width='5', textvariable=self.VAR_filterB)
         self.BlueChannelEntry.place(anchor='w', x='355', y='245')
 
+        # <| SPECIFIC MODE: MATCH TOLERANCE, EXTRA COLOURS & MATCHING PIXEL COUNT |>
+        self.VAR_tolerance = tk.IntVar()
+        self.VAR_tolerance.trace('w', self.parameterChangeEvent)
+        self.VAR_matchCount = tk.StringVar("")
+
+        self.ToleranceLabel = ttk.Label(self.ControlFrame, text='Tolerance')
+        self.ToleranceLabel.place(anchor='e', x='65', y='278')
+        self.ToleranceSpinbox = ttk.Spinbox(self.ControlFrame, from_=0, to=maxColourTolerance, width='4')
+        self.ToleranceSpinbox.config(textvariable=self.VAR_tolerance)
+        self.ToleranceSpinbox.place(anchor='w', x='80', y='278')
+
+        self.AddColourButton = ttk.Button(self.ControlFrame, text='Add Colour', command=self.addSpecificColour)
+        self.AddColourButton.place(anchor='w', width='95', x='135', y='278')
+
+        self.MatchCountLabel = ttk.Label(self.ControlFrame, textvariable=self.VAR_matchCount)
+        self.MatchCountLabel.config(font=('TkDefaultFont', 8))
+        self.MatchCountLabel.place(anchor='e', x='400', y='278')
+
         self.ProcessButton = ttk.Button(self.ControlFrame, text='Apply Parameters', command=self.applyImageFilter)
         self.ProcessButton.place(anchor='w', width='150', x='60', y='310')
 
@@ -469,7 +1372,19 @@ class ApplicationICCT:
         self.ResetButton.place(anchor='e', width='150', x='370', y='310')
 
         self.SaveButton = ttk.Button(self.ControlFrame, text='Save Current Preview', command=self.saveImagePreview)
-        self.SaveButton.place(anchor='w', width='310', x='60', y='345')
+        self.SaveButton.place(anchor='w', width='150', x='60', y='345')
+
+        self.UndoButton = ttk.Button(self.ControlFrame, text='Undo', command=self.undoImageFilter)
+        self.UndoButton.place(anchor='e', width='72', x='292', y='345')
+
+        self.RedoButton = ttk.Button(self.ControlFrame, text='Redo', command=self.redoImageFilter)
+        self.RedoButton.place(anchor='e', width='72', x='370', y='345')
+
+        self.MainApplication.bind('<Control-z>', self.undoImageFilter)
+        self.MainApplication.bind('<Control-y>', self.redoImageFilter)
+        self.MainApplication.bind('<Escape>', self.cancelImageTask)
+        self.MainApplication.bind('<Prior>', self.previousImage)
+        self.MainApplication.bind('<Next>', self.nextImage)
 
         # <| FRAME TO DISPLAY COLOR PICKER OUTPUT |>
         self.PickerFrame = ttk.Labelframe(self.ControlFrame)
@@ -538,9 +1453,14 @@ class ApplicationICCT:
         self.PickerHexValueLabel.config(textvariable=self.VAR_pickerHEX)
         self.PickerHexValueLabel.place(anchor='w', x='75', y='140')
 
-        self.PickerFrame.config(height='200', text='Picker', width='420')
+        self.PickerFrame.config(height='170', text='Picker', width='420')
         self.PickerFrame.place(anchor='n', relx='0.5', x=0, y='372')
 
+        # <| LAST TIMING OF EVERY STAGE, SHOWN WHEN TIMINGS IS CHECKED |>
+        self.VAR_timings = tk.StringVar("")
+        self.TimingsLabel = ttk.Label(self.ControlFrame, textvariable=self.VAR_timings)
+        self.TimingsLabel.config(font=('TkDefaultFont', 8), wraplength='410', justify='center')
+
         self.ControlFrame.config(height='595', text='Controls', width='430')
         self.ControlFrame.pack(padx='5', pady='5', side='bottom')
 
@@ -550,11 +1470,19 @@ class ApplicationICCT:
         self.MainApplicationFrame.pack(side='top')
 
         self.MainApplication.title("ICCT")
+        self.MainApplication.protocol('WM_DELETE_WINDOW', self.closeApplication)
 
     def run(self):
+        # Idle callbacks run once the window has been mapped & drawn
+        self.MainApplication.after_idle(self.windowShown)
         self.MainApplication.mainloop()
 
 
 if __name__ == '__main__':
-    app = ApplicationICCT()
+    parser = argparse.ArgumentParser(prog='ICCT', description='Image Colour Channel Tool')
+    parser.add_argument('--startup-report', action='store_true', dest='startupReport',
+                        help='print the startup times once the application is ready, then quit (cold start check)')
+    args = parser.parse_args()
+
+    app = ApplicationICCT(args.startupReport)
     app.run()
@@ -0,0 +1,178 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ICCTEngine
+import ICCTTiled
+
+# Every output directory keeps the settings each of its outputs was built with, so that outputs built with another
+# filter chain or other encoder settings are not taken for up to date
+manifestName = '.icctbatch.json'
+
+
+def collectInputs(sources):
+    inputPaths = []
+
+    for source in sources:
+        if os.path.isdir(source):
+            candidates = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+        else:
+            candidates = sorted(glob.glob(source))
+
+        inputPaths.extend(path for path in candidates
+                          if os.path.isfile(path) and path.lower().endswith(ICCTEngine.imageExtensions))
+
+    return inputPaths
+
+
+def outputPathFor(inputPath, outputDir, outputExt):
+    baseName, inputExt = os.path.splitext(os.path.basename(inputPath))
+    return os.path.join(outputDir, baseName + (outputExt or inputExt))
+
+
+def batchSettingsKey(filterChain, saveOptions=None):
+    settings = {'filters': [ICCTEngine.formatFilterStep(filterStep) for filterStep in filterChain],
+                'options': saveOptions or {}}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def loadManifest(outputDir):
+    try:
+        with open(os.path.join(outputDir, manifestName)) as manifestFile:
+            manifest = json.load(manifestFile)
+    except (OSError, ValueError):
+        return {}
+
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def saveManifest(outputDir, manifest):
+    manifestPath = os.path.join(outputDir, manifestName)
+
+    with open(manifestPath + '.tmp', 'w') as manifestFile:
+        json.dump(manifest, manifestFile, indent=1, sort_keys=True)
+    os.replace(manifestPath + '.tmp', manifestPath)
+
+
+def isUpToDate(inputPath, outputPath, settingsKey, manifest):
+    return os.path.exists(outputPath) and os.path.getmtime(outputPath) >= os.path.getmtime(inputPath) and \
+        manifest.get(os.path.basename(outputPath)) == settingsKey
+
+
+def processImage(job):
+    inputPath, outputPath, filterChain, memoryBudgetMB, saveOptions = job
+
+    try:
+        if memoryBudgetMB:
+            ICCTTiled.processImageTiled(inputPath, outputPath, filterChain, memoryBudgetMB, saveOptions)
+        else:
+            ImageBGRA = ICCTEngine.loadImage(inputPath)
+            ICCTEngine.saveImage(outputPath, ICCTEngine.applyFilterChain(ImageBGRA, filterChain, ImageBGRA),
+                                 saveOptions)
+    except Exception as e:
+        return inputPath, str(e)
+
+    return inputPath, None
+
+
+def runBatch(inputPaths, outputDir, filterChain, outputExt=None, workers=None, force=False, memoryBudgetMB=None,
+             saveOptions=None, log=print):
+    os.makedirs(outputDir, exist_ok=True)
+
+    settingsKey = batchSettingsKey(filterChain, saveOptions)
+    manifest = loadManifest(outputDir)
+
+    jobs = []
+    skipped = 0
+    for inputPath in inputPaths:
+        outputPath = outputPathFor(inputPath, outputDir, outputExt)
+
+        if not force and isUpToDate(inputPath, outputPath, settingsKey, manifest):
+            skipped += 1
+        else:
+            jobs.append((inputPath, outputPath, filterChain, memoryBudgetMB, saveOptions))
+
+    failed = 0
+    startTime = time.perf_counter()
+
+    if jobs:
+        workers = workers or os.cpu_count() or 1
+        chunkSize = max(1, len(jobs) // (workers * 8))
+
+        outputPaths = {job[0]: job[1] for job in jobs}
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for inputPath, error in executor.map(processImage, jobs, chunksize=chunkSize):
+                    if error is not None:
+                        failed += 1
+                        manifest.pop(os.path.basename(outputPaths[inputPath]), None)
+                        log("Failed: %s (%s)" % (inputPath, error))
+                    else:
+                        manifest[os.path.basename(outputPaths[inputPath])] = settingsKey
+        finally:
+            saveManifest(outputDir, manifest)
+
+    elapsed = time.perf_counter() - startTime
+    processed = len(jobs) - failed
+
+    log("Processed %d image(s), skipped %d up-to-date, %d failed in %.2f s (%.1f images/s)" %
+        (processed, skipped, failed, elapsed, processed / elapsed if elapsed > 0 else 0.0))
+
+    return processed, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ICCTBatch',
+                                     description='Apply an ICCT filter chain to a directory or glob of images')
+    parser.add_argument('inputs', nargs='+', help='input directories and / or glob patterns')
+    parser.add_argument('-o', '--output', required=True, help='output directory')
+    parser.add_argument('-f', '--filter', action='append', default=[], dest='filters', metavar='MODE:R,G,B',
+                        help='filter step, applied in the given order (e.g. Adjust:20,10 or Greyscale). A suffix '
+                             '@rect:x0,y0,x1,y1 or @lasso:x1,y1,x2,y2,... limits it to a region (fractions of the '
+                             'width / height, e.g. Inverse:255@rect:0,0,0.5,0.5)')
+    parser.add_argument('-e', '--ext', default=None, help='output extension (default: same as input)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='reprocess images whose output is up to date')
+    parser.add_argument('-m', '--memory-budget', type=int, default=None, metavar='MB',
+                        help='read, filter & write each image in strips, keeping the memory of each worker near MB '
+                             'megabytes (PPM / BMP inputs, PNG / BMP / PPM outputs; other images that do not fit are '
+                             'refused)')
+    parser.add_argument('-p', '--preset', choices=list(ICCTEngine.savePresets), default=None,
+                        help='encoder settings preset (default: the encoder defaults)')
+    parser.add_argument('--png-compression', type=int, choices=range(10), default=None, metavar='0-9',
+                        help='PNG compression level (0 encodes fastest, 1 is the encoder default)')
+    parser.add_argument('--jpeg-quality', type=int, choices=range(101), default=None, metavar='0-100',
+                        help='JPEG quality')
+    args = parser.parse_args(argv)
+
+    try:
+        filterChain = [ICCTEngine.parseFilterStep(step) for step in args.filters]
+    except ValueError as e:
+        parser.error(str(e))
+
+    saveOptions = dict(ICCTEngine.savePresets[args.preset]) if args.preset else {}
+    if args.png_compression is not None:
+        saveOptions['pngCompression'] = args.png_compression
+    if args.jpeg_quality is not None:
+        saveOptions['jpegQuality'] = args.jpeg_quality
+
+    outputExt = args.ext if args.ext is None or args.ext.startswith('.') else '.' + args.ext
+
+    inputPaths = collectInputs(args.inputs)
+    if not inputPaths:
+        parser.error("No input images found")
+
+    processed, skipped, failed = runBatch(inputPaths, args.output, filterChain, outputExt, args.workers, args.force,
+                                          args.memory_budget, saveOptions)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
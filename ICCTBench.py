@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import ICCTEngine
+import ICCTParallel
+import ICCTRender
+import ICCTVisualizer
+
+defaultSizesMP = (1, 4, 12, 24, 50, 100)
+defaultRepeats = 3
+defaultThreshold = 0.10
+benchmarkSeed = 1234
+benchmarkPreviewSize = (800, 650)
+
+# Representative parameters of every mode, (R, G, B) as set by the sliders of the GUI
+benchmarkFilterParams = {'ADJUST': (20, 15, 0),
+                         'SPECIFIC': (128, 128, 128),
+                         'INTENSITY': (30, -20, 10),
+                         'GREYSCALE': (0, 0, 0),
+                         'INVERSE': (255, 0, 0),
+                         'CEILING': (200, 220, 240),
+                         'FLOOR': (20, 30, 40),
+                         'HUE': (45, 0, 0),
+                         'SATURATION': (-30, 0, 0),
+                         'LIGHTNESS': (10, 10, 0)}
+benchmarkChain = [('ADJUST', (10, 20, 0)), ('INTENSITY', (5, -5, 10)), ('INVERSE', (100, 0, 0)),
+                  ('CEILING', (250, 250, 250)), ('ADJUST', (-5, 0, 0))]
+
+# Local touch-ups: a sixteenth of the image and a lasso
+benchmarkRegionChain = [ICCTEngine.limitStepToRegion(('HUE', (45, 0, 0)),
+                                                     ICCTEngine.makeRegion('RECT', (0.25, 0.25, 0.5, 0.5))),
+                        ICCTEngine.limitStepToRegion(('ADJUST', (20, 15, 0)),
+                                                     ICCTEngine.makeRegion('LASSO', (0.6, 0.1, 0.9, 0.3, 0.7, 0.4)))]
+
+benchmarkGroups = ('filter', 'chain', 'decode', 'render', 'visualizer', 'encode')
+
+
+# <| PEAK MEMORY |>
+# On Linux the peak RSS (VmHWM) can be reset by writing 5 to /proc/self/clear_refs, giving the peak of every single
+# case. Elsewhere the process-wide peak from getrusage is reported
+def resetPeakRSS():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clearRefs:
+            clearRefs.write('5')
+    except OSError:
+        pass
+
+
+def readPeakRSS():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# <| SYNTHETIC IMAGES |>
+def imageShapeFor(sizeMP):
+    W = int(round((sizeMP * 1e6 * 4 / 3) ** 0.5))
+    return int(round(W * 3 / 4)), W
+
+
+def syntheticImage(sizeMP, alpha, seed=benchmarkSeed):
+    # Smooth colour fields plus noise, so that the encoders see photo-like rather than random or flat data
+    rng = np.random.default_rng(seed)
+    H, W = imageShapeFor(sizeMP)
+    channels = 4 if alpha else 3
+
+    Base = cv2.resize(rng.integers(0, 256, (24, 32, channels), dtype=np.uint8), (W, H),
+                      interpolation=cv2.INTER_CUBIC)
+    Noise = rng.integers(0, 16, (H, W, channels), dtype=np.uint8)
+
+    return cv2.add(Base, Noise).reshape(H, W, channels)
+
+
+# <| CASES |>
+# Every case is (name, setup, run): setup is called once per image and returns the argument of run, which is timed
+def filterCases():
+    for mode, (R, G, B) in benchmarkFilterParams.items():
+        yield 'filter:%s' % mode.capitalize(), lambda Image: Image, \
+            lambda Image, mode=mode, R=R, G=G, B=B: ICCTEngine.applyFilter(Image, mode, R, G, B)
+
+
+def chainCases():
+    yield 'chain:compiled', lambda Image: Image, lambda Image: ICCTEngine.applyFilterChain(Image, benchmarkChain)
+    yield 'chain:cumulative', lambda Image: Image, \
+        lambda Image: ICCTEngine.applyFilterChainStepwise(Image, benchmarkChain)
+    yield 'chain:parallel', lambda Image: Image, \
+        lambda Image: ICCTParallel.applyFilterChainParallel(Image, benchmarkChain)
+    yield 'chain:region', lambda Image: Image, lambda Image: ICCTEngine.applyFilterChain(Image, benchmarkRegionChain)
+
+
+def encodedImage(Image, extension, tempDir):
+    imagePath = os.path.join(tempDir, 'decode%s' % extension)
+    ICCTEngine.saveImage(imagePath, Image)
+    return imagePath
+
+
+def decodeCases(tempDir):
+    for extension in ('.png', '.jpg'):
+        yield 'decode:%s' % extension[1:], \
+            lambda Image, extension=extension: encodedImage(Image, extension, tempDir), ICCTEngine.loadImage
+
+    # Time to the first preview of the GUI, JPEGs being decoded at a reduced scale
+    yield 'decode:jpg-preview', lambda Image: encodedImage(Image, '.jpg', tempDir), \
+        lambda imagePath: ICCTEngine.loadPreview(imagePath, *benchmarkPreviewSize)
+
+
+def renderImage(Image):
+    # The preview of the GUI (same figure size & dpi) drawn on an Agg canvas
+    figure = Figure(figsize=(10.0625, 8.3125), dpi=80)
+    canvas = FigureCanvasAgg(figure)
+
+    ICCTRender.PreviewRenderer(figure, canvas).setImage(Image, Image.shape)
+    canvas.draw()
+
+
+def renderCases():
+    yield 'render:preview', lambda Image: Image, renderImage
+
+
+def visualizeImage(Image, view):
+    figure = Figure(figsize=(13.5, 8), dpi=80)
+    canvas = FigureCanvasAgg(figure)
+
+    ICCTVisualizer.VisualizerFigure(figure, Image).plotView(view)
+    canvas.draw()
+
+
+def visualizerCases():
+    for view in ICCTVisualizer.visualizerViews:
+        yield 'visualizer:%s' % view.lower().replace(' ', '-'), lambda Image: Image, \
+            lambda Image, view=view: visualizeImage(Image, view)
+
+
+def encodeCases(tempDir):
+    for extension in ('.png', '.jpg'):
+        yield 'encode:%s' % extension[1:], lambda Image: Image, \
+            lambda Image, extension=extension: ICCTEngine.saveImage(os.path.join(tempDir, 'encode%s' % extension),
+                                                                    Image)
+
+        for preset, saveOptions in ICCTEngine.savePresets.items():
+            yield 'encode:%s-%s' % (extension[1:], preset.lower()), lambda Image: Image, \
+                lambda Image, extension=extension, saveOptions=saveOptions: \
+                ICCTEngine.saveImage(os.path.join(tempDir, 'encode%s' % extension), Image, saveOptions)
+
+    yield 'encode:png+jpg-targets', lambda Image: Image, \
+        lambda Image: ICCTEngine.saveImageTargets(Image, [(os.path.join(tempDir, 'targets.png'), 1),
+                                                          (os.path.join(tempDir, 'targets.jpg'), 1),
+                                                          (os.path.join(tempDir, 'targets_50.jpg'), 0.5)],
+                                                  ICCTEngine.savePresets['Fast'])
+
+
+def benchmarkCases(groups, tempDir):
+    caseGenerators = {'filter': filterCases,
+                      'chain': chainCases,
+                      'decode': lambda: decodeCases(tempDir),
+                      'render': renderCases,
+                      'visualizer': visualizerCases,
+                      'encode': lambda: encodeCases(tempDir)}
+
+    for group in groups:
+        yield from caseGenerators[group]()
+
+
+def timeCase(run, argument, repeats):
+    times = []
+
+    resetPeakRSS()
+    for repeat in range(repeats):
+        startTime = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - startTime)
+
+    return times, readPeakRSS()
+
+
+# <| RESULTS |>
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environmentInfo():
+    return {'commit': gitCommit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'matplotlib': matplotlib.__version__,
+            'cpu_count': os.cpu_count()}
+
+
+def resultKey(result):
+    return result['case'], result['size_mp'], result['alpha']
+
+
+def runBenchmarks(sizesMP, alphaModes, groups, repeats, log=print):
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix='icct-bench-') as tempDir:
+        for sizeMP in sizesMP:
+            for alpha in alphaModes:
+                Image = syntheticImage(sizeMP, alpha)
+                megapixels = Image.shape[0] * Image.shape[1] / 1e6
+
+                for name, setup, run in benchmarkCases(groups, tempDir):
+                    times, peakRSS = timeCase(run, setup(Image), repeats)
+                    wallTime = statistics.median(times)
+
+                    results.append({'case': name,
+                                    'size_mp': sizeMP,
+                                    'alpha': alpha,
+                                    'shape': list(Image.shape),
+                                    'repeats': repeats,
+                                    'wall_s': wallTime,
+                                    'min_s': min(times),
+                                    'mp_per_s': megapixels / wallTime if wallTime > 0 else None,
+                                    'peak_rss_mb': peakRSS})
+
+                    log("%-24s %6g MP %-8s %9.4f s %9.1f MP/s %9.0f MB" %
+                        (name, sizeMP, 'BGRA' if alpha else 'BGR', wallTime, results[-1]['mp_per_s'] or 0, peakRSS))
+
+                del Image
+
+    return results
+
+
+def compareResults(results, baseline, threshold, log=print):
+    # Returns the cases whose median wall time grew by more than threshold (a fraction) relative to the baseline
+    baselineResults = {resultKey(result): result for result in baseline['results']}
+    regressions = []
+
+    for result in results:
+        previous = baselineResults.get(resultKey(result))
+
+        if previous is None or not previous['wall_s']:
+            continue
+
+        ratio = result['wall_s'] / previous['wall_s']
+        flag = ''
+
+        if ratio > 1 + threshold:
+            regressions.append((result, previous, ratio))
+            flag = 'REGRESSION'
+
+        log("%-24s %6g MP %-8s %9.4f s -> %9.4f s  x%.2f %s" %
+            (result['case'], result['size_mp'], 'BGRA' if result['alpha'] else 'BGR', previous['wall_s'],
+             result['wall_s'], ratio, flag))
+
+    return regressions
+
+
+def parseList(text, convert=str):
+    return [convert(item.strip()) for item in text.split(',') if item.strip() != '']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ICCTBench',
+                                     description='Benchmark the ICCT filters, decode, render, visualizer & encode on '
+                                                 'synthetic images (headless)')
+    parser.add_argument('-s', '--sizes', default=','.join(str(size) for size in defaultSizesMP),
+                        help='comma separated image sizes in megapixels (default: %(default)s)')
+    parser.add_argument('-a', '--alpha', choices=('both', 'yes', 'no'), default='both',
+                        help='benchmark images with and / or without an alpha channel (default: %(default)s)')
+    parser.add_argument('-c', '--cases', default=','.join(benchmarkGroups),
+                        help='comma separated case groups (default: %(default)s)')
+    parser.add_argument('-r', '--repeats', type=int, default=defaultRepeats,
+                        help='timed repeats per case, the median is reported (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against the JSON results of another run')
+    parser.add_argument('--threshold', type=float, default=defaultThreshold,
+                        help='slowdown (fraction) reported as a regression by --compare (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    groups = parseList(args.cases)
+    unknownGroups = [group for group in groups if group not in benchmarkGroups]
+    if unknownGroups:
+        parser.error("Unknown case groups: %s" % ', '.join(unknownGroups))
+
+    alphaModes = {'both': (False, True), 'yes': (True,), 'no': (False,)}[args.alpha]
+
+    report = {'environment': environmentInfo(),
+              'results': runBenchmarks(parseList(args.sizes, float if '.' in args.sizes else int), alphaModes,
+                                       groups, args.repeats)}
+
+    if args.output:
+        with open(args.output, 'w') as outputFile:
+            json.dump(report, outputFile, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            regressions = compareResults(report['results'], json.load(baselineFile), args.threshold)
+
+        if regressions:
+            print("%d regression(s) above %.0f%%" % (len(regressions), args.threshold * 100))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import ICCTServer
+
+# Stand-in client of ICCTServer: processes images through the service, optionally many times over from several
+# threads to load it (busy responses are retried after the Retry-After the server asks for)
+defaultServerURL = 'http://%s:%d' % (ICCTServer.defaultHost, ICCTServer.defaultPort)
+maxBusyRetries = 100
+
+
+def request(url, data=None, headers=None):
+    # Returns (status, headers, body), HTTP errors included
+    try:
+        with urlopen(Request(url, data=data, headers=headers or {}), timeout=ICCTServer.defaultRequestTimeout) as reply:
+            return reply.status, reply.headers, reply.read()
+    except HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def submitRequest(url, data, headers):
+    for attempt in range(maxBusyRetries):
+        status, replyHeaders, body = request(url, data, headers)
+
+        if status != 503:
+            return status, replyHeaders, body
+
+        time.sleep(float(replyHeaders.get('Retry-After', ICCTServer.retryAfterSeconds)))
+
+    return status, replyHeaders, body
+
+
+def processImage(serverURL, imagePath, filters, outputFormat=None, preset=None, runAsync=False):
+    # Uploads the image, returns (status, headers, body) of the processed image (or of the job when runAsync)
+    query = [('filter', filterStep) for filterStep in filters]
+    query += [(key, value) for key, value in (('format', outputFormat), ('preset', preset)) if value is not None]
+    if runAsync:
+        query.append(('async', '1'))
+
+    with open(imagePath, 'rb') as imageFile:
+        imageData = imageFile.read()
+
+    return submitRequest('%s/process?%s' % (serverURL, urlencode(query)), imageData,
+                         {'Content-Type': 'application/octet-stream'})
+
+
+def processPath(serverURL, imagePath, filters, outputPath=None, outputFormat=None, preset=None, runAsync=False):
+    # Has the service read (and write) the image on a disk shared with it
+    body = {'path': os.path.abspath(imagePath), 'filters': filters, 'format': outputFormat, 'preset': preset,
+            'async': runAsync}
+    if outputPath is not None:
+        body['output'] = os.path.abspath(outputPath)
+
+    return submitRequest('%s/process' % serverURL, json.dumps(body).encode(), {'Content-Type': 'application/json'})
+
+
+def jobResult(serverURL, jobID, wait=ICCTServer.defaultRequestTimeout):
+    return request('%s/jobs/%s?wait=%g' % (serverURL, jobID, wait))
+
+
+def metrics(serverURL):
+    status, headers, body = request('%s/metrics' % serverURL)
+    return json.loads(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ICCTClient', description='Process images through an ICCTServer')
+    parser.add_argument('image', nargs='?', help='image to process')
+    parser.add_argument('-o', '--output', default=None, help='where to write the processed image')
+    parser.add_argument('-f', '--filter', action='append', default=[], dest='filters', metavar='MODE:R,G,B',
+                        help='filter step, applied in the given order (e.g. Adjust:20,10 or Greyscale). A suffix '
+                             '@rect:x0,y0,x1,y1 or @lasso:x1,y1,x2,y2,... limits it to a region (fractions of the '
+                             'width / height, e.g. Inverse:255@rect:0,0,0.5,0.5)')
+    parser.add_argument('-s', '--server', default=defaultServerURL, help='service URL (default: %s)' % defaultServerURL)
+    parser.add_argument('--format', default=None, help='output format (default: png, or that of a --path image)')
+    parser.add_argument('--preset', default=None, help='encoder preset (Fast, Default or Small)')
+    parser.add_argument('--path', action='store_true', help='send the path of the image instead of the image')
+    parser.add_argument('--async', action='store_true', dest='runAsync', help='submit as a job, then fetch the result')
+    parser.add_argument('-n', '--repeat', type=int, default=1, help='process the image N times (load testing)')
+    parser.add_argument('-c', '--concurrency', type=int, default=1, help='requests in flight while repeating')
+    parser.add_argument('--metrics', action='store_true', help='print the metrics of the service (at the end)')
+    args = parser.parse_args(argv)
+
+    if args.image is None and not args.metrics:
+        parser.error("an image or --metrics is required")
+
+    def processOnce(index):
+        if args.path:
+            outputPath = args.output if args.repeat == 1 else None
+            status, headers, body = processPath(args.server, args.image, args.filters, outputPath, args.format,
+                                                args.preset, args.runAsync)
+        else:
+            status, headers, body = processImage(args.server, args.image, args.filters, args.format, args.preset,
+                                                 args.runAsync)
+
+        if status == 202:
+            status, headers, body = jobResult(args.server, json.loads(body)['job'])
+
+        return status, headers, body
+
+    failed = 0
+
+    if args.image is not None:
+        startTime = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            replies = list(executor.map(processOnce, range(args.repeat)))
+
+        elapsed = time.perf_counter() - startTime
+
+        for status, headers, body in replies:
+            if status != 200 or headers.get('Content-Type') == 'application/json' and b'"failed"' in body:
+                failed += 1
+                print("Failed (%d): %s" % (status, body.decode(errors='replace')))
+
+        status, headers, body = replies[-1]
+        if status == 200 and args.output is not None and headers.get('Content-Type', '').startswith('image/'):
+            with open(args.output, 'wb') as outputFile:
+                outputFile.write(body)
+
+        print("%d request(s), %d failed in %.2f s (%.1f requests/s)" % (args.repeat, failed, elapsed,
+                                                                          args.repeat / elapsed if elapsed > 0 else 0))
+
+    if args.metrics:
+        print(json.dumps(metrics(args.server), indent=2))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+# Batched colour format conversions. Every function accepts a single BGRA pixel, a batch of pixels or a whole image,
+# i.e. any array whose last axis holds the B, G, R (& A) values, and converts all of them in one vectorised pass.
+# float64 conversions follow the picker formulas exactly, float32 conversions (used by the whole-image filters) go
+# through OpenCV's HLS conversion which uses the same formulas
+
+
+def cvtColourPlanes(Planes, code):
+    # cv2.cvtColor on a batch of any shape, kept 2D (rows of the last but one axis) where possible as OpenCV converts
+    # images much faster than a single column of pixels
+    rowLength = Planes.shape[-2] if Planes.ndim > 2 else 1
+    return cv2.cvtColor(Planes.reshape(-1, rowLength, 3), code).reshape(Planes.shape)
+
+
+def bgraToRGBNorm(BGRA, dtype=np.float64):
+    BGRA = np.asarray(BGRA)
+    return BGRA[..., 2::-1].astype(dtype) / dtype(255)
+
+
+def bgraToHSL(BGRA, dtype=np.float64):
+    # H in degrees [0, 360), S & L in percent
+    if dtype == np.float32:
+        BGR = np.asarray(BGRA)[..., :3].astype(np.float32)
+        BGR *= np.float32(1 / 255)
+
+        HLS = cvtColourPlanes(BGR, cv2.COLOR_BGR2HLS)
+        HSL = HLS[..., [0, 2, 1]]
+        HSL[..., 1:] *= 100
+
+        return HSL
+
+    RGB_norm = bgraToRGBNorm(BGRA, dtype)
+    R, G, B = RGB_norm[..., 0], RGB_norm[..., 1], RGB_norm[..., 2]
+
+    C_max = RGB_norm.max(axis=-1)
+    C_min = RGB_norm.min(axis=-1)
+    D = C_max - C_min
+
+    L = (C_max + C_min) / 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S = np.where(D == 0, 0, D / (1 - np.absolute(2 * L - 1)))
+        H = np.select([D == 0, C_max == R, C_max == G],
+                      [0, 60 * ((G - B) / D % 6), 60 * ((B - R) / D + 2)],
+                      60 * ((R - G) / D + 4))
+
+    return np.stack((H, S * 100, L * 100), axis=-1).astype(dtype, copy=False)
+
+
+def hslToBGR(HSL, dtype=np.float64):
+    # Inverse of bgraToHSL, returns B, G, R in [0, 255] (not rounded)
+    HSL = np.asarray(HSL, dtype=dtype)
+
+    if dtype == np.float32:
+        HLS = HSL[..., [0, 2, 1]]
+        HLS[..., 1:] *= np.float32(1 / 100)
+
+        BGR = cvtColourPlanes(HLS, cv2.COLOR_HLS2BGR)
+        BGR *= 255
+
+        return BGR
+
+    H, S, L = HSL[..., 0], HSL[..., 1] / 100, HSL[..., 2] / 100
+
+    A = S * np.minimum(L, 1 - L)
+
+    def channel(n):
+        K = (n + H / 30) % 12
+        return L - A * np.clip(np.minimum(K - 3, 9 - K), -1, 1)
+
+    return np.stack((channel(4), channel(8), channel(0)), axis=-1) * dtype(255)
+
+
+def bgraToCMYK(BGRA, dtype=np.float64):
+    # C, M, Y & K in percent
+    RGB_norm = bgraToRGBNorm(BGRA, dtype)
+
+    K = 1 - RGB_norm.max(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        CMY = (1 - RGB_norm - K[..., None]) / (1 - K[..., None])
+
+    CMYK = np.concatenate((CMY, K[..., None]), axis=-1) * 100
+    CMYK[np.isnan(CMYK)] = 0
+
+    return CMYK
+
+
+def bgraToHex(BGRA):
+    BGRA = np.asarray(BGRA)
+    pixels = BGRA.reshape(-1, BGRA.shape[-1])
+
+    return np.array(["#%02x%02x%02x%02x" % (pixel[2], pixel[1], pixel[0], pixel[3]) for pixel in pixels]).reshape(
+        BGRA.shape[:-1])
+
+
+def averageColour(ImageBGRA, x0, y0, x1, y1):
+    # Mean BGRA of the region [x0, x1) x [y0, y1), rounded to uint8
+    Region = ImageBGRA[max(0, y0):y1, max(0, x0):x1]
+
+    if Region.size == 0:
+        raise ValueError("Empty region")
+
+    return np.rint(Region.reshape(-1, Region.shape[-1]).mean(axis=0)).astype(np.uint8)
+
+
+# <| HSL DOMAIN FILTERS |>
+# The image is converted to HSL in float32, modified and converted back in whole-image passes, alpha (if any) is kept
+def applyHSLFilter(ImageBGRA, modifyHSL):
+    HSL = bgraToHSL(ImageBGRA, np.float32)
+    modifyHSL(HSL)
+
+    BGR = cv2.convertScaleAbs(hslToBGR(HSL, np.float32))
+    return np.dstack((BGR, ImageBGRA[:, :, 3])) if ImageBGRA.shape[2] == 4 else BGR
+
+
+def hueRotate(ImageBGRA, degrees):
+    def modifyHSL(HSL):
+        HSL[..., 0] += degrees
+        HSL[..., 0] %= 360
+
+    return applyHSLFilter(ImageBGRA, modifyHSL)
+
+
+def saturationScale(ImageBGRA, percent):
+    def modifyHSL(HSL):
+        HSL[..., 1] *= 1 + percent / 100
+        HSL[..., 1].clip(min=0, max=100, out=HSL[..., 1])
+
+    return applyHSLFilter(ImageBGRA, modifyHSL)
+
+
+def lightnessClamp(ImageBGRA, floor, headroom):
+    def modifyHSL(HSL):
+        HSL[..., 2].clip(min=floor, max=max(floor, 100 - headroom), out=HSL[..., 2])
+
+    return applyHSLFilter(ImageBGRA, modifyHSL)
@@ -0,0 +1,677 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import ICCTColour
+import ICCTKernels
+import ICCTPalette
+import ICCTTrace
+
+filterModes = ('ADJUST', 'SPECIFIC', 'INTENSITY', 'GREYSCALE', 'INVERSE', 'CEILING', 'FLOOR',
+               'HUE', 'SATURATION', 'LIGHTNESS')
+imageExtensions = ('.jpg', '.jpeg', '.png', '.bmp', '.ppm', '.pgm', '.pnm')
+reducedDecodeModes = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+regionShapes = ('RECT', 'LASSO')
+regionDigits = 6
+
+# Encoder settings: pngCompression 0 - 9, jpegQuality 0 - 100 and the progressive / optimised (Huffman tables) JPEG
+# flags. PNG level 1 with the RLE strategy & Sub filter is OpenCV's own default. Measured on 12 MP images against
+# it, level 0 (no compression) encodes about 4x faster into files about twice as large, the RLE strategy with
+# adaptive filters (levels 2 - 5) takes about twice as long for 4 - 27% smaller files, and zlib's filtered strategy
+# (levels 6 - 9) saves only a few % more for 5x the time or worse. 'Default' keeps the encoder's own settings
+savePresets = {'Fast': {'pngCompression': 0, 'jpegQuality': 90, 'jpegProgressive': False, 'jpegOptimize': False},
+               'Default': {'pngCompression': 1, 'jpegQuality': 95, 'jpegProgressive': False, 'jpegOptimize': False},
+               'Small': {'pngCompression': 2, 'jpegQuality': 95, 'jpegProgressive': True, 'jpegOptimize': True}}
+defaultSavePreset = 'Default'
+
+
+def colourFmtConv(BGRA, toFmt):
+    convFmt = np.array([None])
+
+    if toFmt.upper() == 'HEX':
+        convFmt[0] = ICCTColour.bgraToHex(BGRA)[()]
+    elif toFmt.upper() == 'HSL':
+        convFmt = ICCTColour.bgraToHSL(BGRA)
+    elif toFmt.upper() == 'CMYK':
+        convFmt = ICCTColour.bgraToCMYK(BGRA)
+
+    return convFmt
+
+
+# <| IMAGE INPUT / OUTPUT |>
+# Images without an alpha channel are kept as 3 channel BGR images, their alpha is a virtual constant 255 (see
+# ICCTKernels) so every "ImageBGRA" below may hold either 3 or 4 channels
+def loadImage(imagePath):
+    with ICCTTrace.stage('decode'):
+        ImageBGRA = cv2.imread(imagePath, cv2.IMREAD_UNCHANGED)
+
+    if ImageBGRA is None:
+        raise ValueError("Invalid Image: %s" % imagePath)
+
+    if ImageBGRA.ndim == 2:
+        ImageBGRA = cv2.cvtColor(ImageBGRA, cv2.COLOR_GRAY2BGR)
+
+    return ImageBGRA
+
+
+def decodeImage(imageData):
+    # loadImage for an encoded image held in memory (bytes)
+    with ICCTTrace.stage('decode'):
+        ImageBGRA = cv2.imdecode(np.frombuffer(imageData, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    if ImageBGRA is None:
+        raise ValueError("Invalid Image")
+
+    if ImageBGRA.ndim == 2:
+        ImageBGRA = cv2.cvtColor(ImageBGRA, cv2.COLOR_GRAY2BGR)
+
+    return ImageBGRA
+
+
+def encodeParams(imagePath, saveOptions=None):
+    # OpenCV's imwrite parameters for the format of imagePath (or of an extension such as '.png'), saveOptions None
+    # (or a missing key) leaves the encoder's own default
+    saveOptions = saveOptions or {}
+    extension = (os.path.splitext(imagePath)[1] or imagePath).lower()
+    params = []
+
+    if extension == '.png' and saveOptions.get('pngCompression') is not None:
+        pngCompression = int(saveOptions['pngCompression'])
+        params += [cv2.IMWRITE_PNG_COMPRESSION, pngCompression]
+
+        if pngCompression == 0:
+            params += [cv2.IMWRITE_PNG_FILTER, cv2.IMWRITE_PNG_FILTER_NONE]
+        elif pngCompression == 1:
+            params += [cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE,
+                       cv2.IMWRITE_PNG_FILTER, cv2.IMWRITE_PNG_FILTER_SUB]
+        elif pngCompression <= 5:
+            params += [cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE]
+        else:
+            params += [cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_FILTERED]
+
+    elif extension in ('.jpg', '.jpeg'):
+        if saveOptions.get('jpegQuality') is not None:
+            params += [cv2.IMWRITE_JPEG_QUALITY, int(saveOptions['jpegQuality'])]
+        if saveOptions.get('jpegProgressive'):
+            params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+        if saveOptions.get('jpegOptimize'):
+            params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+    return params
+
+
+def saveImage(imagePath, ImageBGRA, saveOptions=None):
+    with ICCTTrace.stage('save'):
+        written = cv2.imwrite(imagePath, ImageBGRA, encodeParams(imagePath, saveOptions))
+
+    if not written:
+        raise IOError("Error while writing file: %s" % imagePath)
+
+
+def encodeImage(extension, ImageBGRA, saveOptions=None):
+    # saveImage into memory, returns the encoded bytes
+    with ICCTTrace.stage('save'):
+        encoded, imageData = cv2.imencode(extension, ImageBGRA, encodeParams(extension, saveOptions))
+
+    if not encoded:
+        raise IOError("Error while encoding the image as %s" % extension)
+
+    return imageData.tobytes()
+
+
+def scaleImage(ImageBGRA, scale):
+    if scale == 1:
+        return ImageBGRA
+
+    H, W = ImageBGRA.shape[:2]
+    return cv2.resize(ImageBGRA, (max(1, round(W * scale)), max(1, round(H * scale))), interpolation=cv2.INTER_AREA)
+
+
+def saveImageTargets(ImageBGRA, saveTargets, saveOptions=None, workers=None, progress=None):
+    # Writes one image to several (imagePath, scale) targets, each size is computed once and the encoders run in
+    # parallel (OpenCV releases the GIL while encoding). progress(fraction) is called as the targets complete, an
+    # exception raised by it (e.g. a cancellation) drops the targets that have not started yet
+    scaledImages = {scale: scaleImage(ImageBGRA, scale) for scale in sorted({scale for path, scale in saveTargets})}
+
+    with ThreadPoolExecutor(max_workers=workers or min(len(saveTargets), os.cpu_count() or 1)) as executor:
+        pending = [executor.submit(saveImage, path, scaledImages[scale], saveOptions) for path, scale in saveTargets]
+
+        try:
+            for done, future in enumerate(pending):
+                future.result()
+
+                if progress is not None:
+                    progress((done + 1) / len(pending))
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    return [path for path, scale in saveTargets]
+
+
+def proxyScale(imageShape, maxWidth, maxHeight):
+    H, W = imageShape[:2]
+    return min(1.0, maxWidth / W, maxHeight / H)
+
+
+def makeProxy(ImageBGRA, maxWidth, maxHeight, fullShape=None):
+    # ImageBGRA may itself be a reduced decode of an image of fullShape, the proxy always has the size it would have
+    # been given from the full resolution image
+    H, W = (ImageBGRA.shape if fullShape is None else fullShape)[:2]
+    scale = proxyScale((H, W), maxWidth, maxHeight)
+
+    if scale == 1.0 and fullShape is None:
+        return ImageBGRA
+
+    return cv2.resize(ImageBGRA, (max(1, round(W * scale)), max(1, round(H * scale))), interpolation=cv2.INTER_AREA)
+
+
+def jpegSize(imagePath):
+    # (H, W) read from the start of frame segment of a JPEG file, None if it is not a readable JPEG
+    with open(imagePath, 'rb') as imageFile:
+        if imageFile.read(2) != b'\xff\xd8':
+            return None
+
+        while True:
+            marker = imageFile.read(2)
+            while len(marker) == 2 and marker[1] == 0xFF:
+                marker = marker[1:] + imageFile.read(1)
+
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+
+            if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD8:
+                continue
+
+            segmentLength = int.from_bytes(imageFile.read(2), 'big')
+
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                frameHeader = imageFile.read(5)
+                return int.from_bytes(frameHeader[1:3], 'big'), int.from_bytes(frameHeader[3:5], 'big')
+
+            imageFile.seek(segmentLength - 2, 1)
+
+
+def loadPreview(imagePath, maxWidth, maxHeight):
+    # Returns (ProxyBGRA, fullShape, ImageBGRA). JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale (the smallest
+    # that still covers the proxy) and ImageBGRA is None, the full resolution decode being left to the caller. OpenCV
+    # decodes any other format at full resolution anyway, so those are fully decoded here
+    if imagePath.lower().endswith(('.jpg', '.jpeg')):
+        fullSize = jpegSize(imagePath)
+
+        if fullSize is not None:
+            scale = proxyScale(fullSize, maxWidth, maxHeight)
+
+            for factor, decodeMode in reducedDecodeModes:
+                if factor * scale <= 1.0:
+                    with ICCTTrace.stage('decode', 'reduced 1/%d' % factor):
+                        ImageReduced = cv2.imread(imagePath, decodeMode | cv2.IMREAD_IGNORE_ORIENTATION)
+
+                    if ImageReduced is None:
+                        break
+
+                    fullShape = fullSize + (ImageReduced.shape[2],)
+                    return makeProxy(ImageReduced, maxWidth, maxHeight, fullShape), fullShape, None
+
+    ImageBGRA = loadImage(imagePath)
+    return makeProxy(ImageBGRA, maxWidth, maxHeight), ImageBGRA.shape, ImageBGRA
+
+
+# <| FILTER MODES |>
+def normaliseMode(operationMode):
+    mode = operationMode.upper().strip()
+
+    if mode not in filterModes:
+        raise ValueError("Unknown filter mode: %s" % operationMode)
+
+    return mode
+
+
+def filterAdjust(ImageBGRA, R, G, B, out=None):
+    return ICCTKernels.lutKernel(ImageBGRA, mapPointStep(identityTable(), 'ADJUST', R, G, B),
+                                 ICCTKernels.allocateOut(ImageBGRA, out))
+
+
+def specificFillColour(coloursRGB):
+    # Black, unless one of the kept colours is too dark to stand out against it
+    for R, G, B in coloursRGB:
+        if colourFmtConv(np.array([B, G, R, 255]), 'hsl')[2] <= 17.5:
+            return 255, 255, 255
+
+    return 0, 0, 0
+
+
+def filterSpecific(ImageBGRA, R, G, B, out=None, tolerance=0, extraColours=()):
+    # Keeps the pixels of the colour R, G, B (and of extraColours, all within the RGB distance tolerance)
+    coloursRGB = [(R, G, B)] + list(extraColours)
+    mismatchMask = ICCTPalette.matchMask(ImageBGRA, coloursRGB, tolerance, invert=True)
+
+    return ICCTKernels.specificKernel(ImageBGRA, mismatchMask, specificFillColour(coloursRGB),
+                                      ICCTKernels.allocateOut(ImageBGRA, out))
+
+
+def filterIntensity(ImageBGRA, R, G, B, out=None):
+    return ICCTKernels.addKernel(ImageBGRA, (B, G, R), ICCTKernels.allocateOut(ImageBGRA, out))
+
+
+def filterGreyscale(ImageBGRA, R, G, B, out=None):
+    return ICCTKernels.greyscaleKernel(ImageBGRA, ICCTKernels.allocateOut(ImageBGRA, out))
+
+
+def filterInverse(ImageBGRA, R, G, B, out=None):
+    return ICCTKernels.absDiffKernel(ImageBGRA, (R, R, R), ICCTKernels.allocateOut(ImageBGRA, out))
+
+
+def filterThreshold(ImageBGRA, mode, R, G, B, out):
+    killMask = ICCTKernels.thresholdKillMask(ImageBGRA, thresholdMask(identityTable(), mode, R, G, B))
+    return ICCTKernels.fillKernel(ImageBGRA, killMask, (0, 0, 0), ICCTKernels.allocateOut(ImageBGRA, out))
+
+
+def filterCeiling(ImageBGRA, R, G, B, out=None):
+    return filterThreshold(ImageBGRA, 'CEILING', R, G, B, out)
+
+
+def filterFloor(ImageBGRA, R, G, B, out=None):
+    return filterThreshold(ImageBGRA, 'FLOOR', R, G, B, out)
+
+
+def filterHSL(ImageFiltered, out):
+    if out is None:
+        return ImageFiltered
+
+    np.copyto(out, ImageFiltered)
+    return out
+
+
+def filterHue(ImageBGRA, R, G, B, out=None):
+    return filterHSL(ICCTColour.hueRotate(ImageBGRA, R), out)
+
+
+def filterSaturation(ImageBGRA, R, G, B, out=None):
+    return filterHSL(ICCTColour.saturationScale(ImageBGRA, R), out)
+
+
+def filterLightness(ImageBGRA, R, G, B, out=None):
+    return filterHSL(ICCTColour.lightnessClamp(ImageBGRA, R, G), out)
+
+
+filterFunctions = {'ADJUST': filterAdjust,
+                   'SPECIFIC': filterSpecific,
+                   'INTENSITY': filterIntensity,
+                   'GREYSCALE': filterGreyscale,
+                   'INVERSE': filterInverse,
+                   'CEILING': filterCeiling,
+                   'FLOOR': filterFloor,
+                   'HUE': filterHue,
+                   'SATURATION': filterSaturation,
+                   'LIGHTNESS': filterLightness}
+
+
+def applyFilter(ImageBGRA, operationMode, R=0, G=0, B=0, out=None):
+    # out may be ImageBGRA itself to filter in place, a new frame is allocated when it is not given
+    return filterFunctions[normaliseMode(operationMode)](ImageBGRA, R, G, B, out)
+
+
+# <| FILTER CHAINS |>
+# A filter chain is an ordered list of (mode, (R, G, B)) steps, where R / G / B are the values of the three
+# parameter sliders of the GUI for that mode (e.g. Brightness / Contrast / unused for Adjust). Specific steps may
+# carry a match tolerance and more colours to keep: (R, G, B, tolerance, R2, G2, B2, ...). A step limited to a region
+# of the image carries the region as well: (mode, params, region)
+def makeFilterStep(operationMode, R=0, G=0, B=0, *extra):
+    mode = normaliseMode(operationMode)
+
+    if extra and (mode != 'SPECIFIC' or (len(extra) - 1) % 3 != 0):
+        raise ValueError("Too many parameters for filter step: %s" % mode)
+
+    return mode, tuple(int(value) for value in (R, G, B) + extra)
+
+
+def makeSpecificStep(coloursRGB, tolerance=0):
+    (R, G, B), extraColours = coloursRGB[0], coloursRGB[1:]
+
+    if tolerance == 0 and not extraColours:
+        return makeFilterStep('SPECIFIC', R, G, B)
+
+    return makeFilterStep('SPECIFIC', R, G, B, tolerance, *[value for colour in extraColours for value in colour])
+
+
+def parseFilterStep(stepText):
+    # MODE:R,G,B[@SHAPE:x0,y0,...] e.g. Adjust:20,10 or Inverse:255@rect:0.25,0.25,0.75,0.5
+    stepText, _, regionText = stepText.partition('@')
+    mode, _, params = stepText.partition(':')
+    values = [int(value) for value in params.split(',') if value.strip() != '']
+
+    if regionText == '':
+        return makeFilterStep(mode, *values)
+
+    shape, _, coordinates = regionText.partition(':')
+    region = makeRegion(shape, [float(value) for value in coordinates.split(',') if value.strip() != ''])
+
+    return limitStepToRegion(makeFilterStep(mode, *values), region)
+
+
+def formatFilterStep(filterStep):
+    mode, params = filterStep[:2]
+    stepText = "%s:%s" % (mode.capitalize(), ','.join("%d" % value for value in params))
+
+    region = stepRegion(filterStep)
+    if region is None:
+        return stepText
+
+    return "%s@%s:%s" % (stepText, region[0].lower(), ','.join("%g" % value for value in region[1]))
+
+
+def applyFilterStep(ImageBGRA, filterStep, out=None):
+    if stepRegion(filterStep) is not None:
+        return RegionStage(stepRegion(filterStep), [filterStep[:2]]).apply(ImageBGRA, out)
+
+    mode, params = filterStep
+    R, G, B = params[:3]
+
+    if len(params) > 3:
+        extra = params[4:]
+        return filterSpecific(ImageBGRA, R, G, B, out, params[3], [extra[i:i + 3] for i in range(0, len(extra), 3)])
+
+    return applyFilter(ImageBGRA, mode, R, G, B, out)
+
+
+def applyFilterChainStepwise(ImageBGRA, filterChain):
+    for filterStep in filterChain:
+        ImageBGRA = applyFilterStep(ImageBGRA, filterStep)
+
+    return ImageBGRA
+
+
+# <| REGIONS |>
+# Regions do not depend on the resolution: their coordinates are fractions of the width / height of the image, so a
+# region picked on the preview limits the step on the proxy and on the full resolution image alike. A region is
+# ('RECT', (x0, y0, x1, y1)) or ('LASSO', (x1, y1, x2, y2, ...)), a lasso being a polygon through its points
+def makeRegion(shape, coordinates):
+    shape = shape.upper().strip()
+
+    if shape not in regionShapes:
+        raise ValueError("Unknown region shape: %s" % shape)
+
+    coordinates = tuple(round(min(1.0, max(0.0, float(value))), regionDigits) for value in coordinates)
+
+    if shape == 'RECT':
+        if len(coordinates) != 4:
+            raise ValueError("A rectangle region takes x0,y0,x1,y1")
+
+        x0, y0, x1, y1 = coordinates
+        coordinates = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+    elif len(coordinates) < 6 or len(coordinates) % 2 != 0:
+        raise ValueError("A lasso region takes at least 3 points: x1,y1,x2,y2,x3,y3")
+
+    return shape, coordinates
+
+
+def limitStepToRegion(filterStep, region=None):
+    return tuple(filterStep[:2]) if region is None else tuple(filterStep[:2]) + (region,)
+
+
+def stepRegion(filterStep):
+    return filterStep[2] if len(filterStep) > 2 else None
+
+
+def chainHasRegions(filterChain):
+    return any(stepRegion(filterStep) is not None for filterStep in filterChain)
+
+
+def regionBounds(region, H, W):
+    # Pixel bounding box (x0, y0, x1, y1) of the region in an H x W image, empty when x1 <= x0 or y1 <= y0
+    coordinates = region[1]
+    xs, ys = coordinates[0::2], coordinates[1::2]
+
+    return (max(0, int(math.floor(min(xs) * W))), max(0, int(math.floor(min(ys) * H))),
+            min(W, int(math.ceil(max(xs) * W))), min(H, int(math.ceil(max(ys) * H))))
+
+
+def regionMask(region, H, W, x0, y0, x1, y1):
+    # The pixels of the box (x0, y0, x1, y1) of an H x W image whose centre is inside the region, None if all of them
+    # are. Every row of a lasso is filled on its own (even-odd rule), so the mask of a box is exactly the rows of the
+    # mask of any taller box, and strips of a frame get the same pixels as the whole frame
+    if region[0] == 'RECT':
+        return None
+
+    coordinates = region[1]
+    ax, ay = np.array(coordinates[0::2]) * W, np.array(coordinates[1::2]) * H
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+
+    centreY = np.arange(y0, y1)[:, None] + 0.5
+    rows, edges = np.nonzero((ay <= centreY) != (by <= centreY))
+    crossX = ax[edges] + (centreY[rows, 0] - ay[edges]) * (bx[edges] - ax[edges]) / (by[edges] - ay[edges])
+
+    # Every crossing toggles the pixels whose centre is right of it
+    columns = np.clip(np.floor(crossX - 0.5).astype(np.int64) + 1 - x0, 0, x1 - x0)
+    toggles = np.zeros((y1 - y0, x1 - x0 + 1), dtype=np.uint8)
+    np.add.at(toggles, (rows, columns), 1)
+
+    return (np.cumsum(toggles, axis=1, dtype=np.uint8)[:, :x1 - x0] & 1).astype(bool)
+
+
+def regionsBounds(regions, H, W):
+    # Bounding box of several regions, None if they are all empty
+    bounds = [regionBounds(region, H, W) for region in regions]
+    bounds = [(x0, y0, x1, y1) for x0, y0, x1, y1 in bounds if x1 > x0 and y1 > y0]
+
+    if not bounds:
+        return None
+
+    return (min(box[0] for box in bounds), min(box[1] for box in bounds),
+            max(box[2] for box in bounds), max(box[3] for box in bounds))
+
+
+# <| FILTER CHAIN COMPILER |>
+# Adjust / Intensity / Inverse map every B / G / R value independently, so any run of them folds into one
+# 256-entry lookup table per channel. Ceiling / Floor blacken a whole pixel when any of its channels crosses a
+# threshold: they fold into a per-channel "kill" table (the pixel is blackened if any channel's entry is set)
+# plus the colour that the blackened pixels end up with after the remaining point steps of the segment.
+# Greyscale / Specific and the HSL domain modes mix the channels and act as barriers between the compiled segments.
+# A run of steps limited to the same region is compiled on its own and only touches the region's bounding box
+pointModes = ('ADJUST', 'INTENSITY', 'INVERSE')
+thresholdModes = ('CEILING', 'FLOOR')
+
+
+def identityTable():
+    return np.repeat(np.arange(256, dtype=np.int64)[:, None], 3, axis=1)
+
+
+def mapPointStep(values, mode, R, G, B):
+    if mode == 'ADJUST':
+        B, C = R * 2.55, 1 + G / 100
+        return (C * (values - 128) + 128 + B).clip(min=0, max=255).astype(np.uint8).astype(np.int64)
+    elif mode == 'INTENSITY':
+        return (values + np.array([B, G, R])).clip(min=0, max=255)
+    elif mode == 'INVERSE':
+        # Saturated like cv2.absdiff for amounts outside 0 - 255
+        return np.absolute(values - R).clip(max=255)
+
+
+def thresholdMask(values, mode, R, G, B):
+    if mode == 'CEILING':
+        return values > np.array([B, G, R])
+    elif mode == 'FLOOR':
+        return values < np.array([B, G, R])
+
+
+class CompiledSegment:
+    def __init__(self):
+        self.LUT = identityTable()
+        self.killLUT = None
+        self.killFill = np.zeros(3, dtype=np.int64)
+        self.modes = []
+
+    def addPointStep(self, mode, R, G, B):
+        self.modes.append(mode)
+        self.LUT = mapPointStep(self.LUT, mode, R, G, B)
+        self.killFill = mapPointStep(self.killFill[None, :], mode, R, G, B)[0]
+
+    def addThresholdStep(self, mode, R, G, B):
+        # Pixels blackened earlier in the segment must end up black again, otherwise a second fill colour would be
+        # needed and the step has to start a new segment
+        if self.killLUT is not None and self.killFill.any() and \
+                not thresholdMask(self.killFill[None, :], mode, R, G, B).any():
+            return False
+
+        killLUT = thresholdMask(self.LUT, mode, R, G, B)
+        self.killLUT = killLUT if self.killLUT is None else self.killLUT | killLUT
+        self.killFill = np.zeros(3, dtype=np.int64)
+        self.modes.append(mode)
+        return True
+
+    def apply(self, ImageBGRA, out=None):
+        # The kill mask is taken from the input before the table is applied, so out may be ImageBGRA itself
+        killMask = None if self.killLUT is None else ICCTKernels.thresholdKillMask(ImageBGRA, self.killLUT)
+
+        ImageOut = ICCTKernels.lutKernel(ImageBGRA, self.LUT, ICCTKernels.allocateOut(ImageBGRA, out))
+
+        if killMask is not None:
+            ICCTKernels.maskedFill(ImageOut, killMask, self.killFill.tolist())
+
+        return ImageOut
+
+
+class RegionStage:
+    def __init__(self, region, filterSteps):
+        # filterSteps are plain (mode, params) steps
+        self.region = region
+        self.filterSteps = tuple(filterSteps)
+        self.modes = [normaliseMode(mode) for mode, params in self.filterSteps]
+        self.compiledChain = compileFilterChain(self.filterSteps)
+
+    def apply(self, ImageBGRA, out=None, band=None):
+        # band (top, frameHeight): ImageBGRA is the rows [top, top + its height) of a taller frame, the region being
+        # placed on the whole frame. Only the part of the region's bounding box in ImageBGRA is filtered
+        h, W = ImageBGRA.shape[:2]
+        top, frameHeight = (0, h) if band is None else band
+
+        if out is None:
+            out = ImageBGRA.copy()
+        elif not np.may_share_memory(out, ImageBGRA):
+            np.copyto(out, ImageBGRA)
+
+        x0, y0, x1, y1 = regionBounds(self.region, frameHeight, W)
+        y0, y1 = max(y0, top), min(y1, top + h)
+
+        if x1 <= x0 or y1 <= y0:
+            return out
+
+        mask = regionMask(self.region, frameHeight, W, x0, y0, x1, y1)
+        Crop, OutCrop = ImageBGRA[y0 - top:y1 - top, x0:x1], out[y0 - top:y1 - top, x0:x1]
+
+        if mask is None:
+            applyCompiledChain(Crop, self.compiledChain, OutCrop)
+        else:
+            np.copyto(OutCrop, applyCompiledChain(Crop, self.compiledChain), where=mask[:, :, None])
+
+        return out
+
+
+def compileFilterChain(filterChain):
+    compiledChain = []
+    segment = None
+
+    for filterStep in filterChain:
+        region = stepRegion(filterStep)
+
+        if region is not None:
+            # Consecutive steps on the same region share one stage
+            if compiledChain and isinstance(compiledChain[-1], RegionStage) and compiledChain[-1].region == region:
+                compiledChain[-1] = RegionStage(region, compiledChain[-1].filterSteps + (tuple(filterStep[:2]),))
+            else:
+                compiledChain.append(RegionStage(region, [filterStep[:2]]))
+
+            segment = None
+            continue
+
+        mode, params = filterStep
+        mode = normaliseMode(mode)
+        R, G, B = params[:3]
+
+        if mode in pointModes or mode in thresholdModes:
+            if segment is None:
+                segment = CompiledSegment()
+                compiledChain.append(segment)
+
+            if mode in pointModes:
+                segment.addPointStep(mode, R, G, B)
+            elif not segment.addThresholdStep(mode, R, G, B):
+                segment = CompiledSegment()
+                compiledChain.append(segment)
+                segment.addThresholdStep(mode, R, G, B)
+        else:
+            segment = None
+            compiledChain.append((mode, tuple(params)))
+
+    return compiledChain
+
+
+def applyCompiledChain(ImageBGRA, compiledChain, out=None, band=None):
+    # The first stage writes into out (or a newly allocated frame), every later stage filters that frame in place,
+    # so a whole chain costs a single extra frame and the input is never modified. band is that of RegionStage.apply
+    for stage in compiledChain:
+        if isinstance(stage, CompiledSegment):
+            with ICCTTrace.stage('filter step', '+'.join(stage.modes)):
+                ImageBGRA = stage.apply(ImageBGRA, out)
+        elif isinstance(stage, RegionStage):
+            with ICCTTrace.stage('filter step', '+'.join(stage.modes) + ' (region)'):
+                ImageBGRA = stage.apply(ImageBGRA, out, band)
+        else:
+            with ICCTTrace.stage('filter step', stage[0]):
+                ImageBGRA = applyFilterStep(ImageBGRA, stage, out)
+
+        out = ImageBGRA
+
+    if out is not None and out is not ImageBGRA:
+        np.copyto(out, ImageBGRA)
+        return out
+
+    return ImageBGRA
+
+
+def applyFilterChain(ImageBGRA, filterChain, out=None):
+    # out may be ImageBGRA itself to filter in place: steps limited to a region then only touch its bounding box
+    with ICCTTrace.stage('filter'):
+        return applyCompiledChain(ImageBGRA, compileFilterChain(filterChain), out)
+
+
+# <| IMAGE ANALYSIS |>
+histogramStripPixels = 1 << 24
+
+
+def decimateImage(ImageBGRA, maxPixels):
+    H, W = ImageBGRA.shape[:2]
+    scale = min(1.0, (maxPixels / (H * W)) ** 0.5)
+
+    if scale == 1.0:
+        return ImageBGRA
+
+    return cv2.resize(ImageBGRA, (max(1, int(W * scale)), max(1, int(H * scale))), interpolation=cv2.INTER_AREA)
+
+
+def channelHistograms(ImageBGRA):
+    # Returns the 256-bin (int64) histograms in R / G / B order. OpenCV counts in float32, which is exact up to 2^24,
+    # so larger images are counted in strips of at most 2^24 pixels
+    H, W = ImageBGRA.shape[:2]
+    stripRows = max(1, histogramStripPixels // W)
+    histograms = np.zeros((3, 256), dtype=np.int64)
+
+    for top in range(0, H, stripRows):
+        for index, channel in enumerate((2, 1, 0)):
+            histograms[index] += cv2.calcHist([ImageBGRA[top:top + stripRows]], [channel], None, [256],
+                                              [0, 256]).ravel().astype(np.int64)
+
+    return list(histograms)
+
+
+def jointHistogram(ImageBGRA, channelX, channelY):
+    # 256 x 256 density of (channelY, channelX) value pairs, channels given as BGRA indices
+    pairs = ImageBGRA[:, :, channelY].astype(np.uint16) << 8
+    pairs |= ImageBGRA[:, :, channelX]
+
+    return np.bincount(pairs.ravel(), minlength=65536).reshape(256, 256)
@@ -0,0 +1,223 @@
+import threading
+from collections import OrderedDict
+
+import ICCTEngine
+import ICCTParallel
+
+defaultMemoryLimitMB = 512
+defaultPatchMemoryLimitMB = 128
+defaultCheckpointInterval = 4
+
+
+def scaledProgress(progress, startStep, endStep, stepCount):
+    # Maps the progress of the steps [startStep, endStep) onto the progress of all stepCount steps
+    return lambda fraction: progress((startStep + fraction * (endStep - startStep)) / stepCount)
+
+
+class FilterHistory:
+    # Every history entry is the filter chain of that state (parameter records only). Full frames are kept as
+    # checkpoints every checkpointInterval steps of the chain in a memory capped LRU, plus the frame of the current
+    # state, and any other state is recomputed from the longest checkpointed prefix of its chain. Steps limited to a
+    # region only change its bounding box, so when they are computed the pixels of the box they overwrite are kept as
+    # a patch, and going back over them (undo) pastes the patches instead of recomputing. Frames may be computed on a
+    # worker thread while the GUI pushes new states, so the checkpoint bookkeeping is done under a lock
+    def __init__(self, ImageOriginal, memoryLimitMB=defaultMemoryLimitMB,
+                 checkpointInterval=defaultCheckpointInterval, patchMemoryLimitMB=defaultPatchMemoryLimitMB):
+        self.ImageOriginal = ImageOriginal
+        self.memoryLimit = memoryLimitMB * 1024 * 1024
+        self.checkpointInterval = checkpointInterval
+        self.patchMemoryLimit = patchMemoryLimitMB * 1024 * 1024
+
+        self.states = [()]
+        self.position = 0
+
+        self.checkpoints = OrderedDict()
+        self.checkpointBytes = 0
+
+        # chain: (length of the chain it was computed from, (x0, y0, x1, y1), pixels of that frame in the box)
+        self.patches = OrderedDict()
+        self.patchBytes = 0
+
+        self.currentChain = ()
+        self.currentFrame = ImageOriginal
+
+        self.lock = threading.RLock()
+
+    def setOriginal(self, ImageOriginal):
+        # Images opened from a reduced resolution decode get their full resolution original once it is decoded
+        with self.lock:
+            self.ImageOriginal = ImageOriginal
+
+            if self.currentChain == ():
+                self.currentFrame = ImageOriginal
+
+        return ImageOriginal
+
+    def current(self):
+        return list(self.states[self.position])
+
+    def canUndo(self):
+        return self.position > 0
+
+    def canRedo(self):
+        return self.position < len(self.states) - 1
+
+    def push(self, filterChain, ImageBGRA=None):
+        filterChain = tuple(filterChain)
+
+        del self.states[self.position + 1:]
+        self.states.append(filterChain)
+        self.position += 1
+
+        if ImageBGRA is not None:
+            self.setCurrentFrame(filterChain, ImageBGRA)
+
+    def undo(self):
+        if self.canUndo():
+            self.position -= 1
+        return self.current()
+
+    def redo(self):
+        if self.canRedo():
+            self.position += 1
+        return self.current()
+
+    def rewindTo(self, filterChain):
+        # Moves back to the latest state (up to the current one) with this chain, the later states stay available to
+        # redo. Returns False if there is no such state
+        filterChain = tuple(filterChain)
+
+        for position in range(self.position, -1, -1):
+            if self.states[position] == filterChain:
+                self.position = position
+                return True
+
+        return False
+
+    def setCurrentFrame(self, filterChain, ImageBGRA):
+        with self.lock:
+            self.currentChain, self.currentFrame = tuple(filterChain), ImageBGRA
+
+            if filterChain and len(filterChain) % self.checkpointInterval == 0:
+                self.addCheckpoint(filterChain, ImageBGRA)
+
+    def addCheckpoint(self, filterChain, ImageBGRA):
+        filterChain = tuple(filterChain)
+
+        with self.lock:
+            if filterChain in self.checkpoints:
+                self.checkpoints.move_to_end(filterChain)
+                return
+
+            self.checkpoints[filterChain] = ImageBGRA
+            self.checkpointBytes += ImageBGRA.nbytes
+
+            while self.checkpointBytes > self.memoryLimit and self.checkpoints:
+                evictedChain, evictedFrame = self.checkpoints.popitem(last=False)
+                self.checkpointBytes -= evictedFrame.nbytes
+
+    def addPatch(self, filterChain, baseLength, bounds, ImagePatch):
+        with self.lock:
+            if filterChain in self.patches:
+                self.patchBytes -= self.patches.pop(filterChain)[2].nbytes
+
+            self.patches[filterChain] = (baseLength, bounds, ImagePatch)
+            self.patchBytes += ImagePatch.nbytes
+
+            while self.patchBytes > self.patchMemoryLimit and self.patches:
+                evictedChain, (evictedLength, evictedBounds, evictedPatch) = self.patches.popitem(last=False)
+                self.patchBytes -= evictedPatch.nbytes
+
+    def releaseCheckpoints(self):
+        # Drops every checkpoint & patch, keeping the states and the current frame (e.g. while the image is not being
+        # viewed)
+        with self.lock:
+            self.checkpoints.clear()
+            self.checkpointBytes = 0
+
+            self.patches.clear()
+            self.patchBytes = 0
+
+    def nearestCheckpoint(self, filterChain):
+        with self.lock:
+            # The current frame counts as a checkpoint, new states are usually built on top of it
+            currentLength = len(self.currentChain) if filterChain[:len(self.currentChain)] == self.currentChain else 0
+
+            for length in range(len(filterChain), 0, -1):
+                prefix = filterChain[:length]
+
+                if length == currentLength:
+                    return length, self.currentFrame
+
+                if prefix in self.checkpoints:
+                    self.checkpoints.move_to_end(prefix)
+                    return length, self.checkpoints[prefix]
+
+            return 0, self.ImageOriginal
+
+    def patchedFrame(self, filterChain):
+        # The frame of filterChain taken back from the current frame by pasting patches, when the current chain
+        # continues filterChain and every step after it has been patched. None otherwise
+        with self.lock:
+            chain, patches = self.currentChain, []
+
+            while len(chain) > len(filterChain) and chain in self.patches:
+                baseLength, bounds, ImagePatch = self.patches[chain]
+                patches.append((bounds, ImagePatch))
+                chain = chain[:baseLength]
+
+            if chain != filterChain or not patches:
+                return None
+
+            ImageBGRA = self.currentFrame.copy()
+
+        # The newest patch first, so the oldest pixels of overlapping boxes win
+        for (x0, y0, x1, y1), ImagePatch in patches:
+            ImageBGRA[y0:y1, x0:x1] = ImagePatch
+
+        return ImageBGRA
+
+    def frameFor(self, filterChain, progress=None):
+        # The steps are applied band by band on every core (see ICCTParallel), progress(fraction) is called as the
+        # bands complete
+        filterChain = tuple(filterChain)
+
+        with self.lock:
+            if filterChain == self.currentChain:
+                return self.currentFrame
+
+        length, ImageBGRA = self.nearestCheckpoint(filterChain)
+        firstLength = length
+
+        if length < len(filterChain):
+            patchedFrame = self.patchedFrame(filterChain)
+
+            if patchedFrame is not None:
+                self.setCurrentFrame(filterChain, patchedFrame)
+                return patchedFrame
+
+        # Recompute up to each checkpoint boundary in turn so the intermediate checkpoints get cached on the way
+        while length < len(filterChain):
+            nextLength = min(len(filterChain), (length // self.checkpointInterval + 1) * self.checkpointInterval)
+
+            stepsProgress = None if progress is None else scaledProgress(progress, length - firstLength,
+                                                                         nextLength - firstLength,
+                                                                         len(filterChain) - firstLength)
+
+            # Steps that are all limited to regions only overwrite the box around their regions
+            regions = [ICCTEngine.stepRegion(filterStep) for filterStep in filterChain[length:nextLength]]
+            if None not in regions:
+                bounds = ICCTEngine.regionsBounds(regions, *ImageBGRA.shape[:2])
+                if bounds is not None:
+                    x0, y0, x1, y1 = bounds
+                    self.addPatch(filterChain[:nextLength], length, bounds, ImageBGRA[y0:y1, x0:x1].copy())
+
+            ImageBGRA = ICCTParallel.applyFilterChainParallel(ImageBGRA, filterChain[length:nextLength],
+                                                              progress=stepsProgress)
+            length = nextLength
+
+            if length < len(filterChain):
+                self.addCheckpoint(filterChain[:length], ImageBGRA)
+
+        self.setCurrentFrame(filterChain, ImageBGRA)
+        return ImageBGRA
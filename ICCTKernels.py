@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+
+# In-place uint8 filter kernels. Every kernel writes into a preallocated `out` buffer of the shape of the image, which
+# may be the image itself, using OpenCV's saturating arithmetic or `out=` targets instead of promoting the frame to
+# float64 / int64. Images may have 3 channels, in which case their alpha is virtual: a constant 255 that no filter
+# changes and that is only materialised when it is actually needed (materialiseAlpha)
+greyscaleChunkRows = 256
+
+
+def hasAlpha(Image):
+    return Image.shape[2] == 4
+
+
+def materialiseAlpha(Image):
+    return Image if hasAlpha(Image) else cv2.cvtColor(Image, cv2.COLOR_BGR2BGRA)
+
+
+def pixelBGRA(Image, y, x):
+    return Image[y, x] if hasAlpha(Image) else np.append(Image[y, x], np.uint8(255))
+
+
+def allocateOut(Image, out=None):
+    return np.empty_like(Image) if out is None else out
+
+
+def copyAlpha(Image, out):
+    if out is not Image and hasAlpha(Image):
+        out[:, :, 3] = Image[:, :, 3]
+
+
+def channelScalar(Image, BGR, alphaValue=0):
+    return tuple(BGR) + ((alphaValue,) if hasAlpha(Image) else ())
+
+
+def lutKernel(Image, tableBGR, out):
+    # tableBGR is a (256, 3) table of the B / G / R channels, the alpha channel is mapped through the identity
+    table = tableBGR if not hasAlpha(Image) else np.column_stack((tableBGR, np.arange(256)))
+    cv2.LUT(Image, table.reshape((256, 1, Image.shape[2])).astype(np.uint8), dst=out)
+    return out
+
+
+def addKernel(Image, BGR, out):
+    # Saturating add of a signed offset per channel
+    cv2.add(Image, channelScalar(Image, BGR), dst=out)
+    return out
+
+
+def absDiffKernel(Image, BGR, out):
+    cv2.absdiff(Image, channelScalar(Image, BGR), dst=out)
+    return out
+
+
+def thresholdKillMask(Image, killLUT):
+    # True for every pixel whose B, G or R entry of the (256, 3) boolean killLUT is set
+    killMask = np.take(killLUT[:, 0], Image[:, :, 0])
+    killMask |= np.take(killLUT[:, 1], Image[:, :, 1])
+    killMask |= np.take(killLUT[:, 2], Image[:, :, 2])
+    return killMask
+
+
+def maskedFill(out, mask, BGR, alphaValue=None):
+    # Sets the B, G, R (and alpha, if given) of the masked pixels with two masked bitwise passes, the alpha of the
+    # masked pixels is kept when alphaValue is None
+    if out.shape[0] * out.shape[1] == 1:
+        # OpenCV reads a single pixel image as a scalar and rejects the mask, a single pixel is cheap in NumPy
+        if mask.any():
+            out[0, 0, :3] = BGR
+            if alphaValue is not None and hasAlpha(out):
+                out[0, 0, 3] = alphaValue
+        return out
+
+    mask = mask.view(np.uint8)
+    keepAlpha = 255 if alphaValue is None else 0
+
+    cv2.bitwise_and(out, channelScalar(out, (0, 0, 0), keepAlpha), dst=out, mask=mask)
+    cv2.bitwise_or(out, channelScalar(out, BGR, alphaValue or 0), dst=out, mask=mask)
+    return out
+
+
+def fillKernel(Image, mask, BGR, out):
+    if out is not Image:
+        np.copyto(out, Image)
+
+    return maskedFill(out, mask, BGR)
+
+
+def greyscaleKernel(Image, out):
+    # Weighted sum evaluated exactly like the float64 expression 0.299 * R + 0.587 * G + 0.114 * B, but in chunks of
+    # rows so only a couple of small float64 scratch buffers are needed
+    H, W = Image.shape[:2]
+    rows = min(H, greyscaleChunkRows)
+    Gray = np.empty((rows, W), dtype=np.float64)
+    Scratch = np.empty((rows, W), dtype=np.float64)
+
+    for top in range(0, H, rows):
+        bottom = min(top + rows, H)
+        gray, scratch = Gray[:bottom - top], Scratch[:bottom - top]
+
+        np.multiply(Image[top:bottom, :, 2], 0.299, out=gray)
+        np.multiply(Image[top:bottom, :, 1], 0.587, out=scratch)
+        gray += scratch
+        np.multiply(Image[top:bottom, :, 0], 0.114, out=scratch)
+        gray += scratch
+
+        out[top:bottom, :, 0] = gray
+        out[top:bottom, :, 1] = out[top:bottom, :, 0]
+        out[top:bottom, :, 2] = out[top:bottom, :, 0]
+
+    copyAlpha(Image, out)
+    return out
+
+
+def specificKernel(Image, mismatchMask, fillBGR, out):
+    if out is not Image:
+        np.copyto(out, Image)
+
+    # The alpha of the replaced pixels is set to 255, i.e. left as is for images with a virtual alpha
+    return maskedFill(out, mismatchMask, fillBGR, 255)
@@ -0,0 +1,149 @@
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# Colour matching on packed pixels. Every pixel's B, G & R are packed into one uint32 (R << 16 | G << 8 | B, alpha
+# ignored), so a set of colours, or all colours within a tolerance radius, becomes a 2^24 entry boolean table over the
+# packed values and matching a whole image is a single lookup pass. A ColourIndex (the distinct packed colours of an
+# image and their pixel counts) is built once per image state and answers "how many pixels match" without touching the
+# pixels again
+colourTableSize = 1 << 24
+exactMatchColours = 4
+colourIndexCacheSize = 2
+
+
+def packColours(coloursRGB):
+    coloursRGB = np.asarray(coloursRGB, dtype=np.uint32).reshape(-1, 3)
+    return coloursRGB[:, 0] << 16 | coloursRGB[:, 1] << 8 | coloursRGB[:, 2]
+
+
+def unpackColours(packed):
+    # Inverse of packColours, returns an (N, 3) int32 array of R, G, B
+    packed = np.asarray(packed, dtype=np.uint32)
+    return np.stack((packed >> 16, (packed >> 8) & 0xFF, packed & 0xFF), axis=-1).astype(np.int32)
+
+
+def packedPixels(ImageBGRA):
+    # On little endian machines a contiguous BGRA pixel read as uint32 is A << 24 | R << 16 | G << 8 | B, BGR images
+    # are widened to BGRA by OpenCV first
+    if sys.byteorder == 'little':
+        if ImageBGRA.shape[2] == 4:
+            BGRA = np.ascontiguousarray(ImageBGRA)
+            return np.bitwise_and(BGRA.view(np.uint32)[:, :, 0], 0xFFFFFF)
+
+        packed = cv2.cvtColor(ImageBGRA, cv2.COLOR_BGR2BGRA).view(np.uint32)[:, :, 0]
+        packed &= 0xFFFFFF
+        return packed
+
+    packed = ImageBGRA[:, :, 2].astype(np.uint32) << 16
+    packed |= ImageBGRA[:, :, 1].astype(np.uint32) << 8
+    packed |= ImageBGRA[:, :, 0]
+    return packed
+
+
+@lru_cache(maxsize=2)
+def colourMatchTable(coloursRGB, tolerance=0):
+    # coloursRGB is a tuple of (R, G, B) tuples. An entry is set when its colour lies within the Euclidean RGB distance
+    # tolerance of any of the colours
+    if tolerance <= 0:
+        table = np.zeros(colourTableSize, dtype=bool)
+        table[packColours(coloursRGB)] = True
+        return table
+
+    table = np.zeros((256, 256, 256), dtype=bool)
+    values = np.arange(256, dtype=np.int32)
+
+    for R, G, B in coloursRGB:
+        distance = ((values - R) ** 2)[:, None, None] + ((values - G) ** 2)[None, :, None]
+        distance = distance + ((values - B) ** 2)[None, None, :]
+        table |= distance <= tolerance * tolerance
+
+    return table.reshape(-1)
+
+
+def matchMask(ImageBGRA, coloursRGB, tolerance=0, invert=False):
+    # Per pixel mask of the pixels matching any of the colours (or of those matching none of them with invert)
+    coloursRGB = tuple(tuple(int(value) for value in colour) for colour in coloursRGB)
+    packed = packedPixels(ImageBGRA)
+
+    if tolerance <= 0 and len(coloursRGB) <= exactMatchColours:
+        # A few exact colours are cheaper to compare than to look up
+        targets = packColours(coloursRGB)
+        mask = packed != targets[0]
+        for target in targets[1:]:
+            mask &= packed != target
+        return mask if invert else np.logical_not(mask, out=mask)
+
+    mask = np.take(colourMatchTable(coloursRGB, int(tolerance)), packed)
+    return np.logical_not(mask, out=mask) if invert else mask
+
+
+class ColourIndex:
+    def __init__(self, ImageBGRA):
+        packed = packedPixels(ImageBGRA).ravel()
+
+        # Sorting is cheaper for small images, counting every one of the 2^24 colours for large ones
+        if packed.size < colourTableSize // 4:
+            self.colours, counts = np.unique(packed, return_counts=True)
+            self.counts = counts.astype(np.uint32)
+        else:
+            counts = np.bincount(packed, minlength=colourTableSize)
+            self.colours = np.flatnonzero(counts).astype(np.uint32)
+            self.counts = counts[self.colours].astype(np.uint32)
+
+        self.pixelCount = packed.size
+
+    def distinctColours(self):
+        return len(self.colours)
+
+    def countOf(self, coloursRGB, tolerance=0):
+        coloursRGB = tuple(tuple(int(value) for value in colour) for colour in coloursRGB)
+
+        if tolerance <= 0:
+            targets = np.unique(packColours(coloursRGB))
+            positions = np.searchsorted(self.colours, targets).clip(max=len(self.colours) - 1)
+            return int(self.counts[positions][self.colours[positions] == targets].sum(dtype=np.int64))
+
+        return int(self.counts[colourMatchTable(coloursRGB, int(tolerance))[self.colours]].sum(dtype=np.int64))
+
+    def topColours(self, limit=16):
+        # The most frequent colours as (R, G, B, count), most frequent first
+        order = np.argsort(self.counts)[::-1][:limit]
+        return [tuple(colour) + (int(count),) for colour, count in zip(unpackColours(self.colours[order]).tolist(),
+                                                                      self.counts[order])]
+
+
+class ColourIndexCache:
+    # Keyed by the identity of the array like the preview pyramids, the entry keeps the array alive so the key stays
+    # valid. The images of an editing session are never modified in place, so an index stays valid for its array.
+    # Indexes of large frames are built on a worker thread while the GUI looks up those of the proxy, hence the lock
+    def __init__(self, size=colourIndexCacheSize):
+        self.size = size
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def indexFor(self, ImageBGRA):
+        key = id(ImageBGRA)
+
+        with self.lock:
+            if key in self.indexes:
+                self.indexes.move_to_end(key)
+                return self.indexes[key][1]
+
+        colourIndex = ColourIndex(ImageBGRA)
+
+        with self.lock:
+            self.indexes[key] = (ImageBGRA, colourIndex)
+
+            while len(self.indexes) > self.size:
+                self.indexes.popitem(last=False)
+
+        return colourIndex
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
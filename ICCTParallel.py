@@ -0,0 +1,77 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+import ICCTEngine
+import ICCTTiled
+import ICCTTrace
+
+# Runs a filter chain over one image on every core. Every filter mode is a per-pixel operation, so the frame is cut
+# into row bands that are filtered independently, each band straight from its rows of the input into its rows of the
+# output (views of the same two arrays, so nothing is copied in or out). The kernels are OpenCV / NumPy calls that
+# release the GIL, so the bands run on a thread pool sharing the arrays rather than in processes with shared memory
+bandsPerWorker = 4
+minParallelPixels = 1 << 20
+defaultWorkers = os.cpu_count() or 1
+
+bandExecutors = {}
+bandExecutorsLock = threading.Lock()
+
+
+def bandExecutor(workers):
+    # One long lived pool per worker count, shared by every call
+    with bandExecutorsLock:
+        if workers not in bandExecutors:
+            bandExecutors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ICCTBand')
+
+        return bandExecutors[workers]
+
+
+def bandRowsFor(imageShape, workers, memoryBudgetMB=ICCTTiled.defaultMemoryBudgetMB):
+    # A few bands per worker to even out the load, no larger than the share of the memory budget of one worker
+    H, W = imageShape[:2]
+    return max(1, min(-(-H // (workers * bandsPerWorker)), ICCTTiled.stripRowsFor(W, memoryBudgetMB / workers)))
+
+
+def applyFilterChainParallel(ImageIn, filterChain, ImageOut=None, workers=None,
+                             memoryBudgetMB=ICCTTiled.defaultMemoryBudgetMB, progress=None):
+    # progress(fraction) is called on the calling thread as the bands complete, an exception raised by it (e.g. a
+    # cancellation) drops the bands that have not started and is raised once the running ones have finished
+    workers = workers or defaultWorkers
+
+    if workers == 1 or ImageIn.shape[0] * ImageIn.shape[1] < minParallelPixels:
+        return ICCTTiled.applyFilterChainTiled(ImageIn, filterChain, ImageOut, memoryBudgetMB, progress)
+
+    if ImageOut is None:
+        ImageOut = np.empty_like(ImageIn)
+
+    compiledChain = ICCTEngine.compileFilterChain(filterChain)
+    imageHeight = ImageIn.shape[0]
+    executor = bandExecutor(workers)
+
+    with ICCTTrace.stage('filter', 'parallel x%d' % workers):
+        pending = {executor.submit(ICCTEngine.applyCompiledChain, ImageIn[top:bottom], compiledChain,
+                                   ImageOut[top:bottom], (top, imageHeight)): bottom - top
+                   for top, bottom in ICCTTiled.iterStrips(imageHeight, bandRowsFor(ImageIn.shape, workers,
+                                                                                    memoryBudgetMB))}
+        rowsDone = 0
+
+        try:
+            while pending:
+                done, notDone = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    future.result()
+                    rowsDone += pending.pop(future)
+
+                if progress is not None:
+                    progress(rowsDone / imageHeight)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            raise
+
+    return ImageOut
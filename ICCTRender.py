@@ -0,0 +1,236 @@
+import math
+import threading
+from collections import OrderedDict
+
+import cv2
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+import ICCTTrace
+
+pyramidCacheSize = 4
+
+# Levels halved from frames larger than this are built in the background when the renderer has a way to do so
+inlinePyramidPixels = 1 << 20
+
+
+class TracedFigureCanvasTkAgg(FigureCanvasTkAgg):
+    # draw_idle defers the actual drawing until Tk is idle, so the render stage is timed around the draw itself
+    def draw(self):
+        with ICCTTrace.stage('render'):
+            super().draw()
+
+
+class ImagePyramid:
+    # Levels are built lazily by halving the previous level, level 0 being the image itself (no copy). They may be
+    # built on a worker thread while the main thread reads the levels already built
+    def __init__(self, ImageBGRA):
+        self.levels = [ImageBGRA]
+        self.lock = threading.Lock()
+
+    def level(self, index):
+        with self.lock:
+            while len(self.levels) <= index:
+                previous = self.levels[-1]
+                H, W = previous.shape[:2]
+
+                if H == 1 and W == 1:
+                    return previous
+
+                with ICCTTrace.stage('pyramid', len(self.levels)):
+                    self.levels.append(cv2.resize(previous, (max(1, W // 2), max(1, H // 2)),
+                                                  interpolation=cv2.INTER_AREA))
+
+            return self.levels[index]
+
+    def builtLevel(self, index):
+        # The level if it has already been built, without building it. None otherwise
+        if index < len(self.levels):
+            return self.levels[index]
+
+        H, W = self.levels[-1].shape[:2]
+        return self.levels[-1] if H == 1 and W == 1 else None
+
+    def buildsInline(self):
+        H, W = self.levels[-1].shape[:2]
+        return H * W <= inlinePyramidPixels
+
+
+class PreviewRenderer:
+    def __init__(self, figure, canvas, runBackground=None):
+        # runBackground(work, onDone) runs work() off the main thread and onDone() back on it once work is done (or
+        # dropped), the pyramid levels of large frames are then built there and what is on screen stays meanwhile
+        self.figure = figure
+        self.canvas = canvas
+        self.runBackground = runBackground
+        self.pendingLevel = None
+
+        self.plot = None
+        self.artist = None
+
+        self.overlay = None
+        self.overlayOutline = None
+
+        self.ImageBGRA = None
+        self.pyramid = None
+        self.pyramids = OrderedDict()
+        self.fullShape = None
+
+        self.renderPending = False
+        self.resizeCID = self.canvas.mpl_connect('resize_event', self.viewChangeEvent)
+
+    def clear(self):
+        self.figure.clear()
+        self.plot = None
+        self.artist = None
+
+        self.overlay = None
+        self.overlayOutline = None
+
+        self.ImageBGRA = None
+        self.pyramid = None
+        self.pyramids.clear()
+        self.pendingLevel = None
+        self.fullShape = None
+
+    def pyramidFor(self, ImageBGRA):
+        # Keyed by the identity of the array, the array itself is kept alive by the entry so the key stays valid
+        key = id(ImageBGRA)
+
+        if key in self.pyramids:
+            self.pyramids.move_to_end(key)
+        else:
+            self.pyramids[key] = ImagePyramid(ImageBGRA)
+
+            while len(self.pyramids) > pyramidCacheSize:
+                self.pyramids.popitem(last=False)
+
+        return self.pyramids[key]
+
+    def setImage(self, ImageBGRA, fullShape):
+        # fullShape is the (H, W) of the full resolution image, ImageBGRA may be a reduced resolution proxy of it.
+        # The image is always drawn over the full resolution extent
+        fullShape = tuple(fullShape[:2])
+
+        if self.plot is None or fullShape != self.fullShape:
+            self.figure.clear()
+            self.plot = self.figure.add_subplot()
+            self.artist = None
+
+            H, W = fullShape
+            self.plot.set_xlim(-0.5, W - 0.5)
+            self.plot.set_ylim(H - 0.5, -0.5)
+            self.plot.set_aspect('equal')
+            self.plot.set_autoscale_on(False)
+
+            self.plot.callbacks.connect('xlim_changed', self.viewChangeEvent)
+            self.plot.callbacks.connect('ylim_changed', self.viewChangeEvent)
+
+            self.overlay = None
+            self.drawOverlay()
+
+        self.fullShape = fullShape
+        self.ImageBGRA = ImageBGRA
+        self.pyramid = self.pyramidFor(ImageBGRA)
+
+        self.render()
+
+    def setOverlay(self, points, colour=None, closed=True):
+        # An outline drawn over the image (e.g. a region), points in full resolution coordinates. None hides it
+        self.overlayOutline = None if points is None else (list(points) + list(points[:1] if closed else []), colour)
+        self.drawOverlay()
+
+    def drawOverlay(self):
+        if self.plot is None:
+            return
+
+        if self.overlayOutline is None:
+            if self.overlay is not None:
+                self.overlay.set_visible(False)
+        else:
+            points, colour = self.overlayOutline
+            xs, ys = [x for x, y in points], [y for x, y in points]
+
+            if self.overlay is None:
+                self.overlay = self.plot.plot(xs, ys, color=colour, linewidth=1, linestyle='--')[0]
+            else:
+                self.overlay.set_data(xs, ys)
+                self.overlay.set_color(colour)
+                self.overlay.set_visible(True)
+
+        self.canvas.draw_idle()
+
+    def viewChangeEvent(self, *kwargs):
+        # Pan / zoom change both the x & y limits, so the re-render is deferred until Tk is idle to do it once
+        if self.pyramid is not None and not self.renderPending:
+            self.renderPending = True
+            self.canvas.get_tk_widget().after_idle(self.render)
+
+    def render(self):
+        self.renderPending = False
+
+        if self.pyramid is None:
+            return
+
+        H, W = self.fullShape
+        (x0, x1), (y1, y0) = sorted(self.plot.get_xlim()), sorted(self.plot.get_ylim(), reverse=True)
+
+        # Pick the coarsest level that still has at least one image pixel per screen pixel
+        bbox = self.plot.get_window_extent()
+        screenScale = max(bbox.width / max(x1 - x0, 1e-6), bbox.height / max(y1 - y0, 1e-6))
+        baseScale = self.ImageBGRA.shape[1] / W
+
+        levelIndex = 0
+        if baseScale > screenScale > 0:
+            levelIndex = int(math.floor(math.log2(baseScale / screenScale)))
+
+        Level = self.pyramid.builtLevel(levelIndex)
+
+        if Level is None:
+            if self.runBackground is not None and not self.pyramid.buildsInline():
+                self.buildLevel(self.pyramid, levelIndex)
+                return
+
+            Level = self.pyramid.level(levelIndex)
+
+        h, w = Level.shape[:2]
+        scaleX, scaleY = w / W, h / H
+
+        # Crop the visible region of the level (in level pixels) and place it back over the full resolution extent
+        i0 = min(w, max(0, int(math.floor((x0 + 0.5) * scaleX))))
+        i1 = min(w, max(0, int(math.ceil((x1 + 0.5) * scaleX))))
+        j0 = min(h, max(0, int(math.floor((y0 + 0.5) * scaleY))))
+        j1 = min(h, max(0, int(math.ceil((y1 + 0.5) * scaleY))))
+
+        if i1 <= i0 or j1 <= j0:
+            if self.artist is not None:
+                self.artist.set_visible(False)
+            self.canvas.draw_idle()
+            return
+
+        with ICCTTrace.stage('convert'):
+            CropRGBA = cv2.cvtColor(Level[j0:j1, i0:i1],
+                                    cv2.COLOR_BGRA2RGBA if Level.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+        extent = (i0 / scaleX - 0.5, i1 / scaleX - 0.5, j1 / scaleY - 0.5, j0 / scaleY - 0.5)
+
+        if self.artist is None:
+            self.artist = self.plot.imshow(CropRGBA, extent=extent)
+        else:
+            self.artist.set_data(CropRGBA)
+            self.artist.set_extent(extent)
+            self.artist.set_visible(True)
+
+        self.canvas.draw_idle()
+
+    def buildLevel(self, pyramid, levelIndex):
+        if self.pendingLevel == (pyramid, levelIndex):
+            return
+
+        self.pendingLevel = (pyramid, levelIndex)
+
+        def built():
+            if self.pendingLevel == (pyramid, levelIndex):
+                self.pendingLevel = None
+            if pyramid is self.pyramid:
+                self.render()
+
+        self.runBackground(lambda: pyramid.level(levelIndex), built)
@@ -0,0 +1,440 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import ICCTEngine
+
+# The filter engine as a local HTTP service. Request threads only parse and queue jobs, a bounded pool of worker
+# threads decodes, filters & encodes them (OpenCV / NumPy release the GIL). The job queue is bounded: a full queue turns
+# new jobs away with 503 + Retry-After instead of letting the backlog (and the memory held by the uploads) grow. Small
+# images with the same filter chain are batched: a worker takes every queued job of its chain at once and filters the
+# images of the same width stacked into one frame (every filter acts on each pixel alone, so this is exact)
+#
+#   POST /process        image bytes (query: filter=MODE:R,G,B[@rect:x0,y0,x1,y1] ..., format=png, preset=Fast,
+#                        async=1) or JSON {"path", "output", "filters", "format", "preset", "async"} for images on a
+#                        shared disk
+#   GET  /jobs/<id>      the job's state, or its result once done (query: wait=seconds)
+#   GET  /metrics        queue depth, throughput, batching & latency percentiles
+defaultHost = '127.0.0.1'
+defaultPort = 8765
+defaultQueueSize = 64
+defaultRequestTimeout = 300.0
+smallImageBytes = 1 << 20
+smallImagePixels = 1 << 20
+maxBatchSize = 16
+maxFinishedJobs = 1024
+latencyWindow = 4096
+latencyPercentiles = (50, 90, 99)
+maxUploadBytes = 256 * 1024 * 1024
+retryAfterSeconds = 1
+outputFormats = {'png': '.png', 'jpg': '.jpg', 'jpeg': '.jpg', 'bmp': '.bmp'}
+contentTypes = {'.png': 'image/png', '.jpg': 'image/jpeg', '.bmp': 'image/bmp'}
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, jobID, filterChain, imageData=None, inputPath=None, outputPath=None, extension='.png',
+                 saveOptions=None):
+        self.id = jobID
+        self.filterChain = filterChain
+        self.chainKey = tuple(ICCTEngine.formatFilterStep(filterStep) for filterStep in filterChain)
+
+        self.imageData = imageData
+        self.inputPath = inputPath
+        self.outputPath = outputPath
+        self.extension = extension
+        self.saveOptions = saveOptions
+
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.batchSize = None
+
+        self.submittedAt = time.perf_counter()
+        self.startedAt = None
+        self.finishedAt = None
+        self.finished = threading.Event()
+
+    def status(self):
+        status = {'job': self.id, 'state': self.state}
+
+        if self.error is not None:
+            status['error'] = self.error
+        if self.outputPath is not None and self.state == 'done':
+            status['output'] = self.outputPath
+        if self.finishedAt is not None:
+            status.update(queued_ms=(self.startedAt - self.submittedAt) * 1000,
+                          processing_ms=(self.finishedAt - self.startedAt) * 1000, batch=self.batchSize)
+
+        return status
+
+
+class ProcessingService:
+    def __init__(self, workers=None, queueSize=defaultQueueSize):
+        self.workers = workers or os.cpu_count() or 1
+        self.queueSize = queueSize
+
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.running = True
+
+        # Finished jobs are kept (with their results) until maxFinishedJobs newer ones have finished
+        self.jobs = OrderedDict()
+        self.finishedIDs = deque()
+        self.jobIDs = itertools.count(1)
+
+        self.startedAt = time.time()
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'batches': 0, 'batched_jobs': 0}
+        self.queueLatencies = deque(maxlen=latencyWindow)
+        self.processingLatencies = deque(maxlen=latencyWindow)
+        self.totalLatencies = deque(maxlen=latencyWindow)
+        self.active = 0
+
+        self.threads = [threading.Thread(target=self.work, name='ICCTServiceWorker-%d' % index, daemon=True)
+                        for index in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, filterChain, **jobArgs):
+        with self.condition:
+            if len(self.pending) >= self.queueSize:
+                self.counters['rejected'] += 1
+                raise ServiceBusy()
+
+            job = Job(str(next(self.jobIDs)), filterChain, **jobArgs)
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self.counters['submitted'] += 1
+            self.condition.notify()
+
+        return job
+
+    def job(self, jobID):
+        with self.condition:
+            return self.jobs.get(jobID)
+
+    def nextBatch(self):
+        # The oldest job, plus (while small images are being served) the other queued jobs of its filter chain
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait()
+
+            if not self.running:
+                return None
+
+            job = self.pending.popleft()
+            batch = [job]
+
+            if job.imageData is not None and len(job.imageData) <= smallImageBytes:
+                for queuedJob in list(self.pending):
+                    if len(batch) >= maxBatchSize:
+                        break
+
+                    if queuedJob.chainKey == job.chainKey and queuedJob.imageData is not None and \
+                            len(queuedJob.imageData) <= smallImageBytes:
+                        self.pending.remove(queuedJob)
+                        batch.append(queuedJob)
+
+            self.active += 1
+            startedAt = time.perf_counter()
+            for batchJob in batch:
+                batchJob.state, batchJob.startedAt, batchJob.batchSize = 'running', startedAt, len(batch)
+
+            return batch
+
+    def work(self):
+        while True:
+            batch = self.nextBatch()
+            if batch is None:
+                return
+
+            try:
+                self.processBatch(batch)
+            finally:
+                with self.condition:
+                    self.active -= 1
+
+    def processBatch(self, batch):
+        images = {}
+
+        for job in batch:
+            try:
+                images[job] = ICCTEngine.loadImage(job.inputPath) if job.inputPath is not None else \
+                    ICCTEngine.decodeImage(job.imageData)
+                job.imageData = None
+            except Exception as e:
+                self.finish(job, error=str(e))
+
+        # Small images of the same width, channels & depth are filtered as one stacked frame, anything else on its own.
+        # Regions are placed on the whole frame, so chains with region steps are never stacked
+        compiledChain = ICCTEngine.compileFilterChain(batch[0].filterChain)
+        stackable = not ICCTEngine.chainHasRegions(batch[0].filterChain)
+        groups = OrderedDict()
+
+        for job, ImageBGRA in images.items():
+            small = stackable and ImageBGRA.shape[0] * ImageBGRA.shape[1] <= smallImagePixels
+            key = ImageBGRA.shape[1:] + (ImageBGRA.dtype.str,) if small else job
+            groups.setdefault(key, []).append(job)
+
+        for groupJobs in groups.values():
+            try:
+                # The decoded images are only used once, so they are filtered in place
+                if len(groupJobs) == 1:
+                    ImageBGRA = images[groupJobs[0]]
+                    filteredImages = [ICCTEngine.applyCompiledChain(ImageBGRA, compiledChain, ImageBGRA)]
+                else:
+                    rows = np.cumsum([images[job].shape[0] for job in groupJobs])[:-1]
+                    ImageStack = np.concatenate([images[job] for job in groupJobs])
+                    filteredImages = np.split(ICCTEngine.applyCompiledChain(ImageStack, compiledChain, ImageStack),
+                                              rows)
+            except Exception as e:
+                for job in groupJobs:
+                    self.finish(job, error=str(e))
+                continue
+
+            for job, ImageBGRA in zip(groupJobs, filteredImages):
+                try:
+                    if job.outputPath is not None:
+                        ICCTEngine.saveImage(job.outputPath, ImageBGRA, job.saveOptions)
+                        self.finish(job)
+                    else:
+                        self.finish(job, ICCTEngine.encodeImage(job.extension, ImageBGRA, job.saveOptions))
+                except Exception as e:
+                    self.finish(job, error=str(e))
+
+        if len(batch) > 1:
+            with self.condition:
+                self.counters['batches'] += 1
+                self.counters['batched_jobs'] += len(batch)
+
+    def finish(self, job, result=None, error=None):
+        job.finishedAt = time.perf_counter()
+        job.result, job.error = result, error
+        job.state = 'failed' if error is not None else 'done'
+
+        with self.condition:
+            self.counters['failed' if error is not None else 'completed'] += 1
+            self.queueLatencies.append(job.startedAt - job.submittedAt)
+            self.processingLatencies.append(job.finishedAt - job.startedAt)
+            self.totalLatencies.append(job.finishedAt - job.submittedAt)
+
+            self.finishedIDs.append(job.id)
+            while len(self.finishedIDs) > maxFinishedJobs:
+                self.jobs.pop(self.finishedIDs.popleft(), None)
+
+        job.finished.set()
+
+    def metrics(self):
+        def percentiles(latencies):
+            if not latencies:
+                return None
+            return {'p%d_ms' % percentile: value * 1000
+                    for percentile, value in zip(latencyPercentiles, np.percentile(latencies, latencyPercentiles))}
+
+        with self.condition:
+            uptime = time.time() - self.startedAt
+            metrics = dict(self.counters, queue_depth=len(self.pending), queue_size=self.queueSize,
+                           active_workers=self.active, workers=self.workers, uptime_s=uptime,
+                           jobs_per_s=self.counters['completed'] / uptime if uptime > 0 else 0.0,
+                           latency={'queued': percentiles(list(self.queueLatencies)),
+                                    'processing': percentiles(list(self.processingLatencies)),
+                                    'total': percentiles(list(self.totalLatencies))})
+
+        metrics['mean_batch_size'] = metrics['batched_jobs'] / metrics['batches'] if metrics['batches'] else None
+        return metrics
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'ICCTServer'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def sendJSON(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def sendError(self, status, message, headers=()):
+        self.sendJSON(status, {'error': message}, headers)
+
+    def sendResult(self, job):
+        if job.state == 'failed':
+            self.sendJSON(422, job.status())
+        elif job.result is None:
+            self.sendJSON(200, job.status())
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', contentTypes.get(job.extension, 'application/octet-stream'))
+            self.send_header('Content-Length', str(len(job.result)))
+            self.send_header('X-ICCT-Job', job.id)
+            self.end_headers()
+            self.wfile.write(job.result)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/metrics':
+            self.sendJSON(200, self.server.service.metrics())
+            return
+
+        if url.path.startswith('/jobs/'):
+            job = self.server.service.job(url.path[len('/jobs/'):])
+            if job is None:
+                self.sendError(404, "Unknown job")
+                return
+
+            try:
+                job.finished.wait(min(float(query.get('wait', ['0'])[0]), self.server.requestTimeout))
+            except ValueError:
+                self.sendError(400, "Invalid wait")
+                return
+
+            if job.finished.is_set():
+                self.sendResult(job)
+            else:
+                self.sendJSON(200, job.status())
+            return
+
+        self.sendError(404, "Not found")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+
+        if url.path != '/process':
+            self.sendError(404, "Not found")
+            return
+
+        # The body of a request with an unreadable length cannot be skipped, so the connection is closed
+        try:
+            contentLength = int(self.headers.get('Content-Length', 0))
+            if contentLength < 0:
+                raise ValueError
+        except ValueError:
+            self.sendError(400, "Invalid Content-Length", [('Connection', 'close')])
+            self.close_connection = True
+            return
+
+        if contentLength > maxUploadBytes:
+            self.sendError(413, "Upload larger than %d bytes" % maxUploadBytes, [('Connection', 'close')])
+            self.close_connection = True
+            return
+
+        body = self.rfile.read(contentLength)
+
+        try:
+            if self.headers.get('Content-Type', '').split(';')[0].strip() == 'application/json':
+                request = json.loads(body)
+                if not isinstance(request, dict) or 'path' not in request:
+                    raise ValueError("JSON requests need the path of the image")
+                if isinstance(request.get('filters'), str):
+                    request['filters'] = [request['filters']]
+                jobArgs = {'inputPath': request['path'], 'outputPath': request.get('output')}
+                defaultFormat = os.path.splitext(request['path'])[1][1:]
+            else:
+                query = parse_qs(url.query)
+                request = {key: values[0] for key, values in query.items()}
+                request['filters'] = query.get('filter', [])
+                if not body:
+                    raise ValueError("No image in the request")
+                jobArgs = {'imageData': body}
+                defaultFormat = 'png'
+
+            outputFormat = str(request.get('format') or defaultFormat).lower().lstrip('.')
+            if outputFormat not in outputFormats:
+                raise ValueError("Unsupported format: %s" % outputFormat)
+            if request.get('preset') is not None and request['preset'] not in ICCTEngine.savePresets:
+                raise ValueError("Unknown preset: %s" % request['preset'])
+
+            filterSteps = request.get('filters') or []
+            if not isinstance(filterSteps, list) or not all(isinstance(filterStep, str) for filterStep in filterSteps):
+                raise ValueError("Filters must be a list of MODE:R,G,B strings")
+
+            filterChain = [ICCTEngine.parseFilterStep(filterStep) for filterStep in filterSteps]
+            runAsync = str(request.get('async', '')).lower() in ('1', 'true', 'yes')
+        except (ValueError, TypeError, KeyError) as e:
+            self.sendError(400, str(e))
+            return
+
+        try:
+            job = self.server.service.submit(filterChain, extension=outputFormats[outputFormat],
+                                             saveOptions=ICCTEngine.savePresets.get(request.get('preset')), **jobArgs)
+        except ServiceBusy:
+            self.sendError(503, "Queue full", [('Retry-After', str(retryAfterSeconds))])
+            return
+
+        if runAsync:
+            self.sendJSON(202, {'job': job.id, 'status': '/jobs/%s' % job.id}, [('Location', '/jobs/%s' % job.id)])
+        elif job.finished.wait(self.server.requestTimeout):
+            self.sendResult(job)
+        else:
+            self.sendJSON(202, job.status(), [('Location', '/jobs/%s' % job.id)])
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, requestTimeout=defaultRequestTimeout, quiet=False):
+        super().__init__(address, ServiceRequestHandler)
+        self.service = service
+        self.requestTimeout = requestTimeout
+        self.quiet = quiet
+
+
+def runServer(host=defaultHost, port=defaultPort, workers=None, queueSize=defaultQueueSize, quiet=False, log=print):
+    service = ProcessingService(workers, queueSize)
+    server = ServiceHTTPServer((host, port), service, quiet=quiet)
+
+    log("ICCT service on http://%s:%d with %d worker(s), queue of %d" % (host, server.server_port, service.workers,
+                                                                        queueSize))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ICCTServer', description='Serve the ICCT filters over local HTTP')
+    parser.add_argument('--host', default=defaultHost, help='address to listen on (default: %s)' % defaultHost)
+    parser.add_argument('-p', '--port', type=int, default=defaultPort, help='port (default: %d)' % defaultPort)
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker threads (default: all cores)')
+    parser.add_argument('-q', '--queue-size', type=int, default=defaultQueueSize,
+                        help='queued jobs before new ones are refused with 503 (default: %d)' % defaultQueueSize)
+    parser.add_argument('--quiet', action='store_true', help='do not log every request')
+    args = parser.parse_args(argv)
+
+    runServer(args.host, args.port, args.workers, args.queue_size, args.quiet)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
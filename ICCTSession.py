@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import ICCTEngine
+
+defaultCacheLimitMB = 1024
+prefetchNeighbours = 1
+
+
+def folderImages(folderPath):
+    return sorted((os.path.join(folderPath, name) for name in os.listdir(folderPath)
+                   if name.lower().endswith(ICCTEngine.imageExtensions)), key=lambda path: path.lower())
+
+
+def imageKey(imagePath):
+    # A file changed on disk gets a new key, so it is decoded again rather than served from the cache
+    imagePath = os.path.abspath(imagePath)
+    return imagePath, os.stat(imagePath).st_mtime_ns
+
+
+class SessionImage:
+    # A decoded image of the session together with the processed state it was left in. ImageOriginal is None while
+    # only the reduced resolution preview has been decoded, ImageBGRA is the full resolution image of realisedChain
+    def __init__(self, key, ProxyOriginal, fullShape, ImageOriginal=None):
+        self.key = key
+        self.path = key[0]
+
+        self.ProxyOriginal = ProxyOriginal
+        self.fullShape = tuple(fullShape[:2])
+        self.ImageOriginal = ImageOriginal
+
+        self.History = None
+        self.FilterChain = []
+        self.ImageBGRA = ImageOriginal
+        self.realisedChain = () if ImageOriginal is not None else None
+
+    def nbytes(self):
+        frames = {id(Image): Image for Image in (self.ProxyOriginal, self.ImageOriginal, self.ImageBGRA)
+                  if Image is not None}
+        return sum(Image.nbytes for Image in frames.values())
+
+
+class ImageSession:
+    # The images of one folder. Decoded images (and their processed states) are kept in an LRU cache with a memory cap,
+    # the image being viewed is never evicted. The neighbours of the viewed image are decoded ahead on a prefetch
+    # thread, and loading an image that is being prefetched waits for that decode instead of starting another one
+    def __init__(self, previewSize, memoryLimitMB=defaultCacheLimitMB, neighbours=prefetchNeighbours):
+        self.previewSize = previewSize
+        self.memoryLimit = memoryLimitMB * 1024 * 1024
+        self.neighbours = neighbours
+
+        self.paths = []
+        self.position = None
+
+        self.images = OrderedDict()
+        self.viewedKey = None
+        self.prefetching = {}
+        self.generation = 0
+        self.lock = threading.RLock()
+
+        self.prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ICCTPrefetch')
+
+    def openFolderOf(self, imagePath):
+        imagePath = os.path.abspath(imagePath)
+        self.paths = folderImages(os.path.dirname(imagePath))
+
+        if imagePath not in self.paths:
+            self.paths.append(imagePath)
+        self.position = self.paths.index(imagePath)
+
+    def adjacentPath(self, offset):
+        if self.position is None or not 0 <= self.position + offset < len(self.paths):
+            return None
+
+        return self.paths[self.position + offset]
+
+    def describe(self):
+        return "%s  (%d / %d)" % (os.path.basename(self.paths[self.position]), self.position + 1, len(self.paths))
+
+    def load(self, imagePath):
+        # Called on the GUI's worker thread. Cached images are returned as they are (processed state included),
+        # anything else is opened from its preview decode (see ICCTEngine.loadPreview)
+        key, generation = imageKey(imagePath), self.generation
+
+        with self.lock:
+            if key in self.images:
+                self.images.move_to_end(key)
+                return self.images[key]
+
+            prefetch = self.prefetching.get(key)
+
+        if prefetch is not None:
+            try:
+                return prefetch.result()
+            except (CancelledError, Exception):
+                pass
+
+        SessionImageNew = SessionImage(key, *ICCTEngine.loadPreview(imagePath, *self.previewSize))
+        self.store(SessionImageNew, generation)
+        return SessionImageNew
+
+    def view(self, SessionImageViewed):
+        # Marks the image being viewed and starts prefetching its neighbours
+        with self.lock:
+            self.viewedKey = SessionImageViewed.key
+            if SessionImageViewed.path in self.paths:
+                self.position = self.paths.index(SessionImageViewed.path)
+
+        self.prefetchNeighbours()
+
+    def discard(self, imagePath):
+        # Drops an image that could not be opened from the folder, so stepping goes past it
+        imagePath = os.path.abspath(imagePath)
+
+        with self.lock:
+            if imagePath in self.paths:
+                self.paths.remove(imagePath)
+
+            if self.viewedKey is not None and self.viewedKey[0] in self.paths:
+                self.position = self.paths.index(self.viewedKey[0])
+
+    def decodeOriginal(self, SessionImageDecoded):
+        # Full resolution decode of an image opened from its preview decode (run on the GUI's worker thread)
+        generation = self.generation
+
+        ImageOriginal = ICCTEngine.loadImage(SessionImageDecoded.path)
+        SessionImageDecoded.ImageOriginal = ImageOriginal
+
+        if SessionImageDecoded.History is not None:
+            SessionImageDecoded.History.setOriginal(ImageOriginal)
+
+        self.store(SessionImageDecoded, generation)
+        return ImageOriginal
+
+    def store(self, SessionImageStored, generation=None):
+        # (Re-)inserts an image as the most recently used one, after a change of its frames or processed state. Images
+        # decoded for a session that was cleared in the meantime (generation) are not cached
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self.images[SessionImageStored.key] = SessionImageStored
+            self.images.move_to_end(SessionImageStored.key)
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            cacheBytes = sum(SessionImageCached.nbytes() for SessionImageCached in self.images.values())
+
+            for key in list(self.images):
+                if cacheBytes <= self.memoryLimit:
+                    break
+
+                if key != self.viewedKey:
+                    cacheBytes -= self.images.pop(key).nbytes()
+
+    def prefetchNeighbours(self):
+        wanted = []
+        for distance in range(1, self.neighbours + 1):
+            for offset in (distance, -distance):
+                imagePath = self.adjacentPath(offset)
+
+                if imagePath is not None and os.path.exists(imagePath):
+                    wanted.append(imageKey(imagePath))
+
+        with self.lock:
+            # Prefetches of images that are no longer neighbours are dropped if they have not started yet
+            for key, prefetch in list(self.prefetching.items()):
+                if key not in wanted and prefetch.cancel():
+                    del self.prefetching[key]
+
+            for key in wanted:
+                if key not in self.images and key not in self.prefetching:
+                    self.prefetching[key] = self.prefetcher.submit(self.prefetch, key)
+
+    def prefetch(self, key):
+        generation = self.generation
+
+        try:
+            ImageOriginal = ICCTEngine.loadImage(key[0])
+            SessionImagePrefetched = SessionImage(key, ICCTEngine.makeProxy(ImageOriginal, *self.previewSize),
+                                                  ImageOriginal.shape, ImageOriginal)
+            self.store(SessionImagePrefetched, generation)
+
+            return SessionImagePrefetched
+        finally:
+            with self.lock:
+                self.prefetching.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            for prefetch in self.prefetching.values():
+                prefetch.cancel()
+
+            self.prefetching.clear()
+            self.images.clear()
+            self.generation += 1
+            self.viewedKey = None
+            self.paths = []
+            self.position = None
+
+    def shutdown(self):
+        self.clear()
+        self.prefetcher.shutdown(wait=False)
@@ -0,0 +1,98 @@
+import importlib
+import os
+import sys
+import time
+
+import ICCTTrace
+
+# Cold start of the GUI. The heavy modules (NumPy, OpenCV and the engine built on them, Matplotlib) are stand-ins
+# until their first use, so the window shows as soon as Tk has built it, and they are then imported on the worker
+# thread while the window is already up. The time of every startup milestone is measured from the start of the
+# process (interpreter startup included where the OS reports it) and checked against the cold start target
+coldStartTargetSeconds = 1.0
+targetMilestone = 'window'
+
+
+def processStartTime():
+    # perf_counter time at which the process started, read from /proc on Linux, else the import of this module
+    try:
+        with open('/proc/self/stat') as stat:
+            startTicks = int(stat.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as uptime:
+            upSeconds = float(uptime.read().split()[0])
+
+        return time.perf_counter() - max(0.0, upSeconds - startTicks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter()
+
+
+processStart = processStartTime()
+milestones = {'interpreter': time.perf_counter() - processStart}
+importTimes = {}
+
+
+def importModule(name):
+    # Imports already done (or under way on another thread) are not timed again
+    if name in sys.modules:
+        return importlib.import_module(name)
+
+    startTime = time.perf_counter()
+    with ICCTTrace.stage('import', name):
+        module = importlib.import_module(name)
+    importTimes.setdefault(name, time.perf_counter() - startTime)
+
+    return module
+
+
+class LazyModule:
+    # Stands in for a module until one of its attributes is looked up, which imports it. Python's import lock makes
+    # the first lookups from several threads import it once
+    def __init__(self, name):
+        self.lazyModuleName = name
+        self.lazyModule = None
+
+    def __getattr__(self, attribute):
+        # Only called for the attributes the stand-in itself lacks, i.e. those of the module
+        if self.lazyModule is None:
+            self.lazyModule = importModule(self.lazyModuleName)
+
+        return getattr(self.lazyModule, attribute)
+
+
+def lazyImport(name):
+    return LazyModule(name)
+
+
+def preloadModules(names, progress=None):
+    # progress(fraction) is called after every module
+    for index, name in enumerate(names):
+        importModule(name)
+
+        if progress is not None:
+            progress((index + 1) / len(names))
+
+
+def milestone(name):
+    # Only the first time of every milestone counts
+    return milestones.setdefault(name, time.perf_counter() - processStart)
+
+
+def targetMet():
+    return targetMilestone in milestones and milestones[targetMilestone] <= coldStartTargetSeconds
+
+
+def report():
+    lines = ["Startup (seconds since the process started):"]
+
+    for name, seconds in milestones.items():
+        lines.append("  %-12s %7.3f s" % (name, seconds))
+
+    if targetMilestone in milestones:
+        lines.append("Cold start target: %s within %.2f s - %s" % (targetMilestone, coldStartTargetSeconds,
+                                                                   "met" if targetMet() else "MISSED"))
+
+    if importTimes:
+        lines.append("Imports (ms, nested imports included in the first to need them):")
+        lines.extend("  %-36s %7.1f" % (name, seconds * 1000) for name, seconds in importTimes.items())
+
+    return "\n".join(lines)
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import ICCTEngine
+
+# Per-channel statistics of the frames of an image. Everything (min / max / mean / clipped pixels) is derived from the
+# 256-bin histograms, and the point modes (Adjust / Intensity / Inverse) map every channel value on its own, so the
+# histogram after such a step is the previous histogram remapped through the step's value table: 256 operations per
+# channel instead of a pass over the pixels. Ceiling / Floor blacken a pixel by looking at all of its channels, and
+# the other modes mix the channels (and a step limited to a region only maps some of the pixels), so their histograms
+# are counted from the image again
+statsCacheSize = 64
+statsChannels = ('Red', 'Green', 'Blue')
+
+
+class ImageStats:
+    def __init__(self, histograms):
+        # histograms: (3, 256) pixel counts in R / G / B order
+        self.histograms = np.asarray(histograms, dtype=np.int64)
+        self.pixelCount = int(self.histograms[0].sum())
+
+    @classmethod
+    def fromImage(cls, ImageBGRA):
+        return cls(ICCTEngine.channelHistograms(ImageBGRA))
+
+    def remapped(self, valueTable):
+        # valueTable: (256, 3) new value of every value, B / G / R columns like the compiled lookup tables
+        return ImageStats([np.bincount(valueTable[:, column], weights=histogram, minlength=256)[:256]
+                           for histogram, column in zip(self.histograms, (2, 1, 0))])
+
+    def minimum(self):
+        return [int(np.flatnonzero(histogram)[0]) if self.pixelCount else 0 for histogram in self.histograms]
+
+    def maximum(self):
+        return [int(np.flatnonzero(histogram)[-1]) if self.pixelCount else 0 for histogram in self.histograms]
+
+    def mean(self):
+        values = np.arange(256)
+        return [float(histogram @ values) / self.pixelCount if self.pixelCount else 0.0
+                for histogram in self.histograms]
+
+    def clippedLow(self):
+        return [int(histogram[0]) for histogram in self.histograms]
+
+    def clippedHigh(self):
+        return [int(histogram[255]) for histogram in self.histograms]
+
+
+def isPointStep(filterStep):
+    return ICCTEngine.stepRegion(filterStep) is None and \
+        ICCTEngine.normaliseMode(filterStep[0]) in ICCTEngine.pointModes
+
+
+def pointValueTable(filterSteps):
+    # The combined value table of a run of point steps, None if any of the steps is not a point step
+    valueTable = ICCTEngine.identityTable()
+
+    for filterStep in filterSteps:
+        if not isPointStep(filterStep):
+            return None
+
+        mode, params = filterStep
+        mode = ICCTEngine.normaliseMode(mode)
+
+        valueTable = ICCTEngine.mapPointStep(valueTable, mode, *params[:3])
+
+    return valueTable
+
+
+class ChainStatsCache:
+    # Statistics keyed by (frame size, filter chain), so the proxy and the full resolution frames of a chain are kept
+    # apart. A chain is derived from its longest cached prefix when every step after that prefix is a point step.
+    # Frames may be counted on a worker thread while the GUI looks up or derives statistics, so the cache is locked
+    def __init__(self, size=statsCacheSize):
+        self.size = size
+        self.stats = OrderedDict()
+        self.lock = threading.RLock()
+
+    def cachedStats(self, filterChain, frameSize):
+        # The statistics of filterChain if they are cached or can be derived without counting, None otherwise
+        filterChain, frameSize = tuple(filterChain), tuple(frameSize[:2])
+
+        with self.lock:
+            if (frameSize, filterChain) in self.stats:
+                self.stats.move_to_end((frameSize, filterChain))
+                return self.stats[frameSize, filterChain]
+
+            for length in range(len(filterChain) - 1, -1, -1):
+                if not isPointStep(filterChain[length]):
+                    break
+
+                if (frameSize, filterChain[:length]) in self.stats:
+                    return self.store(frameSize, filterChain, self.stats[frameSize, filterChain[:length]].remapped(
+                        pointValueTable(filterChain[length:])))
+
+        return None
+
+    def statsFor(self, filterChain, ImageBGRA):
+        # ImageBGRA is the frame of filterChain, only read when the statistics cannot be derived
+        imageStats = self.cachedStats(filterChain, ImageBGRA.shape)
+
+        if imageStats is None:
+            imageStats = self.store(ImageBGRA.shape[:2], tuple(filterChain), ImageStats.fromImage(ImageBGRA))
+
+        return imageStats
+
+    def store(self, frameSize, filterChain, imageStats):
+        with self.lock:
+            self.stats[frameSize, filterChain] = imageStats
+            while len(self.stats) > self.size:
+                self.stats.popitem(last=False)
+
+        return imageStats
+
+    def clear(self):
+        with self.lock:
+            self.stats.clear()
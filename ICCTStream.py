@@ -0,0 +1,321 @@
+import argparse
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import ICCTEngine
+import ICCTTrace
+
+# Streams the frames of a video, a numbered frame sequence or a directory / glob of frames through a filter chain:
+#   decode thread -> bounded frame queue -> filter worker threads -> bounded result queue -> encode thread
+# The filters spend their time in OpenCV / NumPy with the GIL released, so the workers are threads sharing one compiled
+# chain. At most maxFramesInFlight frames exist at any time (including the frames the encoder holds back to write them
+# in order), so the memory use is flat whatever the length of the clip
+videoExtensions = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm', '.wmv', '.mpg', '.mpeg')
+videoFourCCs = {'.mp4': 'mp4v', '.m4v': 'mp4v', '.mov': 'mp4v', '.avi': 'MJPG', '.mkv': 'XVID', '.webm': 'VP80'}
+defaultFourCC = 'mp4v'
+defaultSequenceFPS = 25.0
+defaultQueueDepth = 8
+progressIntervalSeconds = 2.0
+queueWaitSeconds = 0.1
+
+
+class StreamStopped(Exception):
+    pass
+
+
+def isSequencePattern(path):
+    # printf style numbered frames, e.g. frames/shot_%04d.png
+    return '%' in os.path.basename(path)
+
+
+def frameFiles(source):
+    if os.path.isdir(source):
+        candidates = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+    else:
+        candidates = sorted(glob.glob(source))
+
+    return [path for path in candidates if os.path.isfile(path) and path.lower().endswith(ICCTEngine.imageExtensions)]
+
+
+def openFrameSource(source):
+    # Returns (frames, frameCount or None, fps or None), frames yielding the frames in order. Videos & numbered
+    # sequences are read through OpenCV's video capture, directories / globs of frames are decoded file by file
+    if isSequencePattern(source) or (os.path.isfile(source) and source.lower().endswith(videoExtensions)):
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError("Unable to open: %s" % source)
+
+        frameCount = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS) if not isSequencePattern(source) else 0
+
+        def capturedFrames():
+            try:
+                while True:
+                    with ICCTTrace.stage('decode'):
+                        grabbed, frame = capture.read()
+                    if not grabbed:
+                        return
+                    yield frame
+            finally:
+                capture.release()
+
+        return capturedFrames(), frameCount if frameCount > 0 else None, fps if fps > 0 else None
+
+    framePaths = frameFiles(source)
+    if not framePaths:
+        raise ValueError("No frames found: %s" % source)
+
+    return (ICCTEngine.loadImage(path) for path in framePaths), len(framePaths), None
+
+
+class FrameWriter:
+    # Writes the frames to a numbered sequence (a printf style pattern) or to a video file, whose writer is opened
+    # with the size of the first frame. Videos have no alpha channel, BGRA frames are written as BGR
+    def __init__(self, output, fps, fourcc=None):
+        self.output = output
+        self.fps = fps
+        self.fourcc = fourcc or videoFourCCs.get(os.path.splitext(output)[1].lower(), defaultFourCC)
+        self.writer = None
+
+        outputDir = os.path.dirname(output)
+        if outputDir:
+            os.makedirs(outputDir, exist_ok=True)
+
+    def write(self, index, frame):
+        if isSequencePattern(self.output):
+            ICCTEngine.saveImage(self.output % index, frame)
+            return
+
+        if frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+        if self.writer is None:
+            self.writer = cv2.VideoWriter(self.output, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                          (frame.shape[1], frame.shape[0]))
+            if not self.writer.isOpened():
+                raise IOError("Unable to open the video writer (%s) for: %s" % (self.fourcc, self.output))
+
+        with ICCTTrace.stage('save'):
+            self.writer.write(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+class StreamPipeline:
+    def __init__(self, filterChain, workers=None, queueDepth=defaultQueueDepth):
+        self.compiledChain = ICCTEngine.compileFilterChain(filterChain)
+        self.workers = workers or os.cpu_count() or 1
+        self.queueDepth = queueDepth
+        self.maxFramesInFlight = 2 * queueDepth + self.workers
+
+        self.framesDone = 0
+        self.stopEvent = threading.Event()
+        self.errors = []
+
+    def stop(self, error=None):
+        if error is not None:
+            self.errors.append(error)
+        self.stopEvent.set()
+
+    def put(self, frameQueue, item):
+        while True:
+            try:
+                frameQueue.put(item, timeout=queueWaitSeconds)
+                return
+            except queue.Full:
+                if self.stopEvent.is_set():
+                    raise StreamStopped()
+
+    def get(self, frameQueue):
+        while True:
+            try:
+                return frameQueue.get(timeout=queueWaitSeconds)
+            except queue.Empty:
+                if self.stopEvent.is_set():
+                    raise StreamStopped()
+
+    def acquire(self, semaphore):
+        while not semaphore.acquire(timeout=queueWaitSeconds):
+            if self.stopEvent.is_set():
+                raise StreamStopped()
+
+    def decodeFrames(self, frames, frameQueue, inFlight):
+        try:
+            for index, frame in enumerate(frames):
+                self.acquire(inFlight)
+                self.put(frameQueue, (index, frame))
+        except StreamStopped:
+            return
+        except Exception as e:
+            self.stop(e)
+            return
+
+        for worker in range(self.workers):
+            try:
+                self.put(frameQueue, None)
+            except StreamStopped:
+                return
+
+    def filterFrames(self, frameQueue, resultQueue):
+        try:
+            while True:
+                item = self.get(frameQueue)
+                if item is None:
+                    self.put(resultQueue, None)
+                    return
+
+                index, frame = item
+                with ICCTTrace.stage('filter'):
+                    # Decoded frames are only used once, so they are filtered in place
+                    frame = ICCTEngine.applyCompiledChain(frame, self.compiledChain, frame)
+                self.put(resultQueue, (index, frame))
+        except StreamStopped:
+            return
+        except Exception as e:
+            self.stop(e)
+
+    def encodeFrames(self, writer, resultQueue, inFlight, firstIndex, progress):
+        # Frames finish out of order, they are held back until the frames before them have been written
+        pending = {}
+        nextIndex = 0
+        workersDone = 0
+
+        try:
+            while workersDone < self.workers:
+                item = self.get(resultQueue)
+                if item is None:
+                    workersDone += 1
+                    continue
+
+                pending[item[0]] = item[1]
+
+                while nextIndex in pending:
+                    writer.write(firstIndex + nextIndex, pending.pop(nextIndex))
+                    inFlight.release()
+
+                    nextIndex += 1
+                    self.framesDone = nextIndex
+                    if progress is not None:
+                        progress(nextIndex)
+        except StreamStopped:
+            return
+        except Exception as e:
+            self.stop(e)
+
+    def run(self, frames, writer, firstIndex=0, progress=None):
+        frameQueue = queue.Queue(maxsize=self.queueDepth)
+        resultQueue = queue.Queue(maxsize=self.queueDepth)
+        inFlight = threading.BoundedSemaphore(self.maxFramesInFlight)
+
+        decoder = threading.Thread(target=self.decodeFrames, args=(frames, frameQueue, inFlight),
+                                   name='ICCTStreamDecode', daemon=True)
+        encoder = threading.Thread(target=self.encodeFrames, args=(writer, resultQueue, inFlight, firstIndex, progress),
+                                   name='ICCTStreamEncode', daemon=True)
+
+        decoder.start()
+        encoder.start()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ICCTStreamFilter') as executor:
+            for worker in range(self.workers):
+                executor.submit(self.filterFrames, frameQueue, resultQueue)
+
+            # Ctrl+C (or a failed stage) stops every stage at its next queue operation
+            try:
+                while encoder.is_alive():
+                    encoder.join(queueWaitSeconds)
+            except KeyboardInterrupt:
+                self.stop(KeyboardInterrupt())
+                encoder.join()
+
+            self.stopEvent.set()
+
+        decoder.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        return self.framesDone
+
+
+def runStream(source, output, filterChain, workers=None, fps=None, fourcc=None, firstIndex=0,
+              queueDepth=defaultQueueDepth, log=print):
+    frames, frameCount, sourceFPS = openFrameSource(source)
+    writer = FrameWriter(output, fps or sourceFPS or defaultSequenceFPS, fourcc)
+    pipeline = StreamPipeline(filterChain, workers, queueDepth)
+
+    startTime = time.perf_counter()
+    lastReport = [startTime]
+
+    def progress(framesDone):
+        now = time.perf_counter()
+
+        if now - lastReport[0] >= progressIntervalSeconds:
+            lastReport[0] = now
+            log("%s frame(s)%s, %.1f frames/s" % (framesDone, " of %d" % frameCount if frameCount else "",
+                                                  framesDone / (now - startTime)))
+
+    try:
+        framesDone = pipeline.run(frames, writer, firstIndex, progress)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - startTime
+
+    log("Processed %d frame(s) in %.2f s (%.1f frames/s) with %d filter worker(s)" %
+        (framesDone, elapsed, framesDone / elapsed if elapsed > 0 else 0.0, pipeline.workers))
+
+    return framesDone, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ICCTStream',
+                                     description='Apply an ICCT filter chain to a video or a sequence of frames')
+    parser.add_argument('source', help='video file, numbered frame pattern (e.g. shot_%%04d.png), '
+                                       'directory or glob of frames')
+    parser.add_argument('-o', '--output', required=True,
+                        help='output video file, or numbered frame pattern (e.g. out/shot_%%04d.png)')
+    parser.add_argument('-f', '--filter', action='append', default=[], dest='filters', metavar='MODE:R,G,B',
+                        help='filter step, applied in the given order (e.g. Adjust:20,10 or Greyscale). A suffix '
+                             '@rect:x0,y0,x1,y1 or @lasso:x1,y1,x2,y2,... limits it to a region (fractions of the '
+                             'width / height, e.g. Inverse:255@rect:0,0,0.5,0.5)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='filter worker threads (default: all cores)')
+    parser.add_argument('--fps', type=float, default=None,
+                        help='output frame rate (default: that of the video, %g for frames)' % defaultSequenceFPS)
+    parser.add_argument('--fourcc', default=None, help='video codec (default: by output extension, e.g. mp4v)')
+    parser.add_argument('--start', type=int, default=0, help='number of the first output frame of a pattern')
+    parser.add_argument('-q', '--queue-depth', type=int, default=defaultQueueDepth,
+                        help='frames buffered between the stages (default: %d)' % defaultQueueDepth)
+    args = parser.parse_args(argv)
+
+    try:
+        filterChain = [ICCTEngine.parseFilterStep(step) for step in args.filters]
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.fourcc is not None and len(args.fourcc) != 4:
+        parser.error("--fourcc takes a four character code")
+
+    try:
+        runStream(args.source, args.output, filterChain, args.workers, args.fps, args.fourcc, args.start,
+                  args.queue_depth)
+    except KeyboardInterrupt:
+        print("Interrupted")
+        return 1
+    except (ValueError, IOError) as e:
+        print(e)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
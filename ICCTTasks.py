@@ -0,0 +1,123 @@
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Background execution for the GUI. Work functions run one at a time on a single worker thread (so they never race
+# each other on the shared history / caches) and receive their Task, through which they report progress and notice
+# cancellation. Completion callbacks are handed back to the main thread through a queue that is polled with the
+# scheduler of the event loop (Tk's after), so only the main thread ever touches the widgets
+taskPollMS = 40
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, kind, label, cancellable=True):
+        self.kind = kind
+        self.label = label
+        self.cancellable = cancellable
+        self.fraction = None
+        self.cancelEvent = threading.Event()
+
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def cancelled(self):
+        return self.cancelEvent.is_set()
+
+    def checkCancelled(self):
+        if self.cancelEvent.is_set():
+            raise TaskCancelled()
+
+    def progress(self, fraction):
+        # Called by the work function between its units of work (strips, steps, ...), which are also the points at
+        # which it can be cancelled
+        self.checkCancelled()
+        self.fraction = min(1.0, max(0.0, fraction))
+
+
+class TaskRunner:
+    def __init__(self, schedule, onProgress=None):
+        # schedule(ms, callback) runs callback on the main thread, onProgress(task or None) is called on every poll
+        self.schedule = schedule
+        self.onProgress = onProgress
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ICCTWorker')
+        self.results = queue.Queue()
+        self.pending = []
+        self.polling = False
+
+    def submit(self, kind, label, work, onDone=None, onError=None, onCancelled=None, supersede=True,
+               cancellable=True):
+        # A newer task of the same kind supersedes (cancels) the pending ones, unless supersede is False. Tasks that
+        # are not cancellable are left alone by the cancellation requests of the user
+        if supersede:
+            self.cancel(kind)
+
+        task = Task(kind, label, cancellable)
+        self.pending.append(task)
+        self.executor.submit(self.run, task, work, onDone, onError, onCancelled)
+
+        if not self.polling:
+            self.polling = True
+            self.schedule(taskPollMS, self.poll)
+
+        return task
+
+    def run(self, task, work, onDone, onError, onCancelled):
+        try:
+            task.checkCancelled()
+            self.results.put((task, work(task), onDone, onCancelled))
+        except TaskCancelled:
+            self.results.put((task, None, onCancelled, onCancelled))
+        except Exception as error:
+            if onError is None:
+                traceback.print_exc()
+            self.results.put((task, error, onError, onCancelled))
+
+    def poll(self):
+        try:
+            while True:
+                try:
+                    task, result, callback, onCancelled = self.results.get_nowait()
+                except queue.Empty:
+                    break
+
+                self.pending.remove(task)
+
+                # A task cancelled after its work had already finished is dropped like one cancelled half-way
+                if task.cancelled():
+                    callback, result = onCancelled, None
+
+                if callback is not None:
+                    callback(result)
+        finally:
+            if self.onProgress is not None:
+                self.onProgress(self.activeTask())
+
+            if self.pending:
+                self.schedule(taskPollMS, self.poll)
+            else:
+                self.polling = False
+
+    def activeTask(self):
+        for task in self.pending:
+            if not task.cancelled():
+                return task
+
+        return None
+
+    def cancel(self, kind=None, userRequest=False):
+        for task in self.pending:
+            if (kind is None or task.kind == kind) and (task.cancellable or not userRequest):
+                task.cancel()
+
+    def busy(self, kind=None):
+        return any(not task.cancelled() and (kind is None or task.kind == kind) for task in self.pending)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,461 @@
+import os
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+import ICCTEngine
+import ICCTTrace
+
+defaultMemoryBudgetMB = 256
+
+# Out-of-core processing of one image file (processImageTiled): strips are read from the input file, filtered in place
+# and written to the output file one after the other, so the peak memory follows the budget rather than the image.
+# Binary PPM / PGM and uncompressed BMP files are read strip by strip, PNG, BMP & PPM files are written strip by strip.
+# Other formats (JPEG, compressed PNG input, ...) can only be decoded / encoded whole, which is done when the whole
+# image fits in wholeImageShare of the budget and refused otherwise. Of the rest of the budget, half goes to the filter
+# strips and a quarter to the temporaries of the strip encoders
+wholeImageShare = 0.25
+encoderShare = 0.25
+encoderBytesPerByte = 24
+pngSignature = b'\x89PNG\r\n\x1a\n'
+signedMagnitude = np.minimum(np.arange(256), 256 - np.arange(256)).astype(np.uint8)
+
+# Worst case working set of one filter step per pixel of a strip: the BGRA input & output strips and the float32
+# BGR / HLS / HSL planes of the HSL domain modes (see ICCTColour.applyHSLFilter)
+workingBytesPerPixel = 4 + 4 + 5 * 3 * 4
+
+
+def stripRowsFor(imageWidth, memoryBudgetMB=defaultMemoryBudgetMB):
+    return max(1, int(memoryBudgetMB * 1024 * 1024) // (imageWidth * workingBytesPerPixel))
+
+
+def iterStrips(imageHeight, stripRows):
+    for top in range(0, imageHeight, stripRows):
+        yield top, min(top + stripRows, imageHeight)
+
+
+def applyFilterChainTiled(ImageIn, filterChain, ImageOut=None, memoryBudgetMB=defaultMemoryBudgetMB, progress=None):
+    # Every filter mode is a per-pixel operation, so the chain can run strip by strip without any overlap, each
+    # strip being filtered straight into its rows of ImageOut (and region steps only where the strip meets their
+    # region). progress(fraction) is called after every strip
+    if ImageOut is None:
+        ImageOut = np.empty_like(ImageIn)
+
+    compiledChain = ICCTEngine.compileFilterChain(filterChain)
+    imageHeight = ImageIn.shape[0]
+
+    with ICCTTrace.stage('filter'):
+        for top, bottom in iterStrips(imageHeight, stripRowsFor(ImageIn.shape[1], memoryBudgetMB)):
+            ICCTEngine.applyCompiledChain(ImageIn[top:bottom], compiledChain, ImageOut[top:bottom], (top, imageHeight))
+
+            if progress is not None:
+                progress(bottom / imageHeight)
+
+    return ImageOut
+
+
+# <| STRIP READERS |>
+# Every reader has shape (H, W, channels) and read(rows) returning the next rows as a BGR(A) uint8 array
+class WholeImageReader:
+    def __init__(self, ImageBGRA):
+        self.ImageBGRA = ImageBGRA
+        self.shape = ImageBGRA.shape
+        self.top = 0
+
+    def read(self, rows):
+        Strip = self.ImageBGRA[self.top:self.top + rows]
+        self.top += rows
+        return Strip
+
+    def close(self):
+        self.ImageBGRA = None
+
+
+class PNMStripReader:
+    # Binary PGM (P5) / PPM (P6) with 8 bit samples, the raster follows the header row by row from the top
+    def __init__(self, imageFile, rasterOffset, H, W, samples):
+        self.imageFile = imageFile
+        self.samples = samples
+        self.shape = (H, W, 3)
+
+        self.imageFile.seek(rasterOffset)
+
+    def read(self, rows):
+        H, W = self.shape[:2]
+        Raster = np.frombuffer(self.imageFile.read(rows * W * self.samples), dtype=np.uint8)
+
+        if Raster.size != rows * W * self.samples:
+            raise ValueError("Truncated image")
+
+        Raster = Raster.reshape((rows, W, self.samples))
+        return cv2.cvtColor(Raster, cv2.COLOR_GRAY2BGR if self.samples == 1 else cv2.COLOR_RGB2BGR)
+
+    def close(self):
+        self.imageFile.close()
+
+
+class BMPStripReader:
+    # Uncompressed 24 / 32 bit BMP, whose rows are stored bottom up (or top down for a negative height) and padded to
+    # 4 bytes
+    def __init__(self, imageFile, rasterOffset, H, W, channels, topDown):
+        self.imageFile = imageFile
+        self.rasterOffset = rasterOffset
+        self.topDown = topDown
+        self.shape = (H, W, channels)
+        self.rowBytes = (W * channels + 3) & ~3
+        self.top = 0
+
+    def read(self, rows):
+        H, W, channels = self.shape
+        firstRow = self.top if self.topDown else H - self.top - rows
+        self.top += rows
+
+        self.imageFile.seek(self.rasterOffset + firstRow * self.rowBytes)
+        Raster = np.frombuffer(self.imageFile.read(rows * self.rowBytes), dtype=np.uint8)
+
+        if Raster.size != rows * self.rowBytes:
+            raise ValueError("Truncated image")
+
+        Raster = Raster.reshape((rows, self.rowBytes))[:, :W * channels].reshape((rows, W, channels))
+        return (Raster if self.topDown else Raster[::-1]).copy()
+
+    def close(self):
+        self.imageFile.close()
+
+
+def readPNMHeader(imageFile):
+    # (magic, W, H, maxval, raster offset) of a binary PNM file, None if it is not one
+    magic = imageFile.read(2)
+    if magic not in (b'P5', b'P6'):
+        return None
+
+    values, token = [], b''
+    while len(values) < 3:
+        byte = imageFile.read(1)
+
+        if byte == b'#' and token == b'':
+            imageFile.readline()
+        elif byte.isdigit():
+            token += byte
+        elif byte.isspace() and token != b'':
+            values.append(int(token))
+            token = b''
+        elif byte == b'' or not byte.isspace():
+            return None
+
+    # A single whitespace byte (already read) separates the maxval from the raster
+    W, H, maxval = values
+    return magic, W, H, maxval, imageFile.tell()
+
+
+def readBMPHeader(imageFile):
+    # (W, H, bits per pixel, compression, masks, raster offset) of a BMP file, None if it is not one
+    fileHeader = imageFile.read(14)
+    if len(fileHeader) < 14 or fileHeader[:2] != b'BM':
+        return None
+
+    rasterOffset = struct.unpack('<I', fileHeader[10:14])[0]
+    infoHeader = imageFile.read(4)
+    infoSize = struct.unpack('<I', infoHeader)[0]
+    infoHeader += imageFile.read(infoSize - 4)
+
+    if infoSize < 40 or len(infoHeader) < infoSize:
+        return None
+
+    W, H, planes, bitsPerPixel, compression = struct.unpack('<iiHHI', infoHeader[4:20])
+    masks = struct.unpack('<4I', infoHeader[40:56]) if infoSize >= 56 else None
+
+    return W, H, bitsPerPixel, compression, masks, rasterOffset
+
+
+def decodedImageBytes(imagePath):
+    # Upper bound of the memory of the decoded image (from its header), None if the header cannot be read
+    with open(imagePath, 'rb') as imageFile:
+        header = imageFile.read(32)
+
+    if header[:8] == pngSignature and header[12:16] == b'IHDR':
+        W, H, bitDepth = struct.unpack('>IIB', header[16:25])
+        return H * W * 4 * (2 if bitDepth == 16 else 1)
+
+    if header[:2] == b'BM':
+        with open(imagePath, 'rb') as imageFile:
+            bmpHeader = readBMPHeader(imageFile)
+        return None if bmpHeader is None else abs(bmpHeader[1]) * bmpHeader[0] * 4
+
+    if header[:2] in (b'P5', b'P6'):
+        with open(imagePath, 'rb') as imageFile:
+            pnmHeader = readPNMHeader(imageFile)
+        return None if pnmHeader is None else pnmHeader[2] * pnmHeader[1] * 3 * (2 if pnmHeader[3] > 255 else 1)
+
+    shape = ICCTEngine.jpegSize(imagePath) if header[:2] == b'\xff\xd8' else None
+    return None if shape is None else shape[0] * shape[1] * 3
+
+
+def openStripReader(imagePath, budgetBytes):
+    imageFile = open(imagePath, 'rb')
+
+    try:
+        pnmHeader = readPNMHeader(imageFile)
+        if pnmHeader is not None and pnmHeader[3] == 255:
+            magic, W, H, maxval, rasterOffset = pnmHeader
+            return PNMStripReader(imageFile, rasterOffset, H, W, 1 if magic == b'P5' else 3)
+
+        imageFile.seek(0)
+        bmpHeader = readBMPHeader(imageFile)
+        if bmpHeader is not None:
+            W, H, bitsPerPixel, compression, masks, rasterOffset = bmpHeader
+            plainMasks = masks is not None and masks[:3] == (0xFF0000, 0xFF00, 0xFF)
+
+            if bitsPerPixel == 24 and compression == 0 or \
+                    bitsPerPixel == 32 and (compression == 0 or compression == 3 and plainMasks):
+                return BMPStripReader(imageFile, rasterOffset, abs(H), W, bitsPerPixel // 8, H < 0)
+    except Exception:
+        imageFile.close()
+        raise
+
+    imageFile.close()
+
+    decodedBytes = decodedImageBytes(imagePath)
+    if decodedBytes is None:
+        raise ValueError("Invalid Image: %s" % imagePath)
+    if decodedBytes > budgetBytes * wholeImageShare:
+        raise ValueError("%s can only be decoded whole (%d MB), which does not fit the memory budget: convert it to "
+                         "PPM or uncompressed BMP first" % (imagePath, decodedBytes // (1024 * 1024)))
+
+    return WholeImageReader(ICCTEngine.loadImage(imagePath))
+
+
+# <| STRIP WRITERS |>
+# Every writer takes the rows of the image from the top with write(Strip) and finishes the file with close(), abort()
+# drops a file that will not be finished
+class PNMStripWriter:
+    def __init__(self, imagePath, shape):
+        H, W, channels = shape
+        if channels != 3:
+            raise ValueError("PPM images have no alpha channel")
+
+        self.imageFile = open(imagePath, 'wb')
+        self.imageFile.write(b'P6\n%d %d\n255\n' % (W, H))
+
+    def write(self, Strip):
+        self.imageFile.write(cv2.cvtColor(Strip, cv2.COLOR_BGR2RGB).tobytes())
+
+    def close(self):
+        self.imageFile.close()
+
+    def abort(self):
+        self.imageFile.close()
+
+
+class BMPStripWriter:
+    # Bottom up rows like the BMP files of most encoders, every strip is written at its place from the end of the file.
+    # 32 bit images carry their alpha mask in a V5 header
+    def __init__(self, imagePath, shape):
+        H, W, channels = shape
+        self.shape = shape
+        self.rowBytes = (W * channels + 3) & ~3
+        self.top = 0
+
+        infoSize = 40 if channels == 3 else 124
+        self.rasterOffset = 14 + infoSize
+        rasterBytes = self.rowBytes * H
+
+        infoHeader = struct.pack('<IiiHHIIiiII', infoSize, W, H, 1, channels * 8, 0 if channels == 3 else 3,
+                                 rasterBytes, 2835, 2835, 0, 0)
+        if channels == 4:
+            infoHeader += struct.pack('<4I', 0xFF0000, 0xFF00, 0xFF, 0xFF000000) + b'BGRs' + bytes(124 - 60)
+
+        self.imageFile = open(imagePath, 'wb')
+        self.imageFile.write(b'BM' + struct.pack('<IHHI', self.rasterOffset + rasterBytes, 0, 0, self.rasterOffset))
+        self.imageFile.write(infoHeader)
+        self.imageFile.truncate(self.rasterOffset + rasterBytes)
+
+    def write(self, Strip):
+        H, W, channels = self.shape
+        rows = Strip.shape[0]
+
+        Raster = np.zeros((rows, self.rowBytes), dtype=np.uint8)
+        Raster[:, :W * channels] = Strip[::-1].reshape((rows, W * channels))
+
+        self.imageFile.seek(self.rasterOffset + (H - self.top - rows) * self.rowBytes)
+        self.imageFile.write(Raster.tobytes())
+        self.top += rows
+
+    def close(self):
+        self.imageFile.close()
+
+    def abort(self):
+        self.imageFile.close()
+
+
+def pngSettings(saveOptions=None):
+    # (zlib level, zlib strategy, row filter or None for the adaptive choice) matching ICCTEngine.encodeParams
+    pngCompression = (saveOptions or {}).get('pngCompression')
+    pngCompression = 1 if pngCompression is None else int(pngCompression)
+
+    if pngCompression == 0:
+        return 0, zlib.Z_DEFAULT_STRATEGY, 0
+    elif pngCompression == 1:
+        return 1, zlib.Z_RLE, 1
+    elif pngCompression <= 5:
+        return pngCompression, zlib.Z_RLE, None
+
+    return pngCompression, zlib.Z_FILTERED, None
+
+
+def pngFilterRows(Rows, PriorRows, bytesPerPixel, rowFilter):
+    # The five PNG row filters of Rows (rows x bytes) given the rows above them, the filter of every row being either
+    # rowFilter or the one whose output has the smallest sum of absolute (signed) values. The filters are modulo 256,
+    # i.e. plain uint8 arithmetic, only the Paeth distances need 16 bits
+    Left = np.zeros_like(Rows)
+    Left[:, bytesPerPixel:] = Rows[:, :-bytesPerPixel]
+
+    if rowFilter == 0:
+        return np.zeros(len(Rows), dtype=np.uint8), Rows
+    elif rowFilter == 1:
+        return np.ones(len(Rows), dtype=np.uint8), Rows - Left
+
+    UpLeft = np.zeros_like(PriorRows)
+    UpLeft[:, bytesPerPixel:] = PriorRows[:, :-bytesPerPixel]
+
+    Filtered = np.empty((5,) + Rows.shape, dtype=np.uint8)
+    Filtered[0] = Rows
+    np.subtract(Rows, Left, out=Filtered[1])
+    np.subtract(Rows, PriorRows, out=Filtered[2])
+    np.subtract(Rows, (Left >> 1) + (PriorRows >> 1) + (Left & PriorRows & 1), out=Filtered[3])
+
+    # Paeth: the distances of Left + Up - UpLeft to Left, Up & UpLeft
+    UpGradient = PriorRows.astype(np.int16) - UpLeft
+    LeftGradient = Left.astype(np.int16) - UpLeft
+    DistanceLeft, DistanceUp = np.abs(UpGradient), np.abs(LeftGradient)
+    DistanceUpLeft = np.abs(UpGradient + LeftGradient)
+    Paeth = np.where((DistanceLeft <= DistanceUp) & (DistanceLeft <= DistanceUpLeft), Left,
+                     np.where(DistanceUp <= DistanceUpLeft, PriorRows, UpLeft))
+    np.subtract(Rows, Paeth, out=Filtered[4])
+
+    Magnitudes = cv2.LUT(Filtered.reshape((-1, Rows.shape[1])), signedMagnitude)
+    rowFilters = cv2.reduce(Magnitudes, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).reshape((5, -1)).argmin(axis=0)
+    rowFilters = rowFilters.astype(np.uint8)
+    return rowFilters, Filtered[rowFilters, np.arange(len(Rows))]
+
+
+class PNGStripWriter:
+    # 8 bit RGB / RGBA PNG, every strip is filtered & deflated into IDAT chunks as it comes, in chunks of rows whose
+    # filter temporaries fit the encoder's share of the budget
+    def __init__(self, imagePath, shape, saveOptions, budgetBytes):
+        H, W, channels = shape
+        self.channels = channels
+        self.chunkRows = max(1, int(budgetBytes * encoderShare) // (W * channels * encoderBytesPerByte))
+
+        level, strategy, self.rowFilter = pngSettings(saveOptions)
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+        self.PriorRow = np.zeros((1, W * channels), dtype=np.uint8)
+
+        self.imageFile = open(imagePath, 'wb')
+        self.imageFile.write(pngSignature)
+        self.writeChunk(b'IHDR', struct.pack('>IIBBBBB', W, H, 8, 2 if channels == 3 else 6, 0, 0, 0))
+
+    def writeChunk(self, chunkType, data):
+        self.imageFile.write(struct.pack('>I', len(data)) + chunkType + data +
+                             struct.pack('>I', zlib.crc32(data, zlib.crc32(chunkType))))
+
+    def write(self, Strip):
+        Strip = cv2.cvtColor(Strip, cv2.COLOR_BGR2RGB if self.channels == 3 else cv2.COLOR_BGRA2RGBA)
+        Strip = Strip.reshape((Strip.shape[0], -1))
+
+        for top in range(0, Strip.shape[0], self.chunkRows):
+            Rows = Strip[top:top + self.chunkRows]
+            PriorRows = np.concatenate((self.PriorRow, Rows[:-1]))
+
+            rowFilters, Filtered = pngFilterRows(Rows, PriorRows, self.channels, self.rowFilter)
+            data = self.compressor.compress(np.column_stack((rowFilters, Filtered)).tobytes())
+            if data:
+                self.writeChunk(b'IDAT', data)
+
+            self.PriorRow = Rows[-1:].copy()
+
+    def close(self):
+        self.writeChunk(b'IDAT', self.compressor.flush())
+        self.writeChunk(b'IEND', b'')
+        self.imageFile.close()
+
+    def abort(self):
+        self.imageFile.close()
+
+
+class WholeImageWriter:
+    # Formats that can only be encoded whole (JPEG): the strips are gathered into one frame
+    def __init__(self, imagePath, shape, saveOptions):
+        self.imagePath = imagePath
+        self.saveOptions = saveOptions
+        self.ImageBGRA = np.empty(shape, dtype=np.uint8)
+        self.top = 0
+
+    def write(self, Strip):
+        self.ImageBGRA[self.top:self.top + Strip.shape[0]] = Strip
+        self.top += Strip.shape[0]
+
+    def close(self):
+        ICCTEngine.saveImage(self.imagePath, self.ImageBGRA, self.saveOptions)
+        self.ImageBGRA = None
+
+    def abort(self):
+        self.ImageBGRA = None
+
+
+def openStripWriter(imagePath, shape, saveOptions, budgetBytes):
+    extension = os.path.splitext(imagePath)[1].lower()
+
+    if extension == '.png':
+        return PNGStripWriter(imagePath, shape, saveOptions, budgetBytes)
+    elif extension == '.bmp':
+        return BMPStripWriter(imagePath, shape)
+    elif extension == '.ppm' and shape[2] == 3:
+        return PNMStripWriter(imagePath, shape)
+
+    imageBytes = shape[0] * shape[1] * shape[2]
+    if imageBytes > budgetBytes * wholeImageShare:
+        raise ValueError("%s files can only be encoded whole (%d MB), which does not fit the memory budget: write "
+                         "PNG, BMP or PPM instead" % (extension, imageBytes // (1024 * 1024)))
+
+    return WholeImageWriter(imagePath, shape, saveOptions)
+
+
+def processImageTiled(inputPath, outputPath, filterChain, memoryBudgetMB=defaultMemoryBudgetMB, saveOptions=None,
+                      progress=None):
+    # The image is read, filtered (in place, strip by strip) and written without ever being whole in memory, unless
+    # its formats require it (see above). A partly written output is removed when anything fails
+    budgetBytes = int(memoryBudgetMB * 1024 * 1024)
+
+    with ICCTTrace.stage('decode', 'open'):
+        reader = openStripReader(inputPath, budgetBytes)
+
+    try:
+        H, W = reader.shape[:2]
+        stripRows = stripRowsFor(W, memoryBudgetMB * (1 - wholeImageShare - encoderShare))
+        compiledChain = ICCTEngine.compileFilterChain(filterChain)
+
+        writer = openStripWriter(outputPath, reader.shape, saveOptions, budgetBytes)
+        try:
+            for top, bottom in iterStrips(H, stripRows):
+                with ICCTTrace.stage('decode'):
+                    Strip = reader.read(bottom - top)
+                with ICCTTrace.stage('filter'):
+                    ICCTEngine.applyCompiledChain(Strip, compiledChain, Strip, (top, H))
+                with ICCTTrace.stage('save'):
+                    writer.write(Strip)
+
+                if progress is not None:
+                    progress(bottom / H)
+
+            with ICCTTrace.stage('save'):
+                writer.close()
+        except BaseException:
+            writer.abort()
+            if os.path.exists(outputPath):
+                os.remove(outputPath)
+            raise
+    finally:
+        reader.close()
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Per-stage timing of a session. The engine, renderer & GUI wrap their work in stage(name) blocks, the tracer keeps the
+# last timing of every stage (for the on-screen readout) and a bounded log of all events, which can be exported as
+# plain JSON or as a Chrome trace (chrome://tracing, ui.perfetto.dev)
+maxTraceEvents = 100000
+readoutStages = ('decode', 'filter', 'convert', 'render', 'save')
+
+
+class StageTracer:
+    def __init__(self, enabled=True, maxEvents=maxTraceEvents):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.startedAt = time.time()
+
+        self.events = deque(maxlen=maxEvents)
+        self.lastTimings = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, detail=None):
+        if not self.enabled:
+            yield
+            return
+
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, startTime, time.perf_counter() - startTime, detail)
+
+    def record(self, name, startTime, duration, detail=None):
+        with self.lock:
+            self.events.append((name, detail, startTime - self.origin, duration, threading.get_ident()))
+            self.lastTimings[name] = duration
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.lastTimings.clear()
+
+    def readout(self, stages=readoutStages):
+        with self.lock:
+            lastTimings = dict(self.lastTimings)
+
+        return "   ".join("%s %s" % (name.capitalize(), "%.1f ms" % (lastTimings[name] * 1000)
+                                     if name in lastTimings else "---") for name in stages)
+
+    def summary(self):
+        # {stage: {count, total_ms, mean_ms, max_ms, last_ms}}
+        stats = {}
+
+        with self.lock:
+            for name, detail, startTime, duration, threadID in self.events:
+                entry = stats.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                entry['count'] += 1
+                entry['total_ms'] += duration * 1000
+                entry['max_ms'] = max(entry['max_ms'], duration * 1000)
+                entry['last_ms'] = duration * 1000
+
+        for entry in stats.values():
+            entry['mean_ms'] = entry['total_ms'] / entry['count']
+
+        return stats
+
+    def exportJSON(self, path):
+        with self.lock:
+            events = [{'stage': name, 'detail': detail, 'start_ms': startTime * 1000, 'duration_ms': duration * 1000,
+                       'thread': threadID} for name, detail, startTime, duration, threadID in self.events]
+
+        with open(path, 'w') as traceFile:
+            json.dump({'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.startedAt)),
+                       'summary': self.summary(),
+                       'events': events}, traceFile, indent=2)
+
+    def exportChromeTrace(self, path):
+        # Complete ('X') events in microseconds, nested stages show up as nested slices
+        processID = os.getpid()
+
+        with self.lock:
+            traceEvents = [{'name': name if detail is None else "%s %s" % (name, detail), 'cat': name, 'ph': 'X',
+                            'ts': startTime * 1e6, 'dur': duration * 1e6, 'pid': processID, 'tid': threadID}
+                           for name, detail, startTime, duration, threadID in self.events]
+
+        with open(path, 'w') as traceFile:
+            json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, traceFile)
+
+    def exportTrace(self, path):
+        if path.lower().endswith('.trace.json') or path.lower().endswith('.trace'):
+            self.exportChromeTrace(path)
+        else:
+            self.exportJSON(path)
+
+
+sessionTracer = StageTracer()
+
+
+def stage(name, detail=None):
+    return sessionTracer.stage(name, detail)
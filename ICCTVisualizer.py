@@ -0,0 +1,108 @@
+import numpy as np
+from mpl_toolkits import mplot3d
+from matplotlib import cm
+
+import ICCTEngine
+
+
+class VisualizerData:
+    # The data behind the plots, computed on demand and cached. It needs no figure, so it can be prepared on a worker
+    # thread before the plots are drawn
+    def __init__(self, ImageBGRA):
+        self.ImageBGRA = ImageBGRA
+        self.ImageDecimated = {}
+        self.histograms = None
+        self.jointDensities = {}
+
+    def decimatedImage(self, detail):
+        # The surfaces & maps are drawn from a copy of the image reduced to the number of vertices of the selected
+        # level of detail, never from the full resolution image
+        if detail not in self.ImageDecimated:
+            self.ImageDecimated[detail] = ICCTEngine.decimateImage(self.ImageBGRA, visualizerDetailLevels[detail])
+
+        return self.ImageDecimated[detail]
+
+    def channelHistograms(self):
+        if self.histograms is None:
+            self.histograms = ICCTEngine.channelHistograms(self.ImageBGRA)
+
+        return self.histograms
+
+    def jointDensity(self, channelX, channelY):
+        if (channelX, channelY) not in self.jointDensities:
+            self.jointDensities[channelX, channelY] = ICCTEngine.jointHistogram(self.ImageBGRA, channelX, channelY)
+
+        return self.jointDensities[channelX, channelY]
+
+    def prepare(self, view, detail='Medium'):
+        if view == 'Surfaces':
+            self.decimatedImage(detail)
+        elif view == 'Histograms':
+            self.channelHistograms()
+        else:
+            for (channelX, labelX), (channelY, labelY) in visualizerChannelPairs:
+                self.jointDensity(channelX, channelY)
+
+
+class VisualizerFigure:
+    # The plots of the visualizer drawn on any matplotlib Figure, so they can be built without a Tk window
+    def __init__(self, figure, ImageBGRA):
+        # ImageBGRA may also be an already (partly) prepared VisualizerData
+        self.imgFig = figure
+        self.data = ImageBGRA if isinstance(ImageBGRA, VisualizerData) else VisualizerData(ImageBGRA)
+
+    def plotView(self, view, detail='Medium'):
+        self.imgFig.clear()
+        visualizerViews[view](self, detail)
+
+    def plotSurfaces(self, detail):
+        imgData = self.data.decimatedImage(detail)
+        imageRes = np.shape(imgData)
+
+        X = np.arange(imageRes[1])
+        Y = np.arange(imageRes[0])[::-1]
+
+        X, Y = np.meshgrid(X, Y)
+
+        for index, (channel, label, mapColour) in enumerate(visualizerChannels):
+            channelData = imgData[:, :, channel].astype(np.float32)
+
+            channelPlot = self.imgFig.add_subplot(2, 3, index + 1, projection='3d')
+            channelPlot.plot_surface(X, Y, channelData, cmap=cm.coolwarm, rcount=imageRes[0], ccount=imageRes[1])
+            channelPlot.set_zlim(0, 256)
+            channelPlot.set_zlabel(label)
+
+            channelMap = self.imgFig.add_subplot(2, 3, index + 4)
+            channelMap.imshow(channelData, cmap=mapColour, interpolation=None)
+
+    def plotHistograms(self, detail):
+        histogramPlot = self.imgFig.add_subplot()
+
+        for histogram, (channel, label, mapColour) in zip(self.data.channelHistograms(),
+                                                         visualizerChannels):
+            colour = mapColour[:-1].lower()
+            histogramPlot.fill_between(np.arange(256), histogram, step='mid', color=colour, alpha=0.25)
+            histogramPlot.step(np.arange(256), histogram, where='mid', color=colour, label=label)
+
+        histogramPlot.set_xlim(0, 255)
+        histogramPlot.set_xlabel("Value")
+        histogramPlot.set_ylabel("Pixels")
+        histogramPlot.legend()
+
+    def plotJointDensity(self, detail):
+        for index, ((channelX, labelX), (channelY, labelY)) in enumerate(visualizerChannelPairs):
+            densityPlot = self.imgFig.add_subplot(1, 3, index + 1)
+            density = self.data.jointDensity(channelX, channelY)
+
+            densityPlot.imshow(np.log1p(density), cmap='inferno', origin='lower', extent=(0, 256, 0, 256))
+            densityPlot.set_xlabel(labelX)
+            densityPlot.set_ylabel(labelY)
+
+
+# Channels as (BGRA index, label, colour map)
+visualizerChannels = [(2, "R", 'Reds'), (1, "G", 'Greens'), (0, "B", 'Blues')]
+visualizerChannelPairs = [((2, "R"), (1, "G")), ((1, "G"), (0, "B")), ((0, "B"), (2, "R"))]
+visualizerViews = {'Surfaces': VisualizerFigure.plotSurfaces,
+                   'Histograms': VisualizerFigure.plotHistograms,
+                   'Joint Density': VisualizerFigure.plotJointDensity}
+visualizerDetailLevels = {'Low': 64 * 64, 'Medium': 128 * 128, 'High': 256 * 256}
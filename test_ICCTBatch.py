@@ -0,0 +1,22 @@
+import cv2
+import numpy as np
+
+import ICCTBatch
+import ICCTEngine
+
+
+def test_changed_settings_reprocess(tmp_path):
+    inputPath = str(tmp_path / 'image.png')
+    cv2.imwrite(inputPath, np.full((8, 8, 3), 100, dtype=np.uint8))
+    outputDir = str(tmp_path / 'out')
+
+    def run(filterSteps, saveOptions=None):
+        filterChain = [ICCTEngine.parseFilterStep(filterStep) for filterStep in filterSteps]
+        return ICCTBatch.runBatch([inputPath], outputDir, filterChain, workers=1, saveOptions=saveOptions,
+                                  log=lambda message: None)
+
+    assert run(['Inverse:255']) == (1, 0, 0)
+    assert run(['Inverse:255']) == (0, 1, 0)
+    assert run(['Greyscale']) == (1, 0, 0)
+    assert run(['Greyscale'], ICCTEngine.savePresets['Small']) == (1, 0, 0)
+    assert run(['Greyscale'], ICCTEngine.savePresets['Small']) == (0, 1, 0)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import ICCTEngine
+import ICCTParallel
+import ICCTTiled
+
+regionSteps = (ICCTEngine.makeFilterStep('CEILING', 100, 50, 20), ICCTEngine.makeSpecificStep([(10, 20, 30)], 5),
+               ICCTEngine.makeFilterStep('ADJUST', 10, 0, 0))
+
+
+def referenceRegionChain(ImageBGRA, filterSteps, region):
+    # Every step filters the whole image, the pixels of the region are then taken from the result
+    H, W = ImageBGRA.shape[:2]
+    ImageFiltered = ICCTEngine.applyFilterChainStepwise(ImageBGRA, filterSteps)
+    mask = ICCTEngine.regionMask(region, H, W, 0, 0, W, H)
+    mask = np.zeros((H, W), dtype=bool) if mask is None else mask
+
+    if region[0] == 'RECT':
+        x0, y0, x1, y1 = ICCTEngine.regionBounds(region, H, W)
+        mask[y0:y1, x0:x1] = True
+
+    ImageOut = ImageBGRA.copy()
+    np.copyto(ImageOut, ImageFiltered, where=mask[:, :, None])
+    return ImageOut
+
+
+def applyParallel(ImageBGRA, filterChain):
+    # Below minParallelPixels the parallel path falls back to the tiled one
+    minParallelPixels = ICCTParallel.minParallelPixels
+    ICCTParallel.minParallelPixels = 0
+    try:
+        return ICCTParallel.applyFilterChainParallel(ImageBGRA, filterChain, workers=2)
+    finally:
+        ICCTParallel.minParallelPixels = minParallelPixels
+
+
+@pytest.mark.parametrize('channels', (3, 4))
+@pytest.mark.parametrize('imageShape', ((1, 1), (9, 1), (9, 7)))
+@pytest.mark.parametrize('region', (ICCTEngine.makeRegion('RECT', (0.5, 0.5, 0.51, 0.51)),
+                                    ICCTEngine.makeRegion('LASSO', (0.45, 0.45, 0.55, 0.45, 0.5, 0.55))))
+def test_single_pixel_region(channels, imageShape, region):
+    # A small region covers a single pixel (or none) of a small image, e.g. of the preview proxy
+    ImageBGRA = np.random.default_rng(0).integers(0, 256, imageShape + (channels,), dtype=np.uint8)
+    ImageBGRA[:, :, :3] = (30, 20, 10)
+    filterChain = [ICCTEngine.limitStepToRegion(filterStep, region) for filterStep in regionSteps]
+    expected = referenceRegionChain(ImageBGRA, regionSteps, region)
+
+    assert np.array_equal(ICCTEngine.applyFilterChain(ImageBGRA, filterChain), expected)
+    assert np.array_equal(ICCTTiled.applyFilterChainTiled(ImageBGRA, filterChain, memoryBudgetMB=1e-6), expected)
+    assert np.array_equal(applyParallel(ImageBGRA, filterChain), expected)
+
+
+@pytest.mark.parametrize('mode', ICCTEngine.pointModes + ICCTEngine.thresholdModes)
+def test_compiled_matches_stepwise_over_parameter_range(mode):
+    # Every channel value, every amount the GUI, the batch CLI or the server can send (and beyond)
+    ImageBGRA = np.stack(list(np.meshgrid(np.arange(256), np.arange(256), indexing='ij')) + [np.full((256, 256), 7)],
+                         axis=2).astype(np.uint8)
+    amounts = range(-600, 601, 23)
+
+    for value in amounts:
+        for filterChain in ([ICCTEngine.makeFilterStep(mode, value, value // 2, -value)],
+                            [ICCTEngine.makeFilterStep(mode, value, 40, 200), ICCTEngine.makeFilterStep('ADJUST', 5)]):
+            assert np.array_equal(ICCTEngine.applyFilterChain(ImageBGRA, filterChain),
+                                  ICCTEngine.applyFilterChainStepwise(ImageBGRA, filterChain)), (mode, value)
+
+
+@pytest.mark.parametrize('channels', (3, 4))
+def test_in_place_matches_new_frame(channels):
+    ImageBGRA = np.random.default_rng(1).integers(0, 256, (40, 30, channels), dtype=np.uint8)
+    region = ICCTEngine.makeRegion('LASSO', (0.1, 0.1, 0.9, 0.2, 0.4, 0.8))
+
+    for mode in ICCTEngine.filterModes:
+        for filterChain in ([ICCTEngine.makeFilterStep(mode, 60, 20, 200)],
+                            [ICCTEngine.limitStepToRegion(ICCTEngine.makeFilterStep(mode, 60, 20, 200), region),
+                             ICCTEngine.makeFilterStep('ADJUST', 10, 5)]):
+            expected = ICCTEngine.applyFilterChain(ImageBGRA, filterChain)
+            ImageInPlace = ImageBGRA.copy()
+
+            assert ICCTEngine.applyFilterChain(ImageInPlace, filterChain, ImageInPlace) is ImageInPlace
+            assert np.array_equal(ImageInPlace, expected), mode
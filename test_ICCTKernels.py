@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+import ICCTEngine
+
+
+@pytest.mark.parametrize('channels', (3, 4))
+@pytest.mark.parametrize('filterStep', (ICCTEngine.makeFilterStep('CEILING', 100, 50, 20),
+                                        ICCTEngine.makeFilterStep('FLOOR', 100, 50, 20),
+                                        ICCTEngine.makeSpecificStep([(10, 20, 30)], 5),
+                                        ('ADJUST', (10, 0, 0)), ('CEILING', (100, 50, 20))))
+def test_single_pixel_matches_larger_image(channels, filterStep):
+    # A 1x1 image must filter like the same pixel in a larger image
+    for BGRA in ((30, 20, 10, 200), (200, 100, 40, 200)):
+        ImagePixel = np.array(BGRA[:channels], dtype=np.uint8).reshape((1, 1, channels))
+        ImageLarge = np.tile(ImagePixel, (2, 2, 1))
+
+        expected = ICCTEngine.applyFilterChain(ImageLarge, [filterStep])[:1, :1]
+
+        assert np.array_equal(ICCTEngine.applyFilterChain(ImagePixel, [filterStep]), expected)
+        assert np.array_equal(ICCTEngine.applyFilterStep(ImagePixel, filterStep), expected)
@@ -0,0 +1,48 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import ICCTServer
+
+
+@pytest.fixture
+def serverAddress():
+    service = ICCTServer.ProcessingService(workers=1)
+    server = ICCTServer.ServiceHTTPServer(('127.0.0.1', 0), service, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server.server_address
+
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+@pytest.mark.parametrize('contentLength', ('abc', '-1', '1.5', ''))
+def test_invalid_content_length(serverAddress, contentLength):
+    connection = http.client.HTTPConnection(*serverAddress, timeout=10)
+    connection.putrequest('POST', '/process?filter=Inverse')
+    connection.putheader('Content-Length', contentLength)
+    connection.endheaders()
+
+    response = connection.getresponse()
+
+    assert response.status == 400
+    assert json.loads(response.read()) == {'error': "Invalid Content-Length"}
+    connection.close()
+
+
+@pytest.mark.parametrize('filters', ([5], [None], ['Inverse:255', ['Greyscale']], {'mode': 'Inverse'}, 5))
+def test_invalid_json_filters(serverAddress, filters):
+    connection = http.client.HTTPConnection(*serverAddress, timeout=10)
+    connection.request('POST', '/process', json.dumps({'path': 'image.png', 'filters': filters}),
+                       {'Content-Type': 'application/json'})
+
+    response = connection.getresponse()
+
+    assert response.status == 400
+    assert 'error' in json.loads(response.read())
+    connection.close()
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+import ICCTEngine
+import ICCTStats
+
+
+@pytest.mark.parametrize('mode', ICCTEngine.pointModes)
+def test_derived_statistics_match_counted(mode):
+    ImageBGRA = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+
+    for value in range(-600, 601, 37):
+        filterChain = (ICCTEngine.makeFilterStep(mode, value, value // 2, -value),)
+        statsCache = ICCTStats.ChainStatsCache()
+        statsCache.statsFor((), ImageBGRA)
+
+        derived = statsCache.cachedStats(filterChain, ImageBGRA.shape)
+        counted = ICCTStats.ImageStats.fromImage(ICCTEngine.applyFilterChainStepwise(ImageBGRA, filterChain))
+
+        assert np.array_equal(derived.histograms, counted.histograms), (mode, value)
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+import ICCTEngine
+import ICCTTiled
+
+filterChain = [ICCTEngine.makeFilterStep('ADJUST', 20, 10, 0),
+               ICCTEngine.limitStepToRegion(ICCTEngine.makeFilterStep('INVERSE', 255),
+                                            ICCTEngine.makeRegion('LASSO', (0.1, 0.1, 0.9, 0.3, 0.4, 0.9)))]
+
+
+def gradientImage(shape, channels):
+    # Smooth gradients with noise, so every PNG row filter gets chosen
+    rng = np.random.default_rng(2)
+    Y, X = np.mgrid[:shape[0], :shape[1]]
+    ImageBGRA = np.stack([(X * 3 + Y) % 256] * channels, axis=2) + rng.integers(0, 12, shape + (channels,))
+    return ImageBGRA.astype(np.uint8)
+
+
+@pytest.mark.parametrize('channels', (3, 4))
+@pytest.mark.parametrize('outputExt, saveOptions', (('.png', None), ('.png', {'pngCompression': 0}),
+                                                    ('.png', {'pngCompression': 4}), ('.png', {'pngCompression': 9}),
+                                                    ('.bmp', None), ('.ppm', None), ('.jpg', None)))
+@pytest.mark.parametrize('inputExt', ('.ppm', '.pgm', '.bmp', '.png'))
+def test_round_trip(tmp_path, inputExt, outputExt, saveOptions, channels):
+    if channels == 4 and (inputExt in ('.ppm', '.pgm') or outputExt in ('.ppm', '.jpg')):
+        pytest.skip("no alpha channel in the format")
+
+    inputPath, outputPath = str(tmp_path / ('in' + inputExt)), str(tmp_path / ('out' + outputExt))
+    ImageBGRA = gradientImage((37, 23), channels)
+    cv2.imwrite(inputPath, ImageBGRA[:, :, 0] if inputExt == '.pgm' else ImageBGRA)
+    expected = ICCTEngine.applyFilterChain(ICCTEngine.loadImage(inputPath), filterChain)
+
+    # A budget of a few rows, so the image goes through many strips and PNG row chunks
+    ICCTTiled.processImageTiled(inputPath, outputPath, filterChain, memoryBudgetMB=0.05, saveOptions=saveOptions)
+    ImageOut = ICCTEngine.loadImage(outputPath)
+
+    if outputExt == '.jpg':
+        assert ImageOut.shape == expected.shape
+    else:
+        assert np.array_equal(ImageOut, expected)
+
+
+@pytest.mark.parametrize('inputExt, outputExt', (('.png', '.png'), ('.jpg', '.png'), ('.ppm', '.jpg')))
+def test_whole_image_over_budget_refused(tmp_path, inputExt, outputExt):
+    inputPath, outputPath = str(tmp_path / ('in' + inputExt)), str(tmp_path / ('out' + outputExt))
+    cv2.imwrite(inputPath, gradientImage((300, 300), 3))
+
+    with pytest.raises(ValueError, match="memory budget"):
+        ICCTTiled.processImageTiled(inputPath, outputPath, filterChain, memoryBudgetMB=0.5)
+
+    assert not os.path.exists(outputPath)
+
+
+peakMemoryScript = '''
+import sys
+import numpy as np
+import ICCTEngine
+import ICCTTiled
+
+def peakKB():
+    with open('/proc/self/status') as status:
+        return int(next(line for line in status if line.startswith('VmHWM:')).split()[1])
+
+inputPath, outputPath, budgetMB = sys.argv[1], sys.argv[2], float(sys.argv[3])
+H, W = 4000, 6000
+with open(inputPath, 'wb') as imageFile:
+    imageFile.write(b'P6\\n%d %d\\n255\\n' % (W, H))
+    Rows = np.random.default_rng(3).integers(0, 64, (100, W, 3), dtype=np.uint8) + np.arange(W)[:, None] // 40
+    Rows = Rows.astype(np.uint8).tobytes()
+    for top in range(0, H, 100):
+        imageFile.write(Rows)
+
+filterChain = [ICCTEngine.makeFilterStep('HUE', 30), ICCTEngine.makeFilterStep('ADJUST', 20, 10)]
+before = peakKB()
+ICCTTiled.processImageTiled(inputPath, outputPath, filterChain, budgetMB, {'pngCompression': int(sys.argv[4])})
+print(before, peakKB())
+'''
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason="needs /proc/self/status")
+@pytest.mark.parametrize('pngCompression', (1, 6))
+def test_peak_memory_within_budget(tmp_path, pngCompression):
+    # A 6000 x 4000 PPM (72 MB decoded) through a 16 MB budget in a fresh process: the peak RSS may only grow by
+    # about the budget, where decoding it whole would add 72 MB
+    budgetMB = 16
+    inputPath, outputPath = str(tmp_path / 'in.ppm'), str(tmp_path / 'out.png')
+    result = subprocess.run([sys.executable, '-c', peakMemoryScript, inputPath, outputPath, str(budgetMB),
+                             str(pngCompression)],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    before, after = map(int, result.stdout.split())
+
+    assert (after - before) / 1024 < budgetMB * 1.5
+    assert cv2.imread(outputPath).shape == (4000, 6000, 3)